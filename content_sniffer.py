@@ -0,0 +1,165 @@
+import json
+import logging
+import mmap
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (offset, magic bytes, category, strong). Strong signatures are specific
+# enough to override the category implied by a file's suffix; weak ones
+# (containers shared by several formats) only fill in files whose suffix
+# told us nothing. Plain text is not classified: source code, logs, CSV
+# and config files all look alike from their first bytes.
+SIGNATURES = [
+    (0, b'\xff\xd8\xff', 'image', True),
+    (0, b'\x89PNG\r\n\x1a\n', 'image', True),
+    (0, b'GIF87a', 'image', True),
+    (0, b'GIF89a', 'image', True),
+    (0, b'II*\x00', 'image', True),
+    (0, b'MM\x00*', 'image', True),
+    (0, b'BM', 'image', False),
+    (0, b'\x1aE\xdf\xa3', 'video', True),  # Matroska / WebM
+    (0, b'FLV\x01', 'video', True),
+    (0, b'0&\xb2u\x8ef\xcf\x11', 'video', True),  # ASF / WMV
+    (0, b'ID3', 'audio', True),
+    (0, b'fLaC', 'audio', True),
+    (0, b'OggS', 'audio', True),
+    (0, b'%PDF', 'document', True),
+    (0, b'{\\rtf', 'document', True),
+    (0, b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'document', False),  # OLE: doc/xls/ppt/msi
+    (0, b'Rar!\x1a\x07', 'archive', True),
+    (0, b"7z\xbc\xaf'\x1c", 'archive', True),
+    (0, b'\x1f\x8b', 'archive', True),
+    (257, b'ustar', 'archive', True),
+    (0, b'MZ', 'application', True),
+    (0, b'\x7fELF', 'application', True),
+    (0, b'\xcf\xfa\xed\xfe', 'application', True),
+    (0, b'\xce\xfa\xed\xfe', 'application', True),
+    (0, b'L\x00\x00\x00\x01\x14\x02\x00', 'shortcut', True),
+    (0, b'[InternetShortcut]', 'shortcut', True),
+]
+
+# ISO base media brands that hold audio only, and HEIF/AVIF still images
+AUDIO_BRANDS = (b'M4A ', b'M4B ', b'M4P ')
+IMAGE_BRANDS = (b'heic', b'heix', b'heim', b'heis', b'hevc', b'hevx', b'mif1', b'msf1', b'avif', b'avis')
+
+def sniff_bytes(head: bytes) -> Optional[Tuple[str, bool]]:
+    """Identify a category from the first bytes of a file.
+
+    Returns (category, strong) or None if nothing matched.
+    """
+    if not head:
+        return None
+
+    # Formats that need a look past the first magic bytes
+    if head[:4] == b'RIFF' and len(head) >= 12:
+        kind = head[8:12]
+        if kind == b'WEBP':
+            return 'image', True
+        if kind == b'WAVE':
+            return 'audio', True
+        if kind == b'AVI ':
+            return 'video', True
+    if head[4:8] == b'ftyp':
+        brand = head[8:12]
+        if brand in AUDIO_BRANDS:
+            return 'audio', True
+        if brand in IMAGE_BRANDS:
+            return 'image', True
+        return 'video', True
+    if head[:4] == b'PK\x03\x04':
+        if b'[Content_Types].xml' in head or b'application/vnd.oasis.opendocument' in head:
+            return 'document', False
+        return 'archive', False
+    if len(head) > 1 and head[0] == 0xff and head[1] & 0xe0 == 0xe0:
+        return 'audio', False  # MPEG audio frame sync
+
+    for offset, magic, category, strong in SIGNATURES:
+        if head.startswith(magic, offset):
+            return category, strong
+    return None
+
+class ContentSniffer:
+    """Classify files by magic bytes, reading only the first few KB of each.
+
+    Heads are read through a read-only memory map and classified in a
+    thread pool. Results are cached by file identity (device, inode, size,
+    mtime), optionally persisted to cache_file, so rescans skip unchanged
+    files entirely.
+    """
+
+    def __init__(self, head_size: int = 4096, max_workers: int = None, cache_file: Path = None,
+                 max_cache_entries: int = 500000):
+        self.head_size = head_size
+        self.max_cache_entries = max_cache_entries
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) * 4)
+        self.cache_file = cache_file
+        self.cache: Dict[str, Optional[list]] = {}
+        self.lock = threading.Lock()
+        self.dirty = False
+        if cache_file:
+            self.load_cache()
+
+    def load_cache(self):
+        try:
+            if self.cache_file.exists():
+                with open(self.cache_file, 'r') as f:
+                    self.cache = json.load(f)
+        except Exception as e:
+            logger.warning(f"Could not load sniff cache: {e}")
+            self.cache = {}
+
+    def save_cache(self):
+        if not self.cache_file or not self.dirty:
+            return
+        try:
+            with self.lock:
+                # Keep the most recently added entries; old identities are stale anyway
+                overflow = len(self.cache) - self.max_cache_entries
+                if overflow > 0:
+                    for key in list(self.cache)[:overflow]:
+                        del self.cache[key]
+                data = json.dumps(self.cache)
+                self.dirty = False
+            with open(self.cache_file, 'w') as f:
+                f.write(data)
+        except Exception as e:
+            logger.warning(f"Could not save sniff cache: {e}")
+
+    def read_head(self, path: str) -> bytes:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return b''
+            with mmap.mmap(f.fileno(), min(size, self.head_size), access=mmap.ACCESS_READ) as view:
+                return view[:]
+
+    def sniff(self, path: str) -> Optional[Tuple[str, bool]]:
+        """Classify one file, using the cache when its identity is unchanged"""
+        try:
+            st = os.stat(path)
+            key = f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+            with self.lock:
+                if key in self.cache:
+                    cached = self.cache[key]
+                    return tuple(cached) if cached else None
+            result = sniff_bytes(self.read_head(path))
+            with self.lock:
+                self.cache[key] = list(result) if result else None
+                self.dirty = True
+            return result
+        except (OSError, ValueError) as e:
+            logger.debug(f"Could not sniff {path}: {e}")
+            return None
+
+    def sniff_many(self, paths: Iterable[str]) -> Dict[str, Optional[Tuple[str, bool]]]:
+        """Classify many files concurrently; returns {path: (category, strong) or None}"""
+        paths = list(paths)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            results = dict(zip(paths, pool.map(self.sniff, paths)))
+        self.save_cache()
+        return results
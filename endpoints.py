@@ -0,0 +1,100 @@
+import json
+import logging
+import os
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+from openai import OpenAI
+from request_scheduler import get_scheduler
+
+logger = logging.getLogger(__name__)
+
+class LatencyStats:
+    """Rolling window of successful request latencies for one endpoint/model"""
+
+    def __init__(self, window: int = 50):
+        self.samples = deque(maxlen=window)
+        self.failures = 0
+        self.lock = threading.Lock()
+
+    def record(self, latency: float):
+        with self.lock:
+            self.samples.append(latency)
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+
+    def percentile(self, q: float, min_samples: int = 5) -> Optional[float]:
+        """Latency at quantile q (0-1), or None until enough samples are collected"""
+        with self.lock:
+            if len(self.samples) < min_samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def summary(self) -> Dict:
+        return {
+            'samples': len(self.samples),
+            'failures': self.failures,
+            'p50': self.percentile(0.5, 1),
+            'p95': self.percentile(0.95, 1)
+        }
+
+# Stats outlive individual AIOrganizer instances so hedge delays keep improving
+_stats: Dict[tuple, LatencyStats] = {}
+_stats_lock = threading.Lock()
+
+def get_stats(base_url: str, model: str) -> LatencyStats:
+    key = ((base_url or '').rstrip('/'), model)
+    with _stats_lock:
+        if key not in _stats:
+            _stats[key] = LatencyStats()
+        return _stats[key]
+
+def all_stats() -> Dict[str, Dict]:
+    """Latency summary per endpoint/model, for tuning hedge delays"""
+    with _stats_lock:
+        items = list(_stats.items())
+    return {f"{url} [{model}]": stats.summary() for (url, model), stats in items}
+
+class Endpoint:
+    """One OpenAI-compatible endpoint/model pair with its own scheduler and stats"""
+
+    def __init__(self, base_url: str, api_key: str, model: str):
+        self.base_url = base_url
+        self.model = model
+        # Retries are handled by the shared scheduler so it can see 429s
+        self.client = OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+        self.scheduler = get_scheduler(base_url)
+        self.stats = get_stats(base_url, model)
+
+    def __repr__(self) -> str:
+        return f"Endpoint({self.base_url!r}, {self.model!r})"
+
+def load_endpoints(model: str = None) -> List[Endpoint]:
+    """Build the endpoint list from the environment.
+
+    The primary endpoint comes from API_KEY/ENDPOINT/MODEL_NAME (model
+    overrides MODEL_NAME). EXTRA_ENDPOINTS may hold a JSON list of
+    {"endpoint", "api_key", "model"} objects used as hedging backups; a
+    missing api_key or model falls back to the primary's.
+    """
+    api_key = os.getenv('API_KEY')
+    model = model or os.getenv('MODEL_NAME')
+    endpoints = [Endpoint(os.getenv('ENDPOINT'), api_key, model)]
+
+    extra = os.getenv('EXTRA_ENDPOINTS')
+    if extra:
+        try:
+            for entry in json.loads(extra):
+                if not isinstance(entry, dict) or not entry.get('endpoint'):
+                    continue
+                endpoints.append(Endpoint(
+                    entry['endpoint'],
+                    entry.get('api_key') or api_key,
+                    entry.get('model') or model
+                ))
+        except (json.JSONDecodeError, TypeError) as e:
+            logger.error(f"Invalid EXTRA_ENDPOINTS setting: {str(e)}")
+    return endpoints
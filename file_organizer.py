@@ -1,11 +1,30 @@
 import json
+import multiprocessing
 import os
-import shutil
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from concurrent.futures import TimeoutError as FutureTimeout
 from pathlib import Path
 from typing import Dict, List
 import logging
-from openai import OpenAI
 from dotenv import load_dotenv
+from content_sniffer import ContentSniffer
+from metadata_extractor import MetadataExtractor
+from move_executor import MoveExecutor
+from plan import DONE, FAILED, SKIPPED, Plan, PlanWriter, iter_plan_file, read_plan_header, suggestion_moves
+from progress import OperationCancelled, ProgressTracker, describe
+from endpoints import Endpoint, load_endpoints
+from local_classifier import get_classifier
+from request_scheduler import PRIORITY_INTERACTIVE, estimate_tokens
+from single_flight import SingleFlight, request_key
+from staging import ShadowStage, StagingError
+from ignore_rules import IgnoreMatcher
+from structured_output import CLEANED, DIRECT, FAILED as PARSE_FAILED, MODES, PLAIN, get_reply_stats, response_format
+from preflight import count_tokens, describe_estimate, estimate_run
 
 # Load environment variables
 load_dotenv()
@@ -14,9 +33,66 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class FileRecord:
+    """Compact scan record for a single file or folder.
+
+    Uses slots and interned type/category strings so large scans stay small
+    in memory compared to one dict per file.
+    """
+    __slots__ = ('path', 'type', 'category', 'is_folder', 'meta')
+
+    def __init__(self, path: str, type: str, category: str, is_folder: bool = False, meta: Dict = None):
+        self.path = path
+        self.type = sys.intern(type)
+        self.category = sys.intern(category)
+        self.is_folder = is_folder
+        self.meta = meta  # Optional metadata (date, artist, ...) from MetadataExtractor
+
+    def to_dict(self) -> Dict:
+        data = {
+            "path": self.path,
+            "type": self.type,
+            "category": self.category,
+            "is_folder": self.is_folder
+        }
+        if self.meta:
+            data["meta"] = self.meta
+        return data
+
+    def features(self) -> Dict:
+        """Compact metadata features for prompts (month-level dates, tags)"""
+        if not self.meta:
+            return {}
+        features = {}
+        date = self.meta.get('date')
+        if date:
+            key = 'modified' if self.meta.get('date_source') == 'mtime' else 'date'
+            features[key] = date[:7]
+        for key in ('artist', 'album', 'author'):
+            if self.meta.get(key):
+                features[key] = self.meta[key]
+        return features
+
+    def __repr__(self) -> str:
+        return f"FileRecord({self.path!r}, {self.type!r}, {self.category!r}, {self.is_folder!r})"
+
 class FileScanner:
-    def __init__(self, base_path: Path):
+    def __init__(self, base_path: Path, sniff_content: bool = None, extract_metadata: bool = None):
         self.base_path = base_path
+        # Detect categories from file contents as well as suffixes
+        if sniff_content is None:
+            sniff_content = bool(os.getenv('SNIFF_CONTENT'))
+        self.sniff_content = sniff_content
+        # Read capture dates, audio tags and document properties
+        if extract_metadata is None:
+            extract_metadata = bool(os.getenv('EXTRACT_METADATA'))
+        self.extract_metadata = extract_metadata
+        # Processes used to walk top-level folders in parallel (recursive scans)
+        self.shard_workers = int(os.getenv('SHARD_WORKERS', '1'))
+        # gitignore-style exclusions (defaults plus .organizerignore files); None disables them
+        self.ignore_patterns = None
+        self.use_ignore = not os.getenv('NO_IGNORE')
+        self.ignore = None  # Matcher of the current scan, with its counters
         self.file_types = {
             'image': ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'],
             'video': ['.mp4', '.avi', '.mov', '.wmv', '.flv', '.mkv', '.webm'],
@@ -26,49 +102,384 @@ class FileScanner:
             'archive': ['.zip', '.rar', '.7z', '.tar', '.gz'],
             'application': ['.exe', '.msi', '.app', '.dmg', '.pkg']  # Added application types
         }
+        # Reverse lookup so categorizing is a single dict hit per file
+        self.category_by_suffix = {
+            suffix: category
+            for category, extensions in self.file_types.items()
+            for suffix in extensions
+        }
 
     def get_file_category(self, file_path: Path) -> str:
         if not file_path.suffix:
             return "unknown"
-        
-        suffix = file_path.suffix.lower()
-        for category, extensions in self.file_types.items():
-            if suffix in extensions:
-                return category
-        return "other"
-
-    def scan(self) -> List[Dict]:
-        """Scan directory and return file information (only parent directory)"""
-        files_data = []
+        return self.category_by_suffix.get(file_path.suffix.lower(), "other")
+
+    def make_record(self, name: str, rel_path: str) -> FileRecord:
+        """Build a file record from a file name without touching Path objects"""
+        suffix = os.path.splitext(name)[1]
+        if suffix == '.':
+            suffix = ''
+        if not suffix:
+            return FileRecord(rel_path, "unknown", "unknown")
+        return FileRecord(
+            rel_path,
+            suffix[1:],
+            self.category_by_suffix.get(suffix.lower(), "other")
+        )
+
+    def new_ignore_matcher(self, start: str = '') -> IgnoreMatcher:
+        """Fresh exclusion rules (and counters) for a scan from base_path or one of its folders"""
+        if not self.use_ignore:
+            self.ignore = None
+            return None
+        self.ignore = IgnoreMatcher(self.ignore_patterns)
+        # Ignore files above the starting folder apply to it too
+        rel_dir = ''
+        self.ignore.load_directory(str(self.base_path), rel_dir)
+        for part in Path(start).parts if start else ():
+            rel_dir = os.path.join(rel_dir, part) if rel_dir else part
+            self.ignore.load_directory(str(self.base_path / rel_dir), rel_dir)
+        return self.ignore
+
+    def iter_scan(self, recursive: bool = False, progress: ProgressTracker = None, skip=None, start: str = ''):
+        """Yield file records one at a time, holding only one directory listing.
+
+        Entries matching the exclusion rules are skipped and excluded
+        folders are never descended into (see self.ignore for counters).
+        skip(rel_path) can prune further entries as they are found; start
+        limits the walk to one folder below base_path. Content sniffing and
+        metadata are not applied; see scan().
+        """
+        ignore = self.new_ignore_matcher(start)
+        pending = [(self.base_path / start if start else self.base_path, start)]
+        while pending:
+            directory, prefix = pending.pop()
+            if ignore and prefix:
+                ignore.load_directory(str(directory), prefix)
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    rel_path = os.path.join(prefix, entry.name) if prefix else entry.name
+                    is_file = entry.is_file()
+                    if ignore and ignore.check(rel_path, not is_file):
+                        continue
+                    if skip and skip(rel_path):
+                        continue
+                    if is_file:
+                        yield self.make_record(entry.name, rel_path)
+                    elif recursive:
+                        if not entry.is_symlink():
+                            pending.append((entry.path, rel_path))
+                    else:
+                        yield FileRecord(rel_path, "folder", "folder", True)
+                    if progress:
+                        progress.advance()
+
+    def scan(self, recursive: bool = False, progress: ProgressTracker = None) -> List[FileRecord]:
+        """Scan directory and return file information.
+
+        By default only the parent directory is listed (folders included as
+        entries). With recursive=True every file below base_path is returned
+        and folders are descended into instead of being listed. progress is
+        advanced per entry and can cancel the scan.
+        """
         try:
-            for item in self.base_path.iterdir():
-                if item.is_file():
-                    files_data.append({
-                        "path": str(item.relative_to(self.base_path)),
-                        "type": item.suffix[1:] if item.suffix else "unknown",
-                        "category": self.get_file_category(item),
-                        "is_folder": False
-                    })
-                else:
-                    files_data.append({
-                        "path": str(item.relative_to(self.base_path)),
-                        "type": "folder",
-                        "category": "folder",
-                        "is_folder": True
-                    })
+            if recursive and self.shard_workers > 1:
+                files_data = self.scan_sharded(progress)
+            else:
+                files_data = list(self.iter_scan(recursive, progress))
+        except OperationCancelled:
+            logger.info("Scan cancelled")
+            raise
         except Exception as e:
             logger.error(f"Scanning error: {str(e)}")
             raise
+        if self.ignore and (self.ignore.pruned_dirs or self.ignore.ignored_files):
+            logger.info(f"Scan exclusions: {self.ignore.summary()}")
+        if self.sniff_content:
+            self.apply_content_sniffing(files_data)
+        if progress:
+            progress.check()
+        if self.extract_metadata:
+            self.apply_metadata(files_data)
+        if progress:
+            progress.finish()
         return files_data
 
+    def scan_sharded(self, progress: ProgressTracker = None) -> List[FileRecord]:
+        """Recursive scan with each top-level folder walked in its own process.
+
+        Results are merged in sorted folder order (root files first), so
+        the output does not depend on which worker finishes first.
+        Sniffing and metadata run afterwards on the merged list, as they
+        have their own pools and shared caches.
+        """
+        root_files = []
+        folders = []
+        ignore = self.new_ignore_matcher()
+        with os.scandir(self.base_path) as entries:
+            for entry in entries:
+                if ignore and ignore.check(entry.name, not entry.is_file()):
+                    continue
+                if entry.is_file():
+                    root_files.append(self.make_record(entry.name, entry.name))
+                elif entry.is_dir(follow_symlinks=False):
+                    folders.append(entry.name)
+        if progress:
+            progress.advance(len(root_files) + len(folders))
+        if len(folders) < 2:
+            files_data = root_files
+            for folder in folders:
+                files_data.extend(self.iter_scan(True, progress, start=folder))
+                if ignore:
+                    ignore.pruned_dirs += self.ignore.pruned_dirs
+                    ignore.ignored_files += self.ignore.ignored_files
+            self.ignore = ignore  # Counters of the whole scan
+            return files_data
+
+        shards = {}
+        with ProcessPoolExecutor(max_workers=min(self.shard_workers, len(folders))) as pool:
+            futures = {
+                pool.submit(scan_shard, str(self.base_path), folder, self.use_ignore, self.ignore_patterns): folder
+                for folder in folders
+            }
+            try:
+                for future in as_completed(futures):
+                    records, pruned_dirs, ignored_files = future.result()
+                    shards[futures[future]] = records
+                    if ignore:
+                        ignore.pruned_dirs += pruned_dirs
+                        ignore.ignored_files += ignored_files
+                    if progress:
+                        progress.advance(len(records))
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+        self.ignore = ignore
+        files_data = root_files
+        for folder in sorted(shards):
+            files_data.extend(shards[folder])
+        return files_data
+
+    def apply_metadata(self, files_data: List[FileRecord]) -> None:
+        """Attach header metadata (dates, tags, document properties) to file records"""
+        extractor = MetadataExtractor(cache_file=Path.home() / '.file_organizer_meta_cache.json')
+        files = [r for r in files_data if not r.is_folder]
+        results = extractor.extract_many(str(self.base_path / r.path) for r in files)
+        for record in files:
+            record.meta = results.get(str(self.base_path / record.path))
+
+    def apply_content_sniffing(self, files_data: List[FileRecord]) -> None:
+        """Correct record categories using the files' leading bytes.
+
+        Files with no recognised suffix take whatever the sniffer finds;
+        files with a known suffix are only recategorised on a strong match,
+        so a misnamed JPEG ends up with the images but a .docx (a zip
+        container) stays a document.
+        """
+        sniffer = ContentSniffer(cache_file=Path.home() / '.file_organizer_sniff_cache.json')
+        files = [r for r in files_data if not r.is_folder]
+        results = sniffer.sniff_many(str(self.base_path / r.path) for r in files)
+        changed = 0
+        for record in files:
+            result = results.get(str(self.base_path / record.path))
+            if not result or result[0] == record.category:
+                continue
+            category, strong = result
+            if strong or record.category in ('unknown', 'other'):
+                record.category = sys.intern(category)
+                changed += 1
+        if changed:
+            logger.info(f"Content sniffing recategorised {changed} files")
+
+def scan_shard(base_path: str, folder: str, use_ignore: bool = True, ignore_patterns: List[str] = None) -> tuple:
+    """Process-pool worker: recursively scan one top-level folder.
+
+    Returns (records, pruned folders, ignored files).
+    """
+    scanner = FileScanner(Path(base_path), False, False)
+    scanner.use_ignore, scanner.ignore_patterns = use_ignore, ignore_patterns
+    records = list(scanner.iter_scan(True, start=folder))
+    if not scanner.ignore:
+        return records, 0, 0
+    return records, scanner.ignore.pruned_dirs, scanner.ignore.ignored_files
+
+# Common alternative names mapped onto the scanner's categories when
+# reconciling per-subtree suggestions
+CATEGORY_ALIASES = {
+    'picture': 'image',
+    'photo': 'image',
+    'doc': 'document',
+    'music': 'audio',
+    'song': 'audio',
+    'movie': 'video',
+    'clip': 'video',
+    'program': 'application',
+    'installer': 'application',
+    'compressed': 'archive',
+}
+
+def category_key(name: str) -> str:
+    """Normalize a category/folder name so equivalent spellings compare equal"""
+    key = re.sub(r'[\s_\-]+', ' ', name.strip().lower())
+    if len(key) > 3 and key.endswith('s') and not key.endswith('ss'):
+        key = key[:-1]
+    return CATEGORY_ALIASES.get(key, key)
+
+def group_by_subtree(files_data: List[FileRecord]) -> Dict[str, List[FileRecord]]:
+    """Group records by their top-level directory ('' for root files)"""
+    groups = {}
+    for record in files_data:
+        parts = Path(record.path).parts
+        subtree = parts[0] if len(parts) > 1 else ''
+        groups.setdefault(subtree, []).append(record)
+    return groups
+
+def separate_target(parts: List[str], original_path: str, taken: set) -> str:
+    """A target path not in taken: the file's original folders are inserted
+    before its name, nearest first, then a number is added to the name"""
+    target = '/'.join(parts)
+    folders = list(Path(original_path).parent.parts)
+    for depth in range(1, len(folders) + 1):
+        if target not in taken:
+            return target
+        target = '/'.join(parts[:-1] + folders[-depth:] + parts[-1:])
+    name = Path(parts[-1])
+    number = 2
+    while target in taken:
+        target = '/'.join(parts[:-1] + folders + [f"{name.stem} ({number}){name.suffix}"])
+        number += 1
+    return target
+
+def create_date_layout(files_data: List[FileRecord]) -> Dict:
+    """Organize files locally by metadata, without calling the model.
+
+    Photos and videos go under year/month, music under artist/album and
+    documents under year. Files without usable metadata stay in their
+    category folder.
+    """
+    suggestion = {}
+    for record in files_data:
+        if record.is_folder:
+            continue
+        meta = record.meta or {}
+        name = Path(record.path).name
+        date = meta.get('date', '')
+        if record.category in ('image', 'video') and len(date) >= 7:
+            folder = f"{'Photos' if record.category == 'image' else 'Videos'}/{date[:4]}/{date[5:7]}"
+        elif record.category == 'audio' and meta.get('artist'):
+            folder = f"Music/{safe_folder_name(meta['artist'])}"
+            if meta.get('album'):
+                folder += f"/{safe_folder_name(meta['album'])}"
+        elif record.category == 'document' and len(date) >= 4:
+            folder = f"Documents/{date[:4]}"
+        else:
+            folder = record.category
+        category = folder.split('/')[0]
+        suggestion.setdefault(category, []).append({
+            'original_path': record.path,
+            'new_path': f"{folder}/{name}"
+        })
+    return suggestion
+
+def safe_folder_name(name: str) -> str:
+    """Make a tag value usable as a folder name on all platforms"""
+    cleaned = re.sub(r'[<>:"/\\|?*\x00-\x1f]', '_', name).strip(' .')
+    return cleaned[:80] or 'Unknown'
+
+def file_entry(record: FileRecord) -> str:
+    """A file's line in the prompt's file list"""
+    features = record.features()
+    return json.dumps({'path': record.path, **features} if features else record.path)
+
+class RequestCancelled(Exception):
+    """Raised inside a hedged request that lost before it was sent"""
+
+# Suggestion entries not produced by the model carry 'source': SOURCE_LOCAL
+SOURCE_LOCAL = 'local'
+
+# A category key opening its list, or one flat JSON object (a move)
+PARTIAL_TOKEN = re.compile(r'"((?:[^"\\]|\\.)*)"\s*:\s*\[|\{[^{}]*\}')
+
+def parse_partial_suggestion(text: str) -> Dict:
+    """Salvage the complete moves from a suggestion cut off mid-stream.
+
+    Each move is filed under the last category key seen before it; the
+    unfinished tail of the text is ignored.
+    """
+    suggestion = {}
+    category = 'other'
+    for match in PARTIAL_TOKEN.finditer(text or ''):
+        if match.group(1) is not None:
+            try:
+                category = json.loads(f'"{match.group(1)}"')
+            except ValueError:
+                pass
+            continue
+        try:
+            item = json.loads(match.group(0))
+        except ValueError:
+            continue
+        if isinstance(item, dict) and 'original_path' in item and 'new_path' in item:
+            suggestion.setdefault(category, []).append(item)
+    return suggestion
+
+# Identical completions requested concurrently (double clicks, regenerate
+# after undo, parallel batches) share one API call
+completion_flights = SingleFlight()
+
+# How often a hedged request checks whether its scheduler slot has been granted
+HEDGE_POLL = 0.05
+
+# Static instructions sent first in every organization request. Together
+# with the file list that follows they form a prefix that stays identical
+# across the first suggestion and every feedback round, so providers'
+# prompt caches can reuse it.
+ORGANIZE_INSTRUCTIONS = """You are a file organization assistant. Respond with clean JSON only.
+
+Analyze the files you are given and create an organized folder structure.
+Return a JSON object with categories as keys and arrays of file movements as values.
+Each file movement should include 'original_path' and 'new_path'.
+IMPORTANT: Always include both the folder and filename in the new_path.
+
+Example format:
+{
+    "documents": [
+        {"original_path": "file1.txt", "new_path": "documents/file1.txt"},
+        {"original_path": "file2.txt", "new_path": "documents/subfolder/file2.txt"}
+    ],
+    "images": [
+        {"original_path": "pic.jpg", "new_path": "images/pic.jpg"}
+    ]
+}"""
+
 class AIOrganizer:
-    def __init__(self, model: str = None):
-        self.client = OpenAI(
-            api_key=os.getenv('API_KEY'),
-            base_url=os.getenv('ENDPOINT')
-        )
-        self.model = model or os.getenv('MODEL_NAME')
+    def __init__(self, model: str = None, priority: int = PRIORITY_INTERACTIVE):
+        self.endpoints = load_endpoints(model)
+        primary = self.endpoints[0]
+        self.client = primary.client
+        self.model = primary.model
+        self.scheduler = primary.scheduler
+        self.priority = priority
+        # Hedging: wait this percentile of the primary's latency before
+        # asking a backup endpoint, within the given bounds (seconds)
+        self.hedge_percentile = 0.95
+        self.hedge_delay_default = float(os.getenv('HEDGE_DELAY', 10))
+        self.hedge_delay_bounds = (1.0, 120.0)
         self.max_chunk_size = 1000000  # 1MB chunks for processing
+        self.max_followups = 1  # Follow-up requests for files the model left out
+        self.request_timeout = float(os.getenv('REQUEST_TIMEOUT', 120))  # Seconds before a call is abandoned
+        # Latency budget (seconds) for suggestions; past it, the partial reply is completed locally
+        self.deadline = float(os.getenv('SUGGESTION_DEADLINE', 0)) or None
+        # Ask for schema-conforming JSON where the endpoint supports it (STRUCTURED_OUTPUT=0 disables)
+        self.structured = os.getenv('STRUCTURED_OUTPUT', '1').lower() not in ('0', 'false', 'no', 'off')
+        self.reply_stats = get_reply_stats()
+        # Replies already parsed in call_endpoint, so processing does not parse them again
+        self.parsed_replies = OrderedDict()
+        self.parsed_lock = threading.Lock()
+        # Wall time (seconds) to plan batch sizes and concurrency for; 0 means one request when it fits
+        self.target_duration = float(os.getenv('TARGET_DURATION', 0)) or None
+        self.max_completion_tokens = int(os.getenv('MAX_COMPLETION_TOKENS', 16000))
 
     def clean_response(self, response: str) -> str:
         """Clean and validate the AI response"""
@@ -123,37 +534,83 @@ class AIOrganizer:
             logger.error(f"Error processing large response: {str(e)}")
             return "{}"
 
-    def create_fallback_suggestion(self, files_data: List[Dict]) -> Dict:
-        """Create a basic organization suggestion based on file types"""
-        suggestion = {}
+    def parse_reply(self, text: str) -> tuple:
+        """Parse a reply into a JSON object: (object or None, outcome).
+
+        Structured replies parse as they are (DIRECT); anything else goes
+        through clean_response() first (CLEANED) or is PARSE_FAILED.
+        """
+        try:
+            value = json.loads(text)
+            if isinstance(value, dict):
+                return value, DIRECT
+        except (json.JSONDecodeError, TypeError):
+            pass
+        try:
+            value = json.loads(self.clean_response(text or ''))
+            if isinstance(value, dict):
+                return value, CLEANED
+        except (json.JSONDecodeError, TypeError):
+            pass
+        return None, PARSE_FAILED
+
+    def reply_json(self, text: str):
+        """The parsed JSON object of a reply (None if it has none), parsing only once"""
+        with self.parsed_lock:
+            if text in self.parsed_replies:
+                return self.parsed_replies[text]
+        value, _ = self.parse_reply(text)
+        self.remember_reply(text, value)
+        return value
+
+    def remember_reply(self, text: str, value) -> None:
+        with self.parsed_lock:
+            self.parsed_replies[text] = value
+            while len(self.parsed_replies) > 16:
+                self.parsed_replies.popitem(last=False)
+
+    def format_file_list(self, files_data: List[FileRecord]) -> str:
+        """Render the scanned paths (with metadata features, if any) for inclusion in a prompt"""
+        # Sorted so the same files always render identically (stable prompt prefix)
+        entries = [file_entry(f) for f in sorted(files_data, key=lambda r: r.path)]
+        if not entries:
+            return '[]'
+        return '[\n  ' + ',\n  '.join(entries) + '\n]'
+
+    def create_fallback_suggestion(self, files_data: List[FileRecord]) -> Dict:
+        """Create an organization suggestion without the model.
+
+        Files the local classifier (trained on previously applied plans)
+        places confidently go to its folders; the rest go to their file
+        type category. Every entry is marked with 'source': 'local'.
+        """
+        suggestion, files_data = get_classifier().suggest(files_data)
+        for items in suggestion.values():
+            for item in items:
+                item['source'] = SOURCE_LOCAL
         for file in files_data:
-            if file['is_folder']:
+            if file.is_folder:
                 continue
                 
-            category = file['category'].lower()
+            category = file.category
             if category not in suggestion:
                 suggestion[category] = []
                 
             suggestion[category].append({
-                'original_path': file['path'],
-                'new_path': f"{category}/{file['path']}"
+                'original_path': file.path,
+                'new_path': f"{category}/{file.path}",
+                'source': SOURCE_LOCAL
             })
         
         return suggestion
 
-    def process_suggestion(self, response_text: str, files_data: List[Dict]) -> Dict:
+    def process_suggestion(self, response_text: str, files_data: List[FileRecord]) -> Dict:
         """Process and validate the AI suggestion with fallback"""
         try:
-            cleaned_result = self.clean_response(response_text)
-            try:
-                parsed_result = json.loads(cleaned_result)
-            except json.JSONDecodeError:
+            parsed_result = self.reply_json(response_text)
+            if parsed_result is None:
                 logger.warning("Failed to parse AI response, using fallback organization")
                 return self.create_fallback_suggestion(files_data)
-            
-            # Validate the structure
-            if not isinstance(parsed_result, dict):
-                return self.create_fallback_suggestion(files_data)
                 
             # Ensure all entries have required fields
             validated_result = {}
@@ -172,103 +629,535 @@ class AIOrganizer:
             logger.error(f"Processing error: {str(e)}")
             return self.create_fallback_suggestion(files_data)
 
-    def get_suggestion(self, files_data: List[Dict]) -> Dict:
+    def call_endpoint(self, endpoint: Endpoint, messages: List[Dict], temperature: float,
+                      cancelled: threading.Event = None, partials: List[List[str]] = None,
+                      sent: threading.Event = None) -> str:
+        """Send a chat completion request to one endpoint through its scheduler.
+
+        With partials, the reply is streamed and its pieces are appended to
+        a new list in partials as they arrive, so a caller whose deadline
+        passes can use what has been received so far. sent, if given, is
+        set once the scheduler has granted a slot and the request goes out;
+        latency is measured from that point too, so queueing is not counted.
+        """
+        # Budget for the prompt plus a reply of similar size
+        estimated = 2 * sum(estimate_tokens(m['content']) for m in messages)
+        attempts = []
+
+        def send():
+            if cancelled is not None and cancelled.is_set():
+                raise RequestCancelled()
+            attempts.append(1)
+            if sent is not None:
+                sent.set()
+            start = time.monotonic()
+            try:
+                if partials is None:
+                    response = self.create_completion(endpoint, messages, temperature)
+                    text = response.choices[0].message.content
+                    tokens = response.usage.total_tokens if response.usage else 0
+                    completion_tokens = response.usage.completion_tokens if response.usage else None
+                else:
+                    received = []
+                    partials.append(received)
+                    stream = self.create_completion(endpoint, messages, temperature, stream=True)
+                    try:
+                        for chunk in stream:
+                            if cancelled is not None and cancelled.is_set():
+                                raise RequestCancelled()
+                            if chunk.choices and chunk.choices[0].delta.content:
+                                received.append(chunk.choices[0].delta.content)
+                    finally:
+                        stream.close()
+                    text = ''.join(received)
+                    tokens = 0  # Streams do not report usage; the estimate stands
+                    completion_tokens = None
+            except RequestCancelled:
+                raise
+            except Exception:
+                endpoint.stats.record_failure()
+                raise
+            elapsed = time.monotonic() - start
+            endpoint.stats.record(elapsed)
+            # Parse here, once, to see how well this model keeps to JSON
+            value, outcome = self.parse_reply(text)
+            self.remember_reply(text, value)
+            self.reply_stats.record(endpoint.model, outcome, retries=len(attempts) - 1,
+                                    completion_tokens=completion_tokens or count_tokens(text or ''),
+                                    seconds=elapsed)
+            return text, tokens
+
+        text, _ = endpoint.scheduler.submit(
+            send,
+            estimated_tokens=estimated,
+            priority=self.priority,
+            usage=lambda r: r[1]
+        )
+        return text
+
+    def create_completion(self, endpoint: Endpoint, messages: List[Dict], temperature: float, stream: bool = False):
+        """chat.completions.create, asking for structured JSON output where supported.
+
+        The first request to an endpoint tries each of MODES in turn until
+        one is accepted (a 400, 404 or 422 moves on to the next), and the
+        accepted mode is remembered in the reply stats for later runs.
+        """
+        known = self.reply_stats.mode(endpoint.base_url, endpoint.model) if self.structured else PLAIN
+        modes = [known] if known else list(MODES)
+        for i, mode in enumerate(modes):
+            extra = {'response_format': response_format(mode)} if mode != PLAIN else {}
+            try:
+                response = endpoint.client.chat.completions.create(
+                    model=endpoint.model,
+                    messages=messages,
+                    temperature=temperature,
+                    timeout=self.request_timeout,
+                    stream=stream,
+                    **extra
+                )
+            except Exception as e:
+                status = getattr(e, 'status_code', None)
+                if known or i == len(modes) - 1 or status not in (400, 404, 422):
+                    raise
+                logger.info(f"{endpoint.base_url} rejected {mode} output ({status}), trying {modes[i + 1]}")
+                continue
+            if not known:
+                self.reply_stats.set_mode(endpoint.base_url, endpoint.model, mode)
+            return response
+
+    def hedge_delay(self, endpoint: Endpoint) -> float:
+        """How long to wait on an endpoint before firing a backup request"""
+        observed = endpoint.stats.percentile(self.hedge_percentile)
+        if observed is None:
+            return self.hedge_delay_default
+        low, high = self.hedge_delay_bounds
+        return min(high, max(low, observed))
+
+    def is_valid_response(self, text: str) -> bool:
+        """Whether a response parses into a JSON object"""
+        return self.reply_json(text) is not None
+
+    def request_completion(self, messages: List[Dict], temperature: float) -> str:
+        """Send a chat completion request and return the message text.
+
+        Concurrent identical requests (same endpoints, messages and
+        temperature) are coalesced into one call whose result they share.
+        """
+        return completion_flights.do(self.flight_key(messages, temperature),
+                                     self.flight_call(messages, temperature, stream=False))
+
+    def flight_key(self, messages: List[Dict], temperature: float) -> str:
+        return request_key([(e.base_url, e.model) for e in self.endpoints], messages, temperature)
+
+    def flight_call(self, messages: List[Dict], temperature: float, stream: bool = True):
+        """The shared call of a flight, stopped by its cancel event and, if streamed, read into its partials"""
+        return lambda flight: self.send_completion(messages, temperature, flight.partials if stream else None,
+                                                   flight.cancelled)
+
+    def complete_within(self, messages: List[Dict], temperature: float, deadline: float,
+                        on_complete=None) -> tuple[str, bool]:
+        """Request a completion but return after at most deadline seconds.
+
+        Returns (text, finished). When the deadline passes first, text is
+        whatever part of the reply has streamed in, also when the request
+        is shared with another caller (empty if nothing has arrived, or if
+        the shared request came from request_completion(), which does not
+        stream). With on_complete, the request keeps running and
+        on_complete(text) is called once it finishes; otherwise this caller
+        leaves it, and it is cancelled (its stream closed) unless other
+        callers still wait for it.
+        """
+        key = self.flight_key(messages, temperature)
+        flight, leader = completion_flights.join(key)
+        if leader:
+            pool = ThreadPoolExecutor(max_workers=1)
+            pool.submit(completion_flights.run, key, flight, self.flight_call(messages, temperature))
+            pool.shutdown(wait=False)
         try:
-            prompt = """Analyze these files and create an organized folder structure.
-            Files: {files}
-            
-            Return a JSON object with categories as keys and arrays of file movements as values.
-            Each file movement should include 'original_path' and 'new_path'.
-            IMPORTANT: Always include both the folder and filename in the new_path.
-            
-            Example format:
-            {{
-                "documents": [
-                    {{"original_path": "file1.txt", "new_path": "documents/file1.txt"}},
-                    {{"original_path": "file2.txt", "new_path": "documents/subfolder/file2.txt"}}
-                ],
-                "images": [
-                    {{"original_path": "pic.jpg", "new_path": "images/pic.jpg"}}
-                ]
-            }}""".format(files=json.dumps([f['path'] for f in files_data], indent=2))
-
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": "You are a file organization assistant. Respond with clean JSON only."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.2
-            )
+            return flight.future.result(timeout=deadline), True
+        except FutureTimeout:
+            pass
+
+        logger.warning(f"No complete response within {deadline:g}s, using the partial reply")
+        if on_complete:
+            def finished(f):
+                if f.cancelled() or f.exception() is not None:
+                    logger.warning("Background request did not complete")
+                    return
+                try:
+                    on_complete(f.result())
+                except Exception as e:
+                    logger.error(f"Refining suggestion failed: {str(e)}")
+            flight.future.add_done_callback(finished)
+        else:
+            completion_flights.leave(flight)
+        return flight.partial(), False
+
+    def send_completion(self, messages: List[Dict], temperature: float, partials: List[List[str]] = None,
+                        cancelled: threading.Event = None) -> str:
+        """Send a chat completion request and return the message text.
+
+        With backup endpoints configured the request is hedged: if the
+        primary has not answered within hedge_delay() of getting its
+        scheduler slot (queueing does not count), or answers with
+        something unparseable, the next endpoint is asked too and the first
+        valid response wins. Losers that have not been sent yet are
+        cancelled; ones already in flight are left to finish and ignored.
+        """
+        if len(self.endpoints) == 1:
+            return self.call_endpoint(self.endpoints[0], messages, temperature, cancelled, partials)
+
+        cancelled = cancelled or threading.Event()
+        pool = ThreadPoolExecutor(max_workers=len(self.endpoints))
+        backups = iter(self.endpoints[1:])
+        sent = threading.Event()
+        pending = {pool.submit(self.call_endpoint, self.endpoints[0], messages, temperature, cancelled, partials,
+                               sent)}
+        timeout = self.hedge_delay(self.endpoints[0])
+        last_result, last_error = None, None
+        try:
+            while pending:
+                if not sent.is_set():
+                    # Time spent queued in the scheduler is not the endpoint being slow:
+                    # the hedge timer starts once the latest request has a slot
+                    done, pending = wait(pending, timeout=HEDGE_POLL, return_when=FIRST_COMPLETED)
+                    if not done:
+                        continue
+                else:
+                    done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        last_error = e
+                        continue
+                    if self.is_valid_response(result):
+                        return result
+                    last_result = result
+
+                # Timed out or the finished request was no good: hedge with the next endpoint
+                backup = next(backups, None)
+                if backup is not None:
+                    logger.info(f"Hedging request to backup endpoint {backup.base_url}")
+                    sent = threading.Event()
+                    pending.add(pool.submit(self.call_endpoint, backup, messages, temperature, cancelled, partials,
+                                            sent))
+                    timeout = self.hedge_delay(backup)
+                else:
+                    timeout = None
+
+            if last_result is not None:
+                return last_result
+            raise last_error
+        finally:
+            cancelled.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def check_coverage(self, suggestion: Dict, files_data: List[FileRecord]) -> tuple[Dict, List[FileRecord]]:
+        """Validate a suggestion against the scanned files.
+
+        Entries whose original_path was not scanned (invented by the model) or
+        that repeat an already placed file are dropped. Returns the cleaned
+        suggestion and the files that no entry covers.
+        """
+        index = {record.path: record for record in files_data}
+        covered = set()
+        checked = {}
+        dropped = 0
+        for category, items in suggestion.items():
+            kept = []
+            for item in items:
+                original = item['original_path']
+                record = None
+                if isinstance(original, str) and original:
+                    record = index.get(original) or index.get(str(Path(original)))
+                if record is None or record.path in covered:
+                    dropped += 1
+                    continue
+                covered.add(record.path)
+                kept.append({**item, 'original_path': record.path})
+            if kept:
+                checked[category] = kept
+
+        if dropped:
+            logger.warning(f"Dropped {dropped} suggestion entries for unknown or duplicate paths")
+        missing = [r for r in files_data if not r.is_folder and r.path not in covered]
+        return checked, missing
+
+    def request_missing(self, missing: List[FileRecord], suggestion: Dict, deadline: float = None) -> Dict:
+        """Ask the model to place only the files left out of a suggestion,
+        keeping what has arrived after deadline seconds if one is set"""
+        folders = sorted({str(Path(item['new_path']).parent) for items in suggestion.values() for item in items})
+        prompt = f"""These files were left out of an existing organization.
+Place each of them, reusing the existing folders where they fit.
+
+Existing folders:
+{json.dumps(folders, indent=2)}
 
-            result = response.choices[0].message.content
-            return self.process_suggestion(result, files_data)
+Files to place:
+{self.format_file_list(missing)}
 
+Return ONLY valid JSON with categories as keys and arrays of
+{{"original_path": ..., "new_path": ...}} objects as values. Always include both
+the folder and filename in the new_path."""
+
+        messages = [
+            {"role": "system", "content": "You are a file organization assistant. Respond with clean JSON only."},
+            {"role": "user", "content": prompt}
+        ]
+        if deadline is None:
+            return self.process_suggestion(self.request_completion(messages, temperature=0.2), missing)
+        result, finished = self.complete_within(messages, 0.2, deadline)
+        if not finished:
+            return parse_partial_suggestion(self.clean_response(result))
+        return self.process_suggestion(result, missing)
+
+    def ensure_coverage(self, suggestion: Dict, files_data: List[FileRecord], ends_at: float = None) -> Dict:
+        """Drop invented entries and fill in files the suggestion missed.
+
+        Missing files get a small follow-up request of their own, bounded
+        by what is left until ends_at (a time.monotonic() value) if set;
+        anything still uncovered after that is placed by the fallback
+        strategy.
+        """
+        suggestion, missing = self.check_coverage(suggestion, files_data)
+        attempts = 0
+        while missing and attempts < self.max_followups:
+            remaining = ends_at - time.monotonic() if ends_at is not None else None
+            if remaining is not None and remaining <= 0:
+                break
+            attempts += 1
+            logger.info(f"{len(missing)} files not covered, requesting placement for them only")
+            self.reply_stats.record_followup(self.model)
+            try:
+                extra, missing = self.check_coverage(self.request_missing(missing, suggestion, remaining), missing)
+            except Exception as e:
+                logger.error(f"Follow-up request failed: {str(e)}")
+                break
+            for category, items in extra.items():
+                suggestion.setdefault(category, []).extend(items)
+
+        if missing:
+            logger.warning(f"{len(missing)} files still not covered, using fallback for them")
+            for category, items in self.create_fallback_suggestion(missing).items():
+                suggestion.setdefault(category, []).extend(items)
+        return suggestion
+
+    def organize_messages(self, files_data: List[FileRecord]) -> List[Dict]:
+        """The cache-friendly message prefix shared by all organization requests"""
+        return [
+            {"role": "system", "content": ORGANIZE_INSTRUCTIONS},
+            {"role": "user", "content": f"Files:\n{self.format_file_list(files_data)}"}
+        ]
+
+    def partial_suggestion(self, text: str, files_data: List[FileRecord]) -> Dict:
+        """Keep the moves in a cut-off reply and place every other file locally"""
+        suggestion, missing = self.check_coverage(parse_partial_suggestion(self.clean_response(text)), files_data)
+        kept = sum(len(items) for items in suggestion.values())
+        logger.info(f"Deadline reached: {kept} moves from the model, {len(missing)} placed locally")
+        for category, items in self.create_fallback_suggestion(missing).items():
+            suggestion.setdefault(category, []).extend(items)
+        return suggestion
+
+    def complete_suggestion(self, messages: List[Dict], temperature: float, files_data: List[FileRecord],
+                            deadline: float = None, on_refined=None, finish=None) -> Dict:
+        """Request a suggestion, within deadline seconds if one is set.
+
+        If the deadline passes, the moves received so far are kept and the
+        rest are filled in locally (marked 'source': 'local'). With
+        on_refined, the request keeps running and on_refined(suggestion)
+        gets the model's complete answer once it arrives. finish, if given,
+        post-processes every suggestion returned or refined, partial ones
+        included.
+        """
+        finish = finish or (lambda suggestion: suggestion)
+        deadline = deadline or self.deadline
+        if not deadline:
+            result = self.request_completion(messages, temperature=temperature)
+            return finish(self.ensure_coverage(self.process_suggestion(result, files_data), files_data))
+
+        started = time.monotonic()
+        refine = None
+        if on_refined:
+            def refine(text):
+                on_refined(finish(self.ensure_coverage(self.process_suggestion(text, files_data), files_data)))
+        result, finished = self.complete_within(messages, temperature, deadline, refine)
+        if not finished:
+            return finish(self.partial_suggestion(result, files_data))
+        return finish(self.ensure_coverage(self.process_suggestion(result, files_data), files_data,
+                                           started + deadline))
+
+    def get_suggestion(self, files_data: List[FileRecord], progress: ProgressTracker = None,
+                       deadline: float = None, on_refined=None) -> Dict:
+        """Ask the model to organize files; see complete_suggestion() for deadline and on_refined"""
+        try:
+            if progress:
+                progress.check()
+            suggestion = self.complete_suggestion(
+                self.organize_messages(files_data), 0.2, files_data, deadline, on_refined
+            )
+            if progress:
+                progress.advance(len(files_data))
+            return suggestion
+
+        except OperationCancelled:
+            raise
         except Exception as e:
             logger.error(f"AI API error: {str(e)}")
             return self.create_fallback_suggestion(files_data)
 
-    def get_modified_suggestion(self, files_data: List[Dict], previous_suggestion: Dict, user_feedback: str) -> Dict:
+    def preflight(self, files_data: List[FileRecord], target_seconds: float = None) -> Dict:
+        """Estimate tokens, requests and wall time before organizing files_data.
+
+        Uses the primary model's timing history, its endpoint's rate limits
+        and the request timeout; see preflight.estimate_run() for the batch
+        size choice.
+        """
+        return estimate_run(
+            [file_entry(f) for f in files_data if not f.is_folder],
+            ORGANIZE_INSTRUCTIONS,
+            latency=self.reply_stats.latency(self.model),
+            target_seconds=target_seconds or self.target_duration,
+            max_concurrency=self.scheduler.max_concurrency,
+            tokens_per_minute=self.scheduler.token_bucket.rate * 60,
+            requests_per_minute=self.scheduler.request_bucket.rate * 60,
+            max_completion_tokens=self.max_completion_tokens,
+            request_timeout=self.request_timeout
+        )
+
+    def get_batched_suggestion(self, files_data: List[FileRecord], progress: ProgressTracker = None,
+                               estimate: Dict = None, on_refined=None) -> Dict:
+        """Organize files in the batches preflight() picks.
+
+        Within one request's budget this is get_suggestion(). Otherwise the
+        files, in path order, are split into batches that are organized
+        concurrently and merged like subtrees.
+        """
+        estimate = estimate or self.preflight(files_data)
+        if estimate['requests'] <= 1:
+            return self.get_suggestion(files_data, progress, on_refined=on_refined)
+
+        records = sorted(files_data, key=lambda r: r.path)
+        size = estimate['batch_size']
+        batches = [records[i:i + size] for i in range(0, len(records), size)]
+        logger.info(f"Organizing {len(records)} files in {len(batches)} batches, "
+                    f"{estimate['concurrency']} at a time")
+        if progress:
+            progress.set_totals(files=len(records))
+        pool = ThreadPoolExecutor(max_workers=estimate['concurrency'])
+        try:
+            futures = {f"batch{i + 1}": pool.submit(self.get_suggestion, batch, progress)
+                       for i, batch in enumerate(batches)}
+            partials = {name: future.result() for name, future in futures.items()}
+        finally:
+            pool.shutdown(cancel_futures=True)
+        if progress:
+            progress.finish()
+        return self.reconcile_taxonomy(partials)
+
+    def get_subtree_suggestion(self, files_data: List[FileRecord], max_workers: int = 4,
+                               progress: ProgressTracker = None) -> Dict:
+        """Organize each top-level subtree independently, then merge the results"""
+        if progress:
+            progress.set_totals(files=len(files_data))
+        groups = group_by_subtree(files_data)
+        if len(groups) <= 1:
+            return self.get_suggestion(files_data, progress)
+
+        logger.info(f"Organizing {len(groups)} subtrees with {max_workers} workers")
+        pool = ThreadPoolExecutor(max_workers=max_workers)
         try:
-            prompt = f"""I need you to reorganize these files differently based on user feedback.
+            futures = {
+                subtree: pool.submit(self.get_suggestion, records, progress)
+                for subtree, records in sorted(groups.items())
+            }
+            partials = {subtree: future.result() for subtree, future in futures.items()}
+        finally:
+            pool.shutdown(cancel_futures=True)
+        if progress:
+            progress.finish()
 
-Previous organization that needs modification:
-{json.dumps(previous_suggestion, indent=2)}
+        return self.reconcile_taxonomy(partials)
 
-Files to organize:
-{json.dumps([f['path'] for f in files_data], indent=2)}
+    def reconcile_taxonomy(self, partials: Dict[str, Dict]) -> Dict:
+        """Merge per-subtree suggestions into one shared set of categories.
 
-User requested changes:
+        Equivalent category names ("Images", "photos", "image") are collapsed
+        onto the spelling used most often, target paths whose top folder
+        names a category are rewritten to that spelling, and colliding
+        targets are separated by the files' original folders (see
+        separate_target()).
+        """
+        # Pick one display name per normalized key, preferring the most common
+        spellings = {}
+        for suggestion in partials.values():
+            for category, items in suggestion.items():
+                counts = spellings.setdefault(category_key(category), {})
+                counts[category] = counts.get(category, 0) + len(items)
+        canonical = {
+            key: max(counts, key=lambda name: (counts[name], name))
+            for key, counts in spellings.items()
+        }
+
+        merged = {}
+        taken = set()
+        for suggestion in partials.values():
+            for category, items in suggestion.items():
+                name = canonical[category_key(category)]
+                for item in items:
+                    parts = list(Path(item['new_path']).parts)
+                    if len(parts) > 1 and category_key(parts[0]) in canonical:
+                        parts[0] = canonical[category_key(parts[0])]
+                    new_path = separate_target(parts, item['original_path'], taken)
+                    taken.add(new_path)
+                    merged.setdefault(name, []).append({**item, 'new_path': new_path})
+        return merged
+
+    def get_modified_suggestion(self, files_data: List[FileRecord], previous_suggestion: Dict, user_feedback: str,
+                                progress: ProgressTracker = None, deadline: float = None, on_refined=None) -> Dict:
+        try:
+            if progress:
+                progress.set_totals(files=len(files_data))
+            # Same prefix as get_suggestion (instructions, file list); only the
+            # previous answer and the feedback change between rounds
+            messages = self.organize_messages(files_data) + [
+                {
+                    "role": "assistant",
+                    "content": json.dumps(previous_suggestion)
+                },
+                {
+                    "role": "user",
+                    "content": f"""Reorganize these files differently based on this feedback:
 {user_feedback}
 
 Important instructions:
-1. Create a NEW organization scheme that incorporates the user's feedback
+1. Create a NEW organization scheme that incorporates the feedback
 2. Do NOT just return the previous suggestion
 3. Ensure all new paths include both folder and filename
-4. Return ONLY valid JSON in this format:
-{{
-    "category1": [
-        {{"original_path": "file1.txt", "new_path": "category1/file1.txt"}}
-    ],
-    "category2": [
-        {{"original_path": "file2.jpg", "new_path": "category2/file2.jpg"}}
-    ]
-}}"""
+4. Return ONLY valid JSON in the same format as before"""
+                }
+            ]
+
+            def differs(suggestion):
+                # Verify the suggestion is different from the previous one
+                if suggestion == previous_suggestion:
+                    logger.warning("AI returned same suggestion, generating alternative")
+                    return self.create_fallback_suggestion(files_data)
+                return suggestion
 
             logger.info("Sending modified suggestion request to AI")
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a file organization assistant. You must create a new organization scheme based on user feedback. Never return the same suggestion twice."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.7  # Increased temperature for more variation
+            processed_result = self.complete_suggestion(
+                messages,
+                0.7,  # Increased temperature for more variation
+                files_data, deadline, on_refined, finish=differs
             )
-
-            result = response.choices[0].message.content
-            logger.info(f"Received modified suggestion from AI: {result[:200]}...")  # Log first 200 chars
-            
-            processed_result = self.process_suggestion(result, files_data)
-            
-            # Verify the suggestion is different from the previous one
-            if processed_result == previous_suggestion:
-                logger.warning("AI returned same suggestion, generating alternative")
-                return self.create_fallback_suggestion(files_data)
-                
+            if progress:
+                progress.advance(len(files_data))
+                progress.finish()
             return processed_result
 
+        except OperationCancelled:
+            raise
         except Exception as e:
             logger.error(f"AI API error in modified suggestion: {str(e)}")
             return self.create_fallback_suggestion(files_data)
@@ -277,6 +1166,12 @@ class FileOrganizer:
     def __init__(self, base_path: Path):
         self.base_path = base_path
         self.move_history = []  # Store move operations for undo
+        # Processes used to apply large plans, split by destination folder
+        self.shard_workers = int(os.getenv('SHARD_WORKERS', '1'))
+        self.min_shard_moves = 1000
+        # Train the local fallback classifier from applied moves (and untrain undone ones)
+        self.learn = True
+        self.learned_batches = set()  # ids of move_history batches the classifier learned
 
     def normalize_path(self, path_str: str) -> str:
         """Ensure path includes both folder and filename"""
@@ -285,46 +1180,265 @@ class FileOrganizer:
             return str(path / path.parts[-1])  # Append original filename
         return path_str
 
-    def move_files(self, organization: Dict) -> bool:
-        """Execute file movement based on suggestion"""
+    def move_item(self, executor: MoveExecutor, item: Dict, moved_files: set) -> tuple[str, Dict]:
+        """Move one suggestion entry.
+
+        Returns (status, history record): status is a plan status (done or
+        skipped) and the record is None unless the file moved.
+        """
+        if not isinstance(item, dict) or 'original_path' not in item or 'new_path' not in item:
+            logger.error(f"Invalid item format: {item}")
+            return SKIPPED, None
+
+        base = str(self.base_path)
+        old_path = os.path.normpath(os.path.join(base, item['original_path']))
+        new_path = os.path.normpath(os.path.join(base, self.normalize_path(item['new_path'])))
+        
+        if old_path in moved_files:
+            logger.warning(f"File already moved: {old_path}")
+            return SKIPPED, None
+
+        # Parent directories are created on demand; existing targets are never replaced
         try:
-            moved_files = []
-            current_batch = []  # Track current batch of moves
-            
-            for category, items in organization.items():
-                for item in items:
-                    if not isinstance(item, dict) or 'original_path' not in item or 'new_path' not in item:
-                        logger.error(f"Invalid item format: {item}")
-                        continue
+            executor.move(old_path, new_path)
+        except FileNotFoundError:
+            logger.warning(f"File not found: {old_path}")
+            return SKIPPED, None
+        except FileExistsError:
+            logger.warning(f"Target already exists, skipping: {new_path}")
+            return SKIPPED, None
+        moved_files.add(old_path)
+        logger.info(f"Moved {old_path} to {new_path}")
+        record = {
+            'from': old_path,
+            'to': new_path
+        }
+        if item.get('source'):
+            record['source'] = item['source']
+        return DONE, record
 
-                    old_path = self.base_path / item['original_path']
-                    new_path = self.base_path / self.normalize_path(item['new_path'])
-                    
-                    if str(old_path) in moved_files:
-                        logger.warning(f"File already moved: {old_path}")
-                        continue
+    def move_files(self, organization, progress: ProgressTracker = None) -> bool:
+        """Execute file movement based on a suggestion dict, a persisted Plan,
+        or any iterable of move dicts (e.g. streamed from iter_plan_file()).
 
-                    # Create parent directories if they don't exist
-                    new_path.parent.mkdir(exist_ok=True, parents=True)
-                    
-                    if old_path.exists():
-                        shutil.move(str(old_path), str(new_path))
-                        moved_files.append(str(old_path))
-                        current_batch.append({
-                            'from': str(old_path),
-                            'to': str(new_path)
-                        })
-                        logger.info(f"Moved {old_path} to {new_path}")
-                    else:
-                        logger.warning(f"File not found: {old_path}")
-            
-            if current_batch:
-                self.move_history.append(current_batch)
+        With a Plan, only its outstanding moves are attempted, each move's
+        status is appended to the plan's journal as it goes (the plan is
+        rewritten once at the end, or removed once nothing is left), so an
+        interrupted run can be resumed later.
+        Iterables are consumed lazily, one move at a time. Moves completed
+        before an error or cancellation are still recorded in the history
+        so they can be undone.
+        """
+        moved_files = set()
+        current_batch = []  # Track current batch of moves
+        plan = organization if isinstance(organization, Plan) else None
+        total = None
+        if plan:
+            total = sum(1 for _ in plan.outstanding())
+            entries = ((m, m.item()) for m in plan.outstanding())
+        elif isinstance(organization, dict):
+            total = sum(len(items) for items in organization.values())
+            entries = ((None, item) for items in organization.values() for item in items)
+        else:
+            entries = ((None, item) for item in organization)
+        try:
+            on_transfer = None
+            if progress:
+                progress.set_totals(files=total)
+                copied = {}
+
+                def on_transfer(path, done, total):
+                    progress.advance(files=0, bytes=done - copied.get(path, 0))
+                    copied[path] = done
+
+            if self.shard_workers > 1 and total and total >= self.min_shard_moves:
+                return self.move_sharded(list(entries), current_batch, progress)
+
+            with MoveExecutor(progress=on_transfer) as executor:
+                for plan_move, item in entries:
+                    try:
+                        status, move = self.move_item(executor, item, moved_files)
+                    except OSError as e:
+                        if plan_move:
+                            plan_move.status, plan_move.error = FAILED, str(e)
+                            plan.record(plan_move)
+                        raise
+                    if move:
+                        current_batch.append(move)
+                    if plan_move:
+                        plan_move.status, plan_move.error = status, None
+                        plan.record(plan_move)
+                    if progress:
+                        progress.advance()
             return True
-            
+
+        except OperationCancelled:
+            logger.warning(f"Moving cancelled after {len(current_batch)} files")
+            raise
         except Exception as e:
             logger.error(f"File movement error: {str(e)}")
             return False
+        finally:
+            if current_batch:
+                self.move_history.append(current_batch)
+                if self.learn:
+                    get_classifier().learn_moves(self.learnable(current_batch), self.base_path)
+                    self.learned_batches.add(id(current_batch))
+            if plan:
+                try:
+                    if plan.complete:
+                        plan.discard()
+                    else:
+                        plan.save()
+                except OSError as e:
+                    logger.error(f"Could not save plan: {str(e)}")
+            if progress:
+                progress.finish()
+
+    def move_sharded(self, entries: List[tuple], current_batch: List[Dict], progress: ProgressTracker = None) -> bool:
+        """Apply (plan move, item) entries in a process pool, one shard per group of destination folders.
+
+        Moves are grouped by the folder they move into, and groups linked by
+        a chain (one move's target is another's source) are merged, so a
+        chain always runs in one shard in entry order. The groups are spread
+        over shard_workers processes, largest first. Moves that target the
+        same path as an earlier move (in source order) are skipped up front,
+        so shards never race for a target; only moves into or out of a
+        folder that another shard moves as a whole can depend on
+        scheduling. History records are appended to current_batch in entry
+        order. Workers check for cancellation before each move, and a shard
+        stops at its first OS error, like a serial run; moves not attempted
+        stay pending.
+        """
+        planned = []  # (index, source, folder)
+        targets = {}  # target -> folder
+        skipped = 0
+        for index, (plan_move, item) in enumerate(entries):
+            if not isinstance(item, dict) or 'original_path' not in item or 'new_path' not in item:
+                logger.error(f"Invalid item format: {item}")
+                skipped += 1
+                if plan_move:
+                    plan_move.status = SKIPPED
+                continue
+            target = os.path.normpath(self.normalize_path(item['new_path']))
+            if target in targets:
+                logger.warning(f"Target already planned, skipping: {target}")
+                skipped += 1
+                if plan_move:
+                    plan_move.status = SKIPPED
+                continue
+            targets[target] = os.path.dirname(target)
+            planned.append((index, os.path.normpath(item['original_path']), targets[target]))
+
+        # Union the destination folders of moves that feed one another
+        linked = {}
+        def find(folder):
+            while linked.setdefault(folder, folder) != folder:
+                linked[folder] = linked[linked[folder]]
+                folder = linked[folder]
+            return folder
+        for index, source, folder in planned:
+            if source in targets:
+                linked[find(folder)] = find(targets[source])
+        groups = {}
+        for index, source, folder in planned:
+            groups.setdefault(find(folder), []).append(index)
+
+        # Greedy balance: biggest group to the least loaded shard
+        shards = [[] for _ in range(min(self.shard_workers, len(groups)) or 1)]
+        for key in sorted(groups, key=lambda k: (-len(groups[k]), k)):
+            min(shards, key=len).extend(groups[key])
+        shards = [sorted(shard) for shard in shards if shard]
+
+        results = {}
+        success = True
+        cancelled = None
+        context = multiprocessing.get_context()
+        stop = context.Event()
+        with ProcessPoolExecutor(max_workers=len(shards) or 1, mp_context=context,
+                                 initializer=init_shard_worker, initargs=(stop,)) as pool:
+            futures = {
+                pool.submit(move_shard, str(self.base_path), [entries[i][1] for i in shard]): shard
+                for shard in shards
+            }
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                if progress and not cancelled and progress.cancel_token.cancelled:
+                    # Running shards stop before their next move; what they moved is still recorded
+                    cancelled = OperationCancelled()
+                    stop.set()
+                for future in done:
+                    if future.cancelled():
+                        continue
+                    try:
+                        outcomes = future.result()
+                    except Exception as e:
+                        logger.error(f"Shard failed: {str(e)}")
+                        success = False
+                        continue
+                    results.update(zip(futures[future], outcomes))
+                    if progress and not cancelled:
+                        try:
+                            progress.advance(len(outcomes))
+                        except OperationCancelled as e:
+                            cancelled = e
+                            stop.set()
+
+        # Merge in entry order so history and statuses are deterministic
+        for index in sorted(results):
+            plan_move = entries[index][0]
+            status, detail = results[index]
+            if status == FAILED:
+                success = False
+                logger.error(f"File movement error: {detail}")
+            elif status == DONE:
+                current_batch.append(detail)
+            if plan_move:
+                plan_move.status = status
+                plan_move.error = detail if status == FAILED else None
+        if cancelled:
+            raise cancelled
+        logger.info(f"Moved {len(current_batch)} files in {len(shards)} shards ({skipped} skipped up front)")
+        return success
+
+    def resume_plan(self, progress: ProgressTracker = None) -> bool:
+        """Apply whatever is left of this folder's saved plan, if any.
+
+        Returns False when there is no saved plan.
+        """
+        plan = Plan.load_for(self.base_path)
+        if not plan:
+            return False
+        left = plan.reconcile(self.normalize_path)
+        logger.info(f"Resuming saved plan: {left} moves outstanding")
+        return self.move_files(plan, progress)
+
+    def apply_plan_file(self, path, progress: ProgressTracker = None) -> bool:
+        """Apply an exported NDJSON plan file, streaming it one move at a time"""
+        header = read_plan_header(path)
+        if header.get('base_path') and Path(header['base_path']).resolve() != Path(self.base_path).resolve():
+            logger.warning(f"Plan was made for {header['base_path']}, applying to {self.base_path}")
+        return self.move_files(iter_plan_file(path), progress)
+
+    def stage_plan(self, organization) -> ShadowStage:
+        """Build a hard-linked shadow tree of the planned layout for inspection.
+
+        organization is a suggestion dict or a Plan. Nothing in the folder
+        changes until commit_stage(); stage.rollback() discards it.
+        """
+        if isinstance(organization, Plan):
+            moves = organization.to_suggestion()
+        else:
+            moves = organization
+        stage = ShadowStage(self.base_path)
+        stage.build(suggestion_moves(moves), self.normalize_path)
+        return stage
+
+    def commit_stage(self, stage: ShadowStage) -> None:
+        """Swap a staged layout into place; undo_last_move() swaps it back"""
+        stage.commit()
+        self.move_history.append(stage)
 
     def remove_empty_folders(self, path: Path) -> None:
         """Recursively remove empty folders from deepest level up"""
@@ -365,6 +1479,11 @@ class FileOrganizer:
                 path = path.parent
         return folders
 
+    @staticmethod
+    def learnable(moves: List[Dict]) -> List[Dict]:
+        """Moves the classifier trains on: the model's, not its own or other local placements"""
+        return [move for move in moves if move.get('source') != SOURCE_LOCAL]
+
     def undo_last_move(self) -> bool:
         """Undo the last batch of file movements and clean up empty folders"""
         try:
@@ -373,23 +1492,35 @@ class FileOrganizer:
                 return False
 
             last_moves = self.move_history.pop()
+            if isinstance(last_moves, ShadowStage):
+                return last_moves.undo()
             
             # Get all folders that were created
             created_folders = self.get_created_folders(last_moves)
             
             # First move all files back
-            for move in reversed(last_moves):
-                old_path = Path(move['to'])
-                new_path = Path(move['from'])
-                
-                if old_path.exists():
-                    # Ensure parent directory exists
-                    new_path.parent.mkdir(parents=True, exist_ok=True)
-                    shutil.move(str(old_path), str(new_path))
-                    logger.info(f"Undid move: {old_path} back to {new_path}")
-                else:
-                    logger.error(f"Cannot undo - file not found: {old_path}")
-                    return False
+            undone = []
+            try:
+                with MoveExecutor() as executor:
+                    for move in reversed(last_moves):
+                        old_path = move['to']
+                        new_path = move['from']
+
+                        try:
+                            executor.move(old_path, new_path)
+                            undone.append(move)
+                            logger.info(f"Undid move: {old_path} back to {new_path}")
+                        except FileNotFoundError:
+                            logger.error(f"Cannot undo - file not found: {old_path}")
+                            return False
+                        except FileExistsError:
+                            logger.error(f"Cannot undo - original location is occupied: {new_path}")
+                            return False
+            finally:
+                # An undone move was not an accepted placement after all
+                if id(last_moves) in self.learned_batches:
+                    self.learned_batches.discard(id(last_moves))
+                    get_classifier().forget_moves(self.learnable(undone), self.base_path)
             
             # Clean up each created folder
             for folder in sorted(created_folders, key=lambda x: len(str(x)), reverse=True):
@@ -401,6 +1532,33 @@ class FileOrganizer:
             logger.error(f"Undo error: {str(e)}")
             return False
 
+# Set in shard worker processes: the run's cancellation event
+_shard_stop = None
+
+def init_shard_worker(stop) -> None:
+    global _shard_stop
+    _shard_stop = stop
+
+def move_shard(base_path: str, items: List[Dict]) -> List[tuple]:
+    """Process-pool worker: apply one shard of moves.
+
+    Returns (status, history record or error) per attempted move; stops
+    at the first OS error or when the run is cancelled.
+    """
+    organizer = FileOrganizer(Path(base_path))
+    outcomes = []
+    moved_files = set()
+    with MoveExecutor() as executor:
+        for item in items:
+            if _shard_stop is not None and _shard_stop.is_set():
+                break
+            try:
+                outcomes.append(organizer.move_item(executor, item, moved_files))
+            except OSError as e:
+                outcomes.append((FAILED, str(e)))
+                break
+    return outcomes
+
 def get_user_confirmation(prompt: str) -> bool:
     """Get user confirmation with Y/N prompt"""
     while True:
@@ -409,6 +1567,34 @@ def get_user_confirmation(prompt: str) -> bool:
             return response == 'y'
         print("Please enter Y or N")
 
+def print_progress(snapshot: Dict) -> None:
+    """Progress callback for the CLI: rewrite a single status line"""
+    print(f"\r{describe(snapshot)}", end='', flush=True)
+
+def print_suggestion(suggestion: Dict, limit: int = 20) -> None:
+    """Print a suggestion one move per line, showing at most limit moves per category"""
+    for category, items in suggestion.items():
+        print(f"\n{category} ({len(items)} moves)")
+        for item in items[:limit]:
+            if isinstance(item, dict):
+                print(f"  {item.get('original_path')} -> {item.get('new_path')}")
+        if len(items) > limit:
+            print(f"  ... and {len(items) - limit} more")
+
+def export_suggestion(suggestion: Dict, path: str, base_path: Path = None) -> int:
+    """Write a suggestion to an NDJSON plan file (gzip-compressed if path ends in .gz)"""
+    with PlanWriter(path, base_path) as writer:
+        writer.write_all(suggestion_moves(suggestion))
+    return writer.count
+
+def apply_plan_file(plan_path: str, folder_path: str) -> None:
+    """Non-interactive: apply an exported plan file to a folder"""
+    file_organizer = FileOrganizer(Path(folder_path))
+    if file_organizer.apply_plan_file(plan_path, ProgressTracker("Moving", print_progress)):
+        print("\nFiles organized successfully!")
+    else:
+        print("\nSome moves failed, see the log for details")
+
 def organize():
     """Interactive file organization script"""
     try:
@@ -420,9 +1606,27 @@ def organize():
             print("Invalid directory path!")
             return
 
+        # Offer to finish a plan that was interrupted last time
+        saved_plan = Plan.load_for(base_path)
+        if saved_plan:
+            left = saved_plan.reconcile(FileOrganizer(base_path).normalize_path)
+            if left and get_user_confirmation(f"A previous plan has {left} moves left. Resume it?"):
+                if FileOrganizer(base_path).move_files(saved_plan, ProgressTracker("Moving", print_progress)):
+                    print("\nPrevious plan finished.")
+                else:
+                    print("\nSome moves failed; run again to retry them.")
+                return
+            if not left:
+                saved_plan.discard()
+
+        subtree_mode = get_user_confirmation("Include subfolders and organize each one separately?")
+
         # Scan directory
         scanner = FileScanner(base_path)
-        files_data = scanner.scan()
+        files_data = scanner.scan(recursive=subtree_mode, progress=ProgressTracker("Scanning", print_progress))
+        print()
+        if scanner.ignore and (scanner.ignore.pruned_dirs or scanner.ignore.ignored_files):
+            print(f"Skipped by exclusion rules: {scanner.ignore.summary()}")
         
         if not files_data:
             print("No files found in the specified directory.")
@@ -431,34 +1635,55 @@ def organize():
         # Show files and get confirmation
         print("\nFiles and folders in the directory:")
         for item in files_data:
-            type_str = f"[{item['category'].upper()}]"
-            print(f"{type_str:12} {item['path']}")
+            type_str = f"[{item.category.upper()}]"
+            print(f"{type_str:12} {item.path}")
         
+        organizer = AIOrganizer()
+        estimate = organizer.preflight(files_data)
+        print(f"\nPreflight estimate: {describe_estimate(estimate)}")
+
         if not get_user_confirmation("\nDo you want to organize these files?"):
             print("Operation cancelled.")
             return
 
+        def suggest(files_data, estimate=None):
+            tracker = ProgressTracker("Generating", print_progress)
+            if subtree_mode:
+                return organizer.get_subtree_suggestion(files_data, progress=tracker)
+            return organizer.get_batched_suggestion(files_data, progress=tracker, estimate=estimate)
+
         # Get AI suggestion
         print("\nGenerating organization suggestion...")
-        organizer = AIOrganizer()
-        suggestion = organizer.get_suggestion(files_data)
+        suggestion = suggest(files_data, estimate)
+        print()
         
         file_organizer = FileOrganizer(base_path)
         while True:
             # Show suggestion
             print("\nSuggested organization:")
-            print(json.dumps(suggestion, indent=2))
+            print_suggestion(suggestion)
             
             print("\nOptions:")
             print("1. Apply changes")
             print("2. Modify suggestion")
             print("3. Undo last change")
             print("4. Cancel")
+            print("5. Use local date/tag layout (no AI)")
+            print("6. Export plan to a file")
+            print("7. Stage changes for inspection (hard links, nothing moves yet)")
             
-            choice = input("\nEnter your choice (1-4): ").strip()
+            choice = input("\nEnter your choice (1-7): ").strip()
             
             if choice == '1':
-                if file_organizer.move_files(suggestion):
+                plan = Plan.from_suggestion(base_path, suggestion)
+                plan.save()
+                try:
+                    moved = file_organizer.move_files(plan, ProgressTracker("Moving", print_progress))
+                except (OperationCancelled, KeyboardInterrupt):
+                    print("\nMoving cancelled; files moved so far can be undone, or run again to resume.")
+                    continue
+                print()
+                if moved:
                     print("Files organized successfully!")
                     break
             elif choice == '2':
@@ -469,13 +1694,39 @@ def organize():
                 if file_organizer.undo_last_move():
                     print("Last change undone successfully!")
                     # Refresh files_data after undo
-                    files_data = scanner.scan()
-                    suggestion = organizer.get_suggestion(files_data)
+                    files_data = scanner.scan(recursive=subtree_mode)
+                    suggestion = suggest(files_data)
                 else:
                     print("No changes to undo or undo failed")
             elif choice == '4':
                 print("Operation cancelled.")
                 break
+            elif choice == '5':
+                if not scanner.extract_metadata:
+                    print("\nReading file metadata...")
+                    scanner.apply_metadata(files_data)
+                suggestion = create_date_layout(files_data)
+            elif choice == '6':
+                export_path = input("Plan file (.ndjson, or .ndjson.gz to compress): ").strip()
+                try:
+                    count = export_suggestion(suggestion, export_path, base_path)
+                    print(f"Wrote {count} moves to {export_path}")
+                    print(f"Apply it later with: python {Path(sys.argv[0]).name} --apply-plan {export_path} {folder_path}")
+                except OSError as e:
+                    print(f"Could not write plan: {str(e)}")
+            elif choice == '7':
+                try:
+                    stage = file_organizer.stage_plan(suggestion)
+                    print(f"\nStaged {stage.moved} moves in {stage.shadow_path}")
+                    print("Browse it now; the folder itself has not changed.")
+                    if get_user_confirmation("Swap the staged layout into place?"):
+                        file_organizer.commit_stage(stage)
+                        print(f"Done. The previous layout is kept in {stage.previous_path} until the next commit.")
+                        break
+                    stage.rollback()
+                    print("Staged layout discarded.")
+                except StagingError as e:
+                    print(f"Staging failed: {str(e)}")
             else:
                 print("Invalid choice, please try again")
 
@@ -484,4 +1735,10 @@ def organize():
         print(f"An error occurred: {str(e)}")
 
 if __name__ == '__main__':
-    organize()
\ No newline at end of file
+    if len(sys.argv) == 4 and sys.argv[1] == '--apply-plan':
+        apply_plan_file(sys.argv[2], sys.argv[3])
+    elif len(sys.argv) == 2 and sys.argv[1] == '--model-stats':
+        for line in get_reply_stats().report() or ["No requests recorded yet"]:
+            print(line)
+    else:
+        organize()
\ No newline at end of file
@@ -3,9 +3,18 @@ from ttkbootstrap import Style, ttk
 from tkinter import filedialog, messagebox
 from pathlib import Path
 import json
-from file_organizer import FileScanner, AIOrganizer, FileOrganizer
+from file_organizer import FileScanner, AIOrganizer, FileOrganizer, create_date_layout, export_suggestion
+from preflight import describe_estimate
+from jobs import READY, UNDONE, JobQueue
+from request_scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE
+from progress import CancelToken, OperationCancelled, ProgressTracker, describe
+from plan import Plan, iter_plan_file, read_plan_header
+from search_index import SearchIndex, group_matches
+from ui_events import MessagePump, sync_tree
 import threading
-import queue
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+import logging
 import os
 import requests
 import sys
@@ -15,6 +24,11 @@ if sys.platform.startswith('win'):
     import ctypes
     ctypes.windll.user32.ShowWindow(ctypes.windll.kernel32.GetConsoleWindow(), 0)
 
+logger = logging.getLogger(__name__)
+
+# Joins the two paths of a planned move in the preview's search text
+SEARCH_SEPARATOR = ' -> '
+
 class FileOrganizerGUI:
     def __init__(self, root):
         self.style = Style(theme='darkly')  # Use modern dark theme
@@ -27,19 +41,41 @@ class FileOrganizerGUI:
         self.files_data = None
         self.current_suggestion = None
         self.file_organizer = None
-        self.message_queue = queue.Queue()
+        # Workers post (message, data) here; the UI wakes only when something arrives
+        self.message_queue = MessagePump(root, self.handle_messages)
         self.apply_button = None
         self.undo_button = None
         self.generate_button = None
         self.file_tree = None
         self.preview_tree = None
+        # Speculative suggestion generated in the background after a scan
+        self.prefetch_executor = ThreadPoolExecutor(max_workers=1)
+        self.prefetch = None  # (scan key, Future, CancelToken)
+        self.cancel_token = None  # Token of the running scan/generate/apply operation
+        # Suggestions returned at the deadline can be replaced by the model's
+        # full answer; only the latest request's answer is used
+        self.refine_id = 0
+        # Filter box lookups; the file index is built once per scan
+        self.file_index = None
+        self.preview_entries = []  # (folder, file name, moved by local model, original path)
+        self.preview_index = None
+        self.filter_job = None
+        # What the trees show, so updates only touch the rows that changed
+        self.file_nodes = {}
+        self.preview_nodes = {}
+        # Folders scanned and planned in the background, shown in the jobs window
+        self.job_queue = JobQueue(on_update=lambda job: self.message_queue.put(("job", job.id)))
+        self.jobs_window = None
+        self.jobs_tree = None
+        # Job loaded by review_job; its moves and undo go through the queue
+        self.reviewing = None
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
         # Change config file location to user's home directory
         self.config_file = Path.home() / '.file_organizer_config.json'
         self.load_config()
         
         self.setup_styles()
         self.create_widgets()
-        self.check_messages()
 
     def setup_styles(self):
         # Configure custom styles
@@ -99,7 +135,42 @@ class FileOrganizerGUI:
         browse_btn = ttk.Button(folder_frame, text="Browse", 
                               command=self.browse_folder, style='Primary.TButton')
         browse_btn.grid(row=0, column=1, padx=5)
+
+        # Organize each subfolder on its own and merge the categories afterwards
+        self.subtree_mode = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            folder_frame,
+            text="Organize subfolders separately",
+            variable=self.subtree_mode,
+            command=self.scan_directory
+        ).grid(row=0, column=2, padx=5)
+
+        # Read file headers to catch misnamed and extensionless files
+        self.sniff_content = tk.BooleanVar(value=bool(os.getenv('SNIFF_CONTENT')))
+        ttk.Checkbutton(
+            folder_frame,
+            text="Detect types from content",
+            variable=self.sniff_content,
+            command=self.scan_directory
+        ).grid(row=0, column=3, padx=5)
+
+        # Capture dates, audio tags and document properties for the prompt
+        self.extract_metadata = tk.BooleanVar(value=bool(os.getenv('EXTRACT_METADATA')))
+        ttk.Checkbutton(
+            folder_frame,
+            text="Read dates and tags",
+            variable=self.extract_metadata,
+            command=self.scan_directory
+        ).grid(row=0, column=4, padx=5)
         
+        # Narrow both trees to matching files as you type
+        ttk.Label(folder_frame, text="Filter:").grid(row=1, column=0, sticky="w", pady=(10, 0))
+        self.filter_var = tk.StringVar()
+        self.filter_var.trace_add('write', self.schedule_filter)
+        filter_entry = ttk.Entry(folder_frame, textvariable=self.filter_var)
+        filter_entry.grid(row=1, column=0, columnspan=5, sticky="ew", padx=(50, 0), pady=(10, 0))
+        filter_entry.bind('<Escape>', lambda e: self.filter_var.set(''))
+
         # Remove or comment out the scan button since it's no longer needed
         # scan_btn = ttk.Button(folder_frame, text="Scan Directory", 
         #                     command=self.scan_directory, style='Success.TButton')
@@ -156,7 +227,7 @@ class FileOrganizerGUI:
         self.preview_tree.heading('#0', text='Name')  # Changed from 'New Location'
         self.preview_tree.heading('Action', text='Action')
         self.preview_tree.column('#0', width=400)  # Made wider for better visibility
-        self.preview_tree.column('Action', width=80)
+        self.preview_tree.column('Action', width=110)
         self.preview_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         
         # Configure scrollbar
@@ -202,13 +273,60 @@ class FileOrganizerGUI:
             state='disabled'
         )
         self.undo_button.pack(side=tk.LEFT, padx=5)
+        
+        ttk.Button(
+            btn_frame,
+            text="📅 Date/Tag Layout",
+            style='Primary.TButton',
+            command=self.local_date_layout
+        ).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Button(
+            btn_frame,
+            text="🔍 Stage",
+            style='Primary.TButton',
+            command=self.stage_changes
+        ).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Button(
+            btn_frame,
+            text="💾 Export Plan",
+            style='Primary.TButton',
+            command=self.export_plan
+        ).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Button(
+            btn_frame,
+            text="📂 Apply Plan File",
+            style='Primary.TButton',
+            command=self.import_plan
+        ).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Button(
+            btn_frame,
+            text="🗂 Jobs",
+            style='Primary.TButton',
+            command=self.show_jobs_window
+        ).pack(side=tk.LEFT, padx=5)
 
         # Status bar with progress indication
         status_frame = ttk.Frame(main_frame)
         status_frame.grid(row=5, column=0, columnspan=2, sticky="ew", pady=(10, 0))
         
-        self.progress = ttk.Progressbar(status_frame, mode='indeterminate')
-        self.progress.pack(fill=tk.X, pady=(0, 5))
+        progress_row = ttk.Frame(status_frame)
+        progress_row.pack(fill=tk.X, pady=(0, 5))
+        
+        self.progress = ttk.Progressbar(progress_row, mode='indeterminate')
+        self.progress.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        self.cancel_button = ttk.Button(
+            progress_row,
+            text="✕ Cancel",
+            style='Warning.TButton',
+            command=self.cancel_operation,
+            state='disabled'
+        )
+        self.cancel_button.pack(side=tk.RIGHT, padx=(5, 0))
         
         self.status_var = tk.StringVar(value="Ready")
         status_bar = ttk.Label(status_frame, textvariable=self.status_var)
@@ -233,6 +351,7 @@ class FileOrganizerGUI:
             messagebox.showerror("Error", "Please select a directory first")
             return
 
+        self.end_review()
         self.base_path = Path(path)
         if not self.base_path.exists():
             messagebox.showerror("Error", "Selected directory does not exist")
@@ -241,11 +360,28 @@ class FileOrganizerGUI:
         self.status_var.set("Scanning directory...")
         self.root.update()
 
+        tracker = self.start_tracker("Scanning")
+
         def scan_task():
             try:
-                scanner = FileScanner(self.base_path)
-                self.files_data = scanner.scan()
-                self.message_queue.put(("scan_complete", None))
+                scanner = FileScanner(
+                    self.base_path,
+                    sniff_content=self.sniff_content.get(),
+                    extract_metadata=self.extract_metadata.get()
+                )
+                files_data = scanner.scan(recursive=self.subtree_mode.get(), progress=tracker)
+                self.file_index = SearchIndex(item.path for item in files_data)
+                self.files_data = files_data
+                status = f"Scanned {len(files_data)} items"
+                if scanner.ignore and (scanner.ignore.pruned_dirs or scanner.ignore.ignored_files):
+                    status += f"; {scanner.ignore.summary()}"
+                try:
+                    status += f". Organizing: {describe_estimate(AIOrganizer().preflight(files_data))}"
+                except Exception as e:
+                    logger.warning(f"Preflight estimate failed: {str(e)}")
+                self.message_queue.put(("scan_complete", status))
+            except OperationCancelled:
+                self.message_queue.put(("cancelled", "Scan cancelled"))
             except Exception as e:
                 self.message_queue.put(("error", str(e)))
 
@@ -253,56 +389,124 @@ class FileOrganizerGUI:
         self.status_var.set("Scanning directory...")
         threading.Thread(target=scan_task, daemon=True).start()
 
-    def check_messages(self):
-        try:
-            while True:
-                message, data = self.message_queue.get_nowait()
-                if message in ["scan_complete", "suggestion_complete"]:
-                    self.progress.stop()
-                if message == "scan_complete":
-                    self.update_file_list()
-                    self.generate_button.configure(state='normal')
-                elif message == "suggestion_complete":
-                    # Ensure UI updates happen in the main thread
-                    self.root.after(0, self.update_suggestion_display)
-                    self.root.after(0, lambda: self.apply_button.configure(state='normal'))
-                    self.root.after(0, lambda: self.generate_button.configure(state='normal'))
-                elif message == "success":
+    def start_tracker(self, operation: str) -> ProgressTracker:
+        """Create a progress tracker for a worker that reports through message_queue"""
+        self.cancel_token = CancelToken()
+        self.cancel_button.configure(state='normal')
+        return ProgressTracker(
+            operation,
+            callback=lambda snapshot: self.message_queue.put(("progress", snapshot)),
+            cancel_token=self.cancel_token
+        )
+
+    def cancel_operation(self):
+        if self.cancel_token:
+            self.cancel_token.cancel()
+            self.status_var.set("Cancelling...")
+            self.cancel_button.configure(state='disabled')
+
+    def show_progress(self, snapshot):
+        """Switch the progress bar to determinate mode once totals are known"""
+        if snapshot['fraction'] is not None:
+            if str(self.progress.cget('mode')) != 'determinate':
+                self.progress.stop()
+                self.progress.configure(mode='determinate', maximum=100)
+            self.progress.configure(value=snapshot['fraction'] * 100)
+        self.status_var.set(describe(snapshot))
+
+    def finish_operation(self):
+        self.progress.stop()
+        self.progress.configure(mode='indeterminate', value=0)
+        self.cancel_button.configure(state='disabled')
+        self.cancel_token = None
+
+    def handle_messages(self, messages):
+        """Apply a coalesced burst of worker messages (runs on the UI thread)"""
+        for message, data in messages:
+            if message == "progress":
+                self.show_progress(data)
+                continue
+            if message == "job":
+                self.update_job_row(data)
+                if self.reviewing and self.reviewing.id == data:
+                    self.update_review()
+                continue
+            if message in ["scan_complete", "suggestion_complete", "staged", "success", "error", "cancelled"]:
+                self.finish_operation()
+            if message == "scan_complete":
+                self.update_file_list()
+                self.generate_button.configure(state='normal')
+                self.offer_plan_resume()
+                self.start_prefetch()
+                if data:
+                    self.status_var.set(data)
+                    continue
+            elif message == "suggestion_complete":
+                self.update_suggestion_display()
+                self.apply_button.configure(state='normal')
+                self.generate_button.configure(state='normal')
+            elif message == "refined":
+                request_id, suggestion = data
+                if request_id == self.refine_id:
+                    self.current_suggestion = suggestion
+                    self.update_suggestion_display()
+                    self.status_var.set("Suggestion updated with the model's complete answer")
+                continue
+            elif message == "staged":
+                self.review_stage(data)
+            elif message == "success":
+                self.undo_button.configure(state='normal')
+            elif message == "error":
+                messagebox.showerror("Error", data)
+                self.generate_button.configure(state='normal')
+            elif message == "cancelled":
+                self.generate_button.configure(state='normal')
+                if self.file_organizer and self.file_organizer.move_history:
                     self.undo_button.configure(state='normal')
-                elif message == "error":
-                    messagebox.showerror("Error", data)
-                    self.generate_button.configure(state='normal')
-                self.status_var.set("Ready")
-        except queue.Empty:
-            pass
-        finally:
-            self.root.after(100, self.check_messages)
+                self.status_var.set(data or "Cancelled")
+                continue
+            self.status_var.set("Ready")
+
+    def schedule_filter(self, *args):
+        """Re-filter shortly after typing pauses rather than on every keystroke"""
+        if self.filter_job:
+            self.root.after_cancel(self.filter_job)
+        self.filter_job = self.root.after(150, self.apply_filter)
+
+    def apply_filter(self):
+        self.filter_job = None
+        if self.files_data is not None:
+            self.update_file_list()
+        self.render_preview()
+        query = self.filter_var.get().strip()
+        if query and self.file_index is not None:
+            shown = len(self.filter_matches(self.file_index))
+            self.status_var.set(f"{shown} of {len(self.file_index)} files match \"{query}\"")
+        elif not query:
+            self.status_var.set("Ready")
+
+    def filter_matches(self, index: SearchIndex):
+        """Ids matching the filter box, or None when it is empty"""
+        query = self.filter_var.get().strip()
+        if not query or index is None:
+            return None
+        return index.search(query)
 
     def update_file_list(self):
-        """Update the file TreeView with current files"""
-        self.file_tree.delete(*self.file_tree.get_children())
-        
-        # Group files by category
+        """Update the file TreeView with current files (those matching the filter)"""
+        matches = self.filter_matches(self.file_index)
+        items = self.files_data if matches is None else [self.files_data[i] for i in sorted(matches)]
+
+        # Group files by category, with just filenames
         categories = {}
-        for item in self.files_data:
-            category = item['category'].upper()
+        for item in items:
+            category = item.category.upper()
             if category not in categories:
                 categories[category] = []
-            categories[category].append(item)
+            categories[category].append((item.path, Path(item.path).name, (item.type,)))
         
-        # Add items to tree with just filenames
-        for category, items in categories.items():
-            category_node = self.file_tree.insert('', 'end', text=category, 
-                                                values=('', ), 
-                                                tags=('category',))
-            for item in items:
-                filename = Path(item['path']).name  # Get just the filename
-                self.file_tree.insert(category_node, 'end', 
-                                    text=filename,
-                                    values=(item['type'],),
-                                    tags=('file',))
-            # Auto expand category
-            self.file_tree.item(category_node, open=True)
+        # Only rows that appeared, disappeared or changed touch the tree
+        sync_tree(self.file_tree, categories, self.file_nodes, 'category', 'file')
         
         # Configure tag appearance
         self.file_tree.tag_configure('category', 
@@ -313,31 +517,32 @@ class FileOrganizerGUI:
 
     def update_suggestion_display(self):
         """Update the preview TreeView with suggested changes"""
-        self.preview_tree.delete(*self.preview_tree.get_children())
-        if not self.current_suggestion:
-            return
-            
-        # Group by target folders
-        folders = {}
-        for category, items in self.current_suggestion.items():
+        self.preview_entries = []
+        searchable = []
+        for category, items in (self.current_suggestion or {}).items():
             for item in items:
-                folder = str(Path(item['new_path']).parent)
-                if folder not in folders:
-                    folders[folder] = []
-                folders[folder].append({
-                    'name': Path(item['new_path']).name  # Store just the filename
-                })
-        
-        # Add items to tree with just filenames
-        for folder, items in folders.items():
-            folder_node = self.preview_tree.insert('', 'end', text=folder,
-                                                 values=('',), 
-                                                 tags=('folder',))
-            for item in items:
-                self.preview_tree.insert(folder_node, 'end',
-                                       text=item['name'],
-                                       values=('→ Move',),
-                                       tags=('move',))
+                new_path = Path(item['new_path'])
+                self.preview_entries.append((str(new_path.parent), new_path.name, item.get('source') == 'local',
+                                             item['original_path']))
+                # Match on where a file goes and where it comes from
+                searchable.append(f"{item['original_path']}{SEARCH_SEPARATOR}{item['new_path']}")
+        self.preview_index = SearchIndex(searchable)
+        self.render_preview()
+
+    def render_preview(self):
+        """Fill the preview TreeView with the planned moves matching the filter"""
+        matches = self.filter_matches(self.preview_index)
+        ids = range(len(self.preview_entries)) if matches is None else sorted(matches)
+        # Group by target folders, with just filenames
+        folders = {}
+        for folder, entry_ids in group_matches(ids, [entry[0] for entry in self.preview_entries]).items():
+            rows = folders[folder] = []
+            for entry_id in entry_ids:
+                _, name, local, original_path = self.preview_entries[entry_id]
+                rows.append(((original_path, name), name, ('→ Move (local)' if local else '→ Move',)))
+
+        # A refined or modified suggestion only changes the rows that differ
+        sync_tree(self.preview_tree, folders, self.preview_nodes, 'folder', 'move')
         
         # Configure tag appearance
         self.preview_tree.tag_configure('folder', 
@@ -345,34 +550,135 @@ class FileOrganizerGUI:
                                       background='#1e1e1e')
         self.preview_tree.tag_configure('move',
                                       font=('Segoe UI', 9))
-        
-        # Expand all folders
-        for item in self.preview_tree.get_children():
-            self.preview_tree.item(item, open=True)
 
     def apply_changes(self):
         if not self.current_suggestion or not self.base_path:
             messagebox.showerror("Error", "No organization suggestion available")
             return
 
-        if not self.file_organizer:
+        if messagebox.askyesno("Confirm", "Apply the suggested organization?"):
+            self.refine_id += 1  # The applied suggestion must not change underneath
+            if self.reviewing:
+                self.apply_review()
+                return
+            plan = Plan.from_suggestion(self.base_path, self.current_suggestion)
+            plan.save()
+            self.apply_plan(plan)
+
+    def stage_changes(self):
+        """Build a hard-linked preview of the suggestion next to the folder"""
+        if not self.current_suggestion or not self.base_path:
+            messagebox.showerror("Error", "No organization suggestion available")
+            return
+        self.end_review()
+        if not self.file_organizer or self.file_organizer.base_path != self.base_path:
             self.file_organizer = FileOrganizer(self.base_path)
 
-        if messagebox.askyesno("Confirm", "Apply the suggested organization?"):
-            self.status_var.set("Applying changes...")
-            self.root.update()
+        self.status_var.set("Staging changes...")
+        self.progress.start()
+        suggestion = self.current_suggestion
+        self.refine_id += 1  # The staged suggestion must not change underneath
 
-            def apply_task():
-                try:
-                    success = self.file_organizer.move_files(self.current_suggestion)
-                    self.message_queue.put(
-                        ("success", "Files organized successfully!") if success 
-                        else ("error", "Failed to organize files")
-                    )
-                except Exception as e:
-                    self.message_queue.put(("error", str(e)))
+        def stage_task():
+            try:
+                self.message_queue.put(("staged", self.file_organizer.stage_plan(suggestion)))
+            except Exception as e:
+                self.message_queue.put(("error", str(e)))
+
+        threading.Thread(target=stage_task, daemon=True).start()
+
+    def review_stage(self, stage):
+        """Let the user inspect a staged layout, then swap it in or discard it"""
+        if messagebox.askyesno(
+            "Staged",
+            f"{stage.moved} moves are staged in:\n{stage.shadow_path}\n\n"
+            "Browse it now; the folder itself has not changed.\n\n"
+            "Swap the staged layout into place? (No discards it)"
+        ):
+            try:
+                self.file_organizer.commit_stage(stage)
+                self.undo_button.configure(state='normal')
+                messagebox.showinfo("Success", "Files organized successfully!")
+            except Exception as e:
+                stage.rollback()
+                messagebox.showerror("Error", f"Could not commit staged layout: {str(e)}")
+        else:
+            stage.rollback()
 
-            threading.Thread(target=apply_task, daemon=True).start()
+    def offer_plan_resume(self):
+        """Offer to finish a plan for this folder that was interrupted earlier"""
+        plan = Plan.load_for(self.base_path)
+        if not plan:
+            return
+        if not self.file_organizer or self.file_organizer.base_path != self.base_path:
+            self.file_organizer = FileOrganizer(self.base_path)
+        left = plan.reconcile(self.file_organizer.normalize_path)
+        if not left:
+            plan.discard()
+        elif messagebox.askyesno("Resume", f"A previous plan for this folder has {left} moves left.\nResume it?"):
+            self.apply_plan(plan)
+
+    def export_plan(self):
+        """Save the current suggestion as an NDJSON plan file"""
+        if not self.current_suggestion:
+            messagebox.showerror("Error", "No organization suggestion available")
+            return
+        path = filedialog.asksaveasfilename(
+            defaultextension='.ndjson',
+            filetypes=[("Plan files", "*.ndjson"), ("Compressed plan files", "*.ndjson.gz")]
+        )
+        if not path:
+            return
+        try:
+            count = export_suggestion(self.current_suggestion, path, self.base_path)
+            self.status_var.set(f"Exported {count} moves to {path}")
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not export plan: {str(e)}")
+
+    def import_plan(self):
+        """Apply an exported plan file to the selected folder, streaming its moves"""
+        if not self.base_path:
+            messagebox.showerror("Error", "Please select a folder first")
+            return
+        path = filedialog.askopenfilename(
+            filetypes=[("Plan files", "*.ndjson *.ndjson.gz"), ("All files", "*.*")]
+        )
+        if not path:
+            return
+        try:
+            header = read_plan_header(path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", f"Could not read plan: {str(e)}")
+            return
+        prompt = f"Apply {Path(path).name} to {self.base_path}?"
+        if header.get('base_path') and Path(header['base_path']).resolve() != Path(self.base_path).resolve():
+            prompt += f"\n\nThe plan was made for {header['base_path']}."
+        if messagebox.askyesno("Confirm", prompt):
+            self.apply_plan(iter_plan_file(path))
+
+    def apply_plan(self, plan):
+        """Apply a persisted plan's outstanding moves (or a stream of moves) in a worker thread"""
+        self.end_review()
+        if not self.file_organizer or self.file_organizer.base_path != self.base_path:
+            self.file_organizer = FileOrganizer(self.base_path)
+
+        self.status_var.set("Applying changes...")
+        self.root.update()
+        tracker = self.start_tracker("Moving")
+
+        def apply_task():
+            try:
+                success = self.file_organizer.move_files(plan, tracker)
+                self.message_queue.put(
+                    ("success", "Files organized successfully!") if success 
+                    else ("error", "Failed to organize files")
+                )
+            except OperationCancelled:
+                self.message_queue.put(("cancelled", "Moving cancelled; moved files can be undone or resumed"))
+            except Exception as e:
+                self.message_queue.put(("error", str(e)))
+
+        threading.Thread(target=apply_task, daemon=True).start()
 
     def show_modify_dialog(self):
         dialog = tk.Toplevel(self.root)
@@ -412,6 +718,8 @@ class FileOrganizerGUI:
         self.generate_button.configure(state='disabled')
         self.apply_button.configure(state='disabled')
         self.root.update()
+        tracker = self.start_tracker("Generating")
+        on_refined = self.refine_callback()
 
         def modify_task():
             try:
@@ -420,7 +728,9 @@ class FileOrganizerGUI:
                 new_suggestion = organizer.get_modified_suggestion(
                     self.files_data, 
                     self.current_suggestion, 
-                    feedback
+                    feedback,
+                    progress=tracker,
+                    on_refined=on_refined
                 )
                 
                 # Only update if we got a valid new suggestion
@@ -429,6 +739,8 @@ class FileOrganizerGUI:
                     self.message_queue.put(("suggestion_complete", None))
                 else:
                     self.message_queue.put(("error", "Failed to generate modified suggestion"))
+            except OperationCancelled:
+                self.message_queue.put(("cancelled", "Generation cancelled"))
             except Exception as e:
                 self.message_queue.put(("error", str(e)))
 
@@ -436,7 +748,33 @@ class FileOrganizerGUI:
         thread = threading.Thread(target=modify_task, daemon=True)
         thread.start()
 
+    def local_date_layout(self):
+        """Build a suggestion from file metadata only, without calling the API"""
+        if not self.files_data:
+            messagebox.showerror("Error", "Please scan a directory first")
+            return
+
+        self.status_var.set("Reading file metadata...")
+        self.progress.start()
+        self.refine_id += 1
+        files_data = self.files_data
+
+        def layout_task():
+            try:
+                if any(not f.is_folder and f.meta is None for f in files_data):
+                    FileScanner(self.base_path).apply_metadata(files_data)
+                self.current_suggestion = create_date_layout(files_data)
+                self.message_queue.put(("suggestion_complete", None))
+            except Exception as e:
+                self.message_queue.put(("error", str(e)))
+
+        threading.Thread(target=layout_task, daemon=True).start()
+
     def undo_changes(self):
+        if self.reviewing:
+            if not self.job_queue.undo(self.reviewing):
+                messagebox.showinfo("Jobs", f"{self.reviewing.base_path.name} is {self.reviewing.status}; nothing to undo")
+            return
         if not self.file_organizer:
             messagebox.showerror("Error", "No changes to undo")
             return
@@ -455,6 +793,27 @@ class FileOrganizerGUI:
             messagebox.showerror("Error", "Please scan a directory first")
             return
 
+        # Reuse a suggestion prefetched for exactly this scan, if there is one
+        if self.prefetch and self.prefetch[0] == self.scan_key():
+            future = self.prefetch[1]
+            self.prefetch = None  # Only reuse once; later clicks regenerate
+            self.refine_id += 1
+            self.status_var.set(
+                "Using prefetched suggestion..." if future.done() else "Waiting for prefetched suggestion..."
+            )
+            self.progress.start()
+            self.generate_button.configure(state='disabled')
+
+            def prefetch_task():
+                try:
+                    self.current_suggestion = future.result()
+                    self.message_queue.put(("suggestion_complete", None))
+                except Exception as e:
+                    self.message_queue.put(("error", str(e)))
+
+            threading.Thread(target=prefetch_task, daemon=True).start()
+            return
+
         # More thorough API settings check
         if not all([
             os.getenv('API_KEY'),
@@ -483,16 +842,69 @@ class FileOrganizerGUI:
         self.progress.start()
         self.generate_button.configure(state='disabled')
 
+        files_data = self.files_data
+        subtree_mode = self.subtree_mode.get()
+        tracker = self.start_tracker("Generating")
+        on_refined = self.refine_callback()
+
         def generate_task():
             try:
-                organizer = AIOrganizer()
-                self.current_suggestion = organizer.get_suggestion(self.files_data)
+                self.current_suggestion = self.build_suggestion(files_data, subtree_mode, progress=tracker,
+                                                                on_refined=on_refined)
                 self.message_queue.put(("suggestion_complete", None))
+            except OperationCancelled:
+                self.message_queue.put(("cancelled", "Generation cancelled"))
             except Exception as e:
                 self.message_queue.put(("error", str(e)))
 
         threading.Thread(target=generate_task, daemon=True).start()
 
+    def build_suggestion(self, files_data, subtree_mode: bool, priority: int = PRIORITY_INTERACTIVE,
+                         progress: ProgressTracker = None, on_refined=None) -> dict:
+        """Request a suggestion for the given scan (runs in a worker thread)"""
+        organizer = AIOrganizer(priority=priority)
+        if subtree_mode:
+            return organizer.get_subtree_suggestion(files_data, progress=progress)
+        return organizer.get_batched_suggestion(files_data, progress=progress, on_refined=on_refined)
+
+    def refine_callback(self):
+        """on_refined callback for a new request; supersedes earlier requests'"""
+        self.refine_id += 1
+        request_id = self.refine_id
+        return lambda suggestion: self.message_queue.put(("refined", (request_id, suggestion)))
+
+    def scan_key(self):
+        """Identify the current scan so prefetched suggestions are only reused for it"""
+        if not self.files_data:
+            return None
+        return (str(self.base_path), self.subtree_mode.get(), tuple(f.path for f in self.files_data))
+
+    def start_prefetch(self):
+        """Start generating a suggestion in the background if speculative mode is on.
+
+        A prefetch for an earlier scan is cancelled (dropped if still queued,
+        stopped at its next progress check if running); one already running
+        for the same scan is kept.
+        """
+        key = self.scan_key()
+        if self.prefetch:
+            old_key, old_future, old_token = self.prefetch
+            if old_key == key and not old_future.done():
+                return
+            old_future.cancel()
+            old_token.cancel()
+            self.prefetch = None
+        if not os.getenv('SPECULATIVE_PREFETCH') or not self.files_data:
+            return
+        if not all([os.getenv('API_KEY'), os.getenv('ENDPOINT'), os.getenv('MODEL_NAME')]):
+            return
+        token = CancelToken()
+        future = self.prefetch_executor.submit(
+            self.build_suggestion, self.files_data, self.subtree_mode.get(), PRIORITY_BATCH,
+            ProgressTracker("Prefetching", cancel_token=token)
+        )
+        self.prefetch = (key, future, token)
+
     def test_api_connection(self, api_key: str, endpoint: str, model_name: str) -> tuple[bool, str]:
         """Test if the API connection works with given credentials"""
         if not api_key or not endpoint or not model_name:
@@ -545,7 +957,7 @@ class FileOrganizerGUI:
         except Exception as e:
             return False, f"Unexpected error: {str(e)}\nPlease check your settings and try again"
 
-    def save_settings(self, dialog, api_key: str, endpoint: str, model_name: str):
+    def save_settings(self, dialog, api_key: str, endpoint: str, model_name: str, speculative: bool = False):
         """Save settings after validation"""
         self.status_var.set("Testing API connection...")
         self.root.update()
@@ -553,11 +965,17 @@ class FileOrganizerGUI:
         success, message = self.test_api_connection(api_key, endpoint, model_name)
         if success:
             try:
-                config = {
+                # Keep settings that are only edited in the file (EXTRA_ENDPOINTS, ...)
+                config = {}
+                if self.config_file.exists():
+                    with open(self.config_file, 'r') as f:
+                        config = json.load(f)
+                config.update({
                     'API_KEY': api_key,
                     'ENDPOINT': endpoint.rstrip('/'),  # Remove trailing slash
-                    'MODEL_NAME': model_name
-                }
+                    'MODEL_NAME': model_name,
+                    'SPECULATIVE_PREFETCH': speculative
+                })
                 with open(self.config_file, 'w') as f:
                     json.dump(config, f, indent=4)
                 
@@ -565,6 +983,7 @@ class FileOrganizerGUI:
                 os.environ['API_KEY'] = api_key
                 os.environ['ENDPOINT'] = endpoint.rstrip('/')
                 os.environ['MODEL_NAME'] = model_name
+                os.environ['SPECULATIVE_PREFETCH'] = '1' if speculative else ''
                 
                 messagebox.showinfo("Success", "Settings saved successfully!")
                 dialog.destroy()
@@ -584,6 +1003,19 @@ class FileOrganizerGUI:
                     os.environ['API_KEY'] = config.get('API_KEY', '')
                     os.environ['ENDPOINT'] = config.get('ENDPOINT', '')
                     os.environ['MODEL_NAME'] = config.get('MODEL_NAME', '')
+                    os.environ['SPECULATIVE_PREFETCH'] = '1' if config.get('SPECULATIVE_PREFETCH') else ''
+                    # Optional backup endpoints for hedged requests (edit the file directly)
+                    if config.get('EXTRA_ENDPOINTS'):
+                        os.environ['EXTRA_ENDPOINTS'] = json.dumps(config['EXTRA_ENDPOINTS'])
+                    # Optional latency budget, per-request timeout and run target (seconds), reply size cap,
+                    # background job workers
+                    for key in ('SUGGESTION_DEADLINE', 'REQUEST_TIMEOUT', 'TARGET_DURATION', 'MAX_COMPLETION_TOKENS',
+                                'JOB_WORKERS'):
+                        if config.get(key):
+                            os.environ[key] = str(config[key])
+                    # Set to false for endpoints that mishandle response_format
+                    if 'STRUCTURED_OUTPUT' in config:
+                        os.environ['STRUCTURED_OUTPUT'] = '1' if config['STRUCTURED_OUTPUT'] else '0'
             else:
                 # Create empty config if it doesn't exist
                 self.save_settings('', '', '')
@@ -594,7 +1026,7 @@ class FileOrganizerGUI:
         """Show settings configuration dialog"""
         dialog = tk.Toplevel(self.root)
         dialog.title("Settings")
-        dialog.geometry("500x300")
+        dialog.geometry("500x340")
         dialog.transient(self.root)
         dialog.grab_set()
         
@@ -619,6 +1051,14 @@ class FileOrganizerGUI:
         model_name.insert(0, os.getenv('MODEL_NAME', ''))
         model_name.pack(fill=tk.X, pady=(0, 10))
         
+        # Speculative prefetch
+        speculative = tk.BooleanVar(value=bool(os.getenv('SPECULATIVE_PREFETCH')))
+        ttk.Checkbutton(
+            frame,
+            text="Start generating suggestions right after scanning",
+            variable=speculative
+        ).pack(anchor=tk.W)
+        
         # Buttons
         btn_frame = ttk.Frame(frame)
         btn_frame.pack(fill=tk.X, pady=(20, 0))
@@ -627,7 +1067,9 @@ class FileOrganizerGUI:
             btn_frame,
             text="Save",
             style='Success.TButton',
-            command=lambda: self.save_settings(dialog, api_key.get(), endpoint.get(), model_name.get())
+            command=lambda: self.save_settings(
+                dialog, api_key.get(), endpoint.get(), model_name.get(), speculative.get()
+            )
         ).pack(side=tk.RIGHT, padx=5)
         
         ttk.Button(
@@ -637,7 +1079,181 @@ class FileOrganizerGUI:
             command=dialog.destroy
         ).pack(side=tk.RIGHT, padx=5)
 
+    def show_jobs_window(self):
+        """Open (or raise) the panel of folders organized in the background"""
+        if self.jobs_window and self.jobs_window.winfo_exists():
+            self.jobs_window.lift()
+            return
+        window = tk.Toplevel(self.root)
+        window.title("Background Jobs")
+        window.geometry("800x400")
+        self.jobs_window = window
+
+        frame = ttk.Frame(window, padding="10")
+        frame.pack(fill=tk.BOTH, expand=True)
+
+        tree_container = ttk.Frame(frame)
+        tree_container.pack(fill=tk.BOTH, expand=True)
+        scrollbar = ttk.Scrollbar(tree_container, orient="vertical")
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.jobs_tree = ttk.Treeview(
+            tree_container,
+            columns=('Status', 'Moves', 'Details'),
+            height=12,
+            selectmode='extended',
+            yscrollcommand=scrollbar.set
+        )
+        self.jobs_tree.heading('#0', text='Folder')
+        self.jobs_tree.heading('Status', text='Status')
+        self.jobs_tree.heading('Moves', text='Moves')
+        self.jobs_tree.heading('Details', text='Details')
+        self.jobs_tree.column('#0', width=250)
+        self.jobs_tree.column('Status', width=80)
+        self.jobs_tree.column('Moves', width=60)
+        self.jobs_tree.column('Details', width=350)
+        self.jobs_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.config(command=self.jobs_tree.yview)
+        self.jobs_tree.bind('<Double-1>', lambda e: self.review_job())
+        for job in self.job_queue.list_jobs():
+            self.update_job_row(job.id)
+
+        btn_frame = ttk.Frame(frame)
+        btn_frame.pack(fill=tk.X, pady=(10, 0))
+        for text, style, command in (
+            ("➕ Add Folder", 'Success.TButton', self.add_job),
+            ("➕ Add Subfolders", 'Success.TButton', self.add_subfolder_jobs),
+            ("🔍 Review", 'Primary.TButton', self.review_job),
+            ("✓ Apply", 'Success.TButton', lambda: self.for_selected_jobs(self.job_queue.apply)),
+            ("↺ Undo", 'Warning.TButton', lambda: self.for_selected_jobs(self.job_queue.undo)),
+            ("✕ Cancel", 'Warning.TButton', lambda: self.for_selected_jobs(self.job_queue.cancel)),
+            ("Remove", 'Warning.TButton', self.remove_jobs)
+        ):
+            ttk.Button(btn_frame, text=text, style=style, command=command).pack(side=tk.LEFT, padx=5)
+
+    def queue_folder(self, path: str):
+        """Queue a folder with the main window's scan options"""
+        self.job_queue.add(
+            Path(path),
+            subtree_mode=self.subtree_mode.get(),
+            sniff_content=self.sniff_content.get(),
+            extract_metadata=self.extract_metadata.get()
+        )
+
+    def add_job(self):
+        folder = filedialog.askdirectory(parent=self.jobs_window, title="Folder to organize in the background")
+        if folder:
+            self.queue_folder(folder)
+
+    def add_subfolder_jobs(self):
+        """Queue every subfolder of a folder as its own job"""
+        folder = filedialog.askdirectory(parent=self.jobs_window, title="Queue each subfolder of")
+        if not folder:
+            return
+        subfolders = sorted(p for p in Path(folder).iterdir() if p.is_dir() and not p.name.startswith('.'))
+        if not subfolders:
+            messagebox.showinfo("Jobs", "That folder has no subfolders", parent=self.jobs_window)
+            return
+        for path in subfolders:
+            self.queue_folder(str(path))
+
+    def selected_jobs(self):
+        if not self.jobs_tree:
+            return []
+        jobs = [self.job_queue.get(int(iid)) for iid in self.jobs_tree.selection()]
+        return [job for job in jobs if job]
+
+    def for_selected_jobs(self, action):
+        jobs = self.selected_jobs()
+        if not jobs:
+            messagebox.showinfo("Jobs", "Select one or more jobs first", parent=self.jobs_window)
+            return
+        if action == self.job_queue.apply and not messagebox.askyesno(
+            "Confirm", f"Apply the planned organization to {len(jobs)} folder(s)?", parent=self.jobs_window
+        ):
+            return
+        for job in jobs:
+            action(job)
+
+    def remove_jobs(self):
+        for job in self.selected_jobs():
+            if self.job_queue.remove(job):
+                self.jobs_tree.delete(str(job.id))
+                if job is self.reviewing:
+                    self.end_review()
+
+    def update_job_row(self, job_id: int):
+        """Show a job's current state in the jobs window, if it is open"""
+        job = self.job_queue.get(job_id)
+        if not job or not self.jobs_window or not self.jobs_window.winfo_exists():
+            return
+        values = (job.status, job.moves if job.suggestion is not None else '', job.detail)
+        iid = str(job.id)
+        if self.jobs_tree.exists(iid):
+            self.jobs_tree.item(iid, values=values)
+        else:
+            self.jobs_tree.insert('', 'end', iid=iid, text=str(job.base_path), values=values)
+
+    def review_job(self):
+        """Load a planned job into the main window, where it can be inspected, modified and applied"""
+        jobs = self.selected_jobs()
+        if len(jobs) != 1:
+            messagebox.showinfo("Jobs", "Select one job to review", parent=self.jobs_window)
+            return
+        job = jobs[0]
+        if job.status not in (READY, UNDONE) or job.suggestion is None:
+            messagebox.showinfo("Jobs", f"{job.base_path.name} is {job.status}; only planned jobs can be reviewed",
+                                parent=self.jobs_window)
+            return
+        self.refine_id += 1  # Any refinement still coming belongs to the previous folder
+        self.folder_path.set(str(job.base_path))
+        self.base_path = job.base_path
+        # The job's organizer, so undo in either window covers the same moves;
+        # while reviewing, apply and undo go through the queue to keep its status right
+        self.reviewing = job
+        self.file_organizer = job.file_organizer
+        self.file_index = SearchIndex(item.path for item in job.files_data or [])
+        self.files_data = job.files_data or []
+        self.current_suggestion = job.suggestion
+        self.update_file_list()
+        self.update_suggestion_display()
+        self.generate_button.configure(state='normal')
+        self.apply_button.configure(state='normal' if job.suggestion else 'disabled')
+        self.undo_button.configure(state='normal' if job.file_organizer.move_history else 'disabled')
+        self.status_var.set(f"Reviewing {job.base_path}: {job.detail}")
+        self.root.lift()
+
+    def apply_review(self):
+        """Apply the reviewed suggestion as the job, so the jobs window sees it applied"""
+        job = self.reviewing
+        job.suggestion = self.current_suggestion
+        if not self.job_queue.apply(job):
+            messagebox.showinfo("Jobs", f"{job.base_path.name} is {job.status}; it cannot be applied now")
+            return
+        self.apply_button.configure(state='disabled')
+        self.status_var.set(f"Applying {job.base_path} in the jobs queue...")
+
+    def update_review(self):
+        """Follow the reviewed job's status in the main window"""
+        job = self.reviewing
+        if job.busy:
+            return
+        self.apply_button.configure(state='normal' if job.status in (READY, UNDONE) else 'disabled')
+        self.undo_button.configure(state='normal' if job.file_organizer.move_history else 'disabled')
+        self.status_var.set(f"{job.base_path.name} {job.status}: {job.detail}")
+
+    def end_review(self):
+        """Stop tracking the reviewed job; later operations get their own organizer"""
+        if self.reviewing:
+            if self.file_organizer is self.reviewing.file_organizer:
+                self.file_organizer = None
+            self.reviewing = None
+
+    def close(self):
+        self.job_queue.shutdown()
+        self.root.destroy()
+
 def main():
+    multiprocessing.freeze_support()  # Metadata extraction uses a process pool
     root = tk.Tk()
     app = FileOrganizerGUI(root)
     root.mainloop()
@@ -0,0 +1,158 @@
+import logging
+import os
+import re
+from typing import Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+IGNORE_FILE = '.organizerignore'
+
+# Never worth reorganizing; a '!pattern' line in an ignore file re-includes one
+DEFAULT_PATTERNS = [
+    '.git/', '.hg/', '.svn/',
+    'node_modules/', 'bower_components/',
+    '__pycache__/', '.venv/', 'venv/', '.tox/', '.mypy_cache/', '.pytest_cache/',
+    '.cache/', '.gradle/', '.idea/', '.vscode/',
+    '.DS_Store', 'Thumbs.db', 'desktop.ini',
+    IGNORE_FILE,
+]
+
+class IgnoreRule:
+    __slots__ = ('regex', 'negate', 'dir_only', 'anchored', 'base')
+
+    def __init__(self, regex, negate: bool, dir_only: bool, anchored: bool, base: str):
+        self.regex = regex
+        self.negate = negate
+        self.dir_only = dir_only
+        self.anchored = anchored
+        self.base = base  # Directory (relative to the scan root) of the file the rule came from
+
+    def matches(self, rel_path: str, name: str, is_dir: bool) -> bool:
+        if self.dir_only and not is_dir:
+            return False
+        if self.base:
+            if not rel_path.startswith(self.base + '/'):
+                return False
+            rel_path = rel_path[len(self.base) + 1:]
+        return self.regex.match(rel_path if self.anchored else name) is not None
+
+def translate(pattern: str) -> str:
+    """Translate a gitignore glob into a regular expression"""
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            if pattern.startswith('**', i):
+                if pattern.startswith('**/', i):
+                    out.append('(?:.*/)?')
+                    i += 3
+                    continue
+                out.append('.*')
+                i += 2
+                continue
+            out.append('[^/]*')
+        elif c == '?':
+            out.append('[^/]')
+        elif c == '[':
+            end = pattern.find(']', i + 2)
+            if end == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                out.append('[' + body.replace('\\', '\\\\') + ']')
+                i = end
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return '^' + ''.join(out) + '$'
+
+def compile_rule(line: str, base: str = '') -> Optional[IgnoreRule]:
+    """Compile one ignore-file line; None for blanks and comments"""
+    line = line.rstrip('\n').rstrip('\r')
+    if not line.endswith('\\ '):
+        line = line.rstrip(' ')
+    if not line or line.startswith('#'):
+        return None
+    negate = line.startswith('!')
+    if negate:
+        line = line[1:]
+    elif line.startswith('\\!') or line.startswith('\\#'):
+        line = line[1:]
+    dir_only = line.endswith('/')
+    line = line.rstrip('/')
+    if not line:
+        return None
+    anchored = '/' in line
+    line = line.lstrip('/')
+    try:
+        regex = re.compile(translate(line))
+    except re.error as e:
+        logger.warning(f"Ignoring invalid pattern {line!r}: {e}")
+        return None
+    return IgnoreRule(regex, negate, dir_only, anchored, base)
+
+class IgnoreMatcher:
+    """gitignore-style exclusion rules applied while scanning.
+
+    Rules come from DEFAULT_PATTERNS, extra patterns, and an ignore file
+    (IGNORE_FILE) in any scanned directory, which applies to that
+    directory's subtree. As in git, the last matching rule wins and '!'
+    re-includes; an excluded directory is pruned, so nothing below it can
+    be re-included. Counters record what was skipped.
+    """
+
+    def __init__(self, patterns: Iterable[str] = None, ignore_file: str = IGNORE_FILE):
+        self.ignore_file = ignore_file
+        self.rules: List[IgnoreRule] = []
+        self.loaded = set()  # Directories whose ignore file has been read
+        self.pruned_dirs = 0
+        self.ignored_files = 0
+        self.add_patterns(DEFAULT_PATTERNS if patterns is None else patterns)
+
+    def add_patterns(self, lines: Iterable[str], base: str = '') -> None:
+        for line in lines:
+            rule = compile_rule(line, base)
+            if rule:
+                self.rules.append(rule)
+
+    def load_directory(self, directory: str, rel_dir: str) -> None:
+        """Read the ignore file of a directory being scanned, once"""
+        rel_dir = rel_dir.replace(os.sep, '/')
+        if rel_dir in self.loaded or not self.ignore_file:
+            return
+        self.loaded.add(rel_dir)
+        path = os.path.join(directory, self.ignore_file)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.add_patterns(f, rel_dir)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not read {path}: {e}")
+
+    def is_ignored(self, rel_path: str, is_dir: bool) -> bool:
+        rel_path = rel_path.replace(os.sep, '/')
+        name = rel_path.rsplit('/', 1)[-1]
+        for rule in reversed(self.rules):
+            if rule.matches(rel_path, name, is_dir):
+                return not rule.negate
+        return False
+
+    def check(self, rel_path: str, is_dir: bool) -> bool:
+        """is_ignored() that also counts what it excludes"""
+        if not self.is_ignored(rel_path, is_dir):
+            return False
+        if is_dir:
+            self.pruned_dirs += 1
+        else:
+            self.ignored_files += 1
+        return True
+
+    def summary(self) -> str:
+        return f"{self.pruned_dirs} folders and {self.ignored_files} files excluded"
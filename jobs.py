@@ -0,0 +1,207 @@
+import itertools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from file_organizer import AIOrganizer, FileOrganizer, FileScanner
+from plan import Plan
+from preflight import describe_estimate
+from progress import CancelToken, OperationCancelled, ProgressTracker, describe
+from request_scheduler import PRIORITY_BATCH
+
+logger = logging.getLogger(__name__)
+
+# Job states
+QUEUED = 'queued'
+SCANNING = 'scanning'
+PLANNING = 'planning'
+READY = 'ready'
+APPLYING = 'applying'
+APPLIED = 'applied'
+UNDONE = 'undone'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+BUSY = (QUEUED, SCANNING, PLANNING, APPLYING)
+
+class FolderJob:
+    """One folder's scan, suggestion and moves, with its own undo history"""
+
+    def __init__(self, job_id: int, base_path: Path, subtree_mode: bool = False,
+                 sniff_content: bool = None, extract_metadata: bool = None):
+        self.id = job_id
+        self.base_path = Path(base_path)
+        self.subtree_mode = subtree_mode
+        self.sniff_content = sniff_content
+        self.extract_metadata = extract_metadata
+        self.status = QUEUED
+        self.detail = ''
+        self.files_data = None
+        self.suggestion = None
+        self.estimate = None
+        self.file_organizer = FileOrganizer(self.base_path)
+        self.cancel_token = CancelToken()
+        self.future = None
+
+    @property
+    def busy(self) -> bool:
+        return self.status in BUSY
+
+    @property
+    def moves(self) -> int:
+        return sum(len(items) for items in (self.suggestion or {}).values())
+
+    def __repr__(self) -> str:
+        return f"FolderJob({self.id}, {str(self.base_path)!r}, {self.status})"
+
+class JobQueue:
+    """Scan and plan several folders in the background, each as its own job.
+
+    Jobs run on a pool of max_workers threads (JOB_WORKERS, default 3);
+    the AI requests they make go through the endpoint schedulers at batch
+    priority, so interactive requests still come first. A planned job
+    waits in READY until apply() is called; apply() and undo() also run
+    on the pool. on_update(job) is called from worker threads whenever a
+    job's status or progress changes.
+    """
+
+    def __init__(self, on_update: Callable[[FolderJob], None] = None, max_workers: int = None):
+        self.on_update = on_update
+        self.max_workers = max_workers or int(os.getenv('JOB_WORKERS', 3))
+        self.pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        self.jobs: Dict[int, FolderJob] = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def add(self, base_path: Path, **options) -> FolderJob:
+        """Queue a folder for scanning and planning; a folder already being worked on is not added twice"""
+        base_path = Path(base_path)
+        with self.lock:
+            for job in self.jobs.values():
+                if job.busy and job.base_path.resolve() == base_path.resolve():
+                    return job
+            job = FolderJob(next(self.ids), base_path, **options)
+            self.jobs[job.id] = job
+        self.submit(job, self.run_plan)
+        return job
+
+    def list_jobs(self) -> List[FolderJob]:
+        with self.lock:
+            return list(self.jobs.values())
+
+    def get(self, job_id: int) -> Optional[FolderJob]:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def submit(self, job: FolderJob, task: Callable) -> None:
+        job.cancel_token = CancelToken()
+        self.notify(job)
+        job.future = self.pool.submit(task, job)
+
+    def notify(self, job: FolderJob) -> None:
+        if self.on_update:
+            try:
+                self.on_update(job)
+            except Exception as e:
+                logger.error(f"Job update callback failed: {str(e)}")
+
+    def set_status(self, job: FolderJob, status: str, detail: str = '') -> None:
+        job.status = status
+        job.detail = detail
+        self.notify(job)
+
+    def tracker(self, job: FolderJob, operation: str) -> ProgressTracker:
+        def report(snapshot):
+            job.detail = describe(snapshot)
+            self.notify(job)
+        return ProgressTracker(operation, callback=report, cancel_token=job.cancel_token)
+
+    def run_plan(self, job: FolderJob) -> None:
+        try:
+            job.cancel_token.check()
+            self.set_status(job, SCANNING)
+            scanner = FileScanner(job.base_path, sniff_content=job.sniff_content,
+                                  extract_metadata=job.extract_metadata)
+            job.files_data = scanner.scan(recursive=job.subtree_mode, progress=self.tracker(job, "Scanning"))
+            if not job.files_data:
+                job.suggestion = {}
+                self.set_status(job, READY, "No files found")
+                return
+
+            organizer = AIOrganizer(priority=PRIORITY_BATCH)
+            job.estimate = organizer.preflight(job.files_data)
+            self.set_status(job, PLANNING, describe_estimate(job.estimate))
+            progress = self.tracker(job, "Generating")
+            if job.subtree_mode:
+                job.suggestion = organizer.get_subtree_suggestion(job.files_data, progress=progress)
+            else:
+                job.suggestion = organizer.get_batched_suggestion(job.files_data, progress=progress,
+                                                                  estimate=job.estimate)
+            self.set_status(job, READY, f"{job.moves} moves planned")
+        except OperationCancelled:
+            self.set_status(job, CANCELLED, "Cancelled before planning finished")
+        except Exception as e:
+            logger.error(f"Job for {job.base_path} failed: {str(e)}")
+            self.set_status(job, FAILED, str(e))
+
+    def apply(self, job: FolderJob) -> bool:
+        """Move the job's files in the background; False if it has nothing to apply"""
+        if job.busy or job.status == APPLIED or not job.suggestion:
+            return False
+        self.set_status(job, QUEUED, "Waiting to apply")
+        self.submit(job, self.run_apply)
+        return True
+
+    def run_apply(self, job: FolderJob) -> None:
+        try:
+            job.cancel_token.check()
+            self.set_status(job, APPLYING)
+            plan = Plan.from_suggestion(job.base_path, job.suggestion)
+            plan.save()
+            if job.file_organizer.move_files(plan, self.tracker(job, "Moving")):
+                self.set_status(job, APPLIED, f"{job.moves} moves applied")
+            else:
+                self.set_status(job, FAILED, "Some moves failed, see the log for details")
+        except OperationCancelled:
+            self.set_status(job, CANCELLED, "Moving cancelled; moved files can be undone")
+        except Exception as e:
+            logger.error(f"Applying {job.base_path} failed: {str(e)}")
+            self.set_status(job, FAILED, str(e))
+
+    def undo(self, job: FolderJob) -> bool:
+        """Undo the job's last applied moves in the background"""
+        if job.busy or not job.file_organizer.move_history:
+            return False
+        self.set_status(job, QUEUED, "Waiting to undo")
+        self.submit(job, self.run_undo)
+        return True
+
+    def run_undo(self, job: FolderJob) -> None:
+        try:
+            if job.file_organizer.undo_last_move():
+                self.set_status(job, UNDONE, "Last change undone")
+            else:
+                self.set_status(job, FAILED, "Undo failed, see the log for details")
+        except Exception as e:
+            logger.error(f"Undo in {job.base_path} failed: {str(e)}")
+            self.set_status(job, FAILED, str(e))
+
+    def cancel(self, job: FolderJob) -> None:
+        job.cancel_token.cancel()
+        if job.future and job.future.cancel():
+            self.set_status(job, CANCELLED, "Cancelled before it started")
+
+    def remove(self, job: FolderJob) -> bool:
+        if job.busy:
+            return False
+        with self.lock:
+            self.jobs.pop(job.id, None)
+        return True
+
+    def shutdown(self) -> None:
+        """Cancel everything and stop the workers without waiting for them"""
+        for job in self.list_jobs():
+            job.cancel_token.cancel()
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,194 @@
+import json
+import logging
+import math
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CLASSIFIER_FILE = Path.home() / '.file_organizer_classifier.json'
+
+def file_features(name: str) -> List[str]:
+    """Features of a file name: lowercase word tokens (camelCase split, any
+    number collapsed to one token) and the extension"""
+    stem, suffix = os.path.splitext(name)
+    words = re.sub(r'([a-z])([A-Z])', r'\1 \2', stem)
+    tokens = {t for t in re.split(r'[^a-z0-9]+', words.lower()) if t}
+    features = [f"w:{'#' if t.isdigit() else t}" for t in tokens if len(t) > 1 or t.isdigit()]
+    if suffix:
+        features.append(f"ext:{suffix[1:].lower()}")
+    return features
+
+class LocalClassifier:
+    """Multinomial naive Bayes over file name features, trained from applied plans.
+
+    Labels are destination folders (e.g. "Documents/Invoices"). Counts are
+    kept as an inverted index {feature: {label: count}}: classifying a file
+    scores every label from its prior and adds the counts of the file's
+    known features, so thousands of files take milliseconds. The model is
+    stored as JSON in CLASSIFIER_FILE and updated incrementally.
+    """
+
+    def __init__(self, path: Path = CLASSIFIER_FILE, min_examples: int = 20, min_confidence: float = 0.5):
+        self.path = path
+        self.min_examples = min_examples
+        self.min_confidence = min_confidence
+        self.labels: Dict[str, int] = {}   # label -> training files
+        self.totals: Dict[str, int] = {}   # label -> feature occurrences
+        self.features: Dict[str, Dict[str, int]] = {}
+        self.lock = threading.Lock()
+        if path:
+            self.load()
+
+    def load(self):
+        try:
+            if self.path.exists():
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.labels = data.get('labels', {})
+                self.totals = data.get('totals', {})
+                self.features = data.get('features', {})
+        except Exception as e:
+            logger.warning(f"Could not load classifier: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            with self.lock:
+                data = json.dumps({'version': 1, 'labels': self.labels, 'totals': self.totals,
+                                   'features': self.features})
+            temp = self.path.with_suffix('.tmp')
+            with open(temp, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(temp, self.path)
+        except Exception as e:
+            logger.warning(f"Could not save classifier: {e}")
+
+    @property
+    def trained(self) -> bool:
+        with self.lock:
+            return sum(self.labels.values()) >= self.min_examples and len(self.labels) > 1
+
+    def train(self, examples: Iterable[Tuple[str, str]]) -> int:
+        """Add (file name, destination folder) examples; returns how many were used"""
+        return self.update(examples, 1)
+
+    def untrain(self, examples: Iterable[Tuple[str, str]]) -> int:
+        """Take back examples added by train(); returns how many were removed"""
+        return self.update(examples, -1)
+
+    def update(self, examples: Iterable[Tuple[str, str]], step: int) -> int:
+        count = 0
+        with self.lock:
+            for name, label in examples:
+                if not label or label == '.' or (step < 0 and not self.labels.get(label)):
+                    continue
+                features = file_features(name)
+                adjust(self.labels, label, step)
+                adjust(self.totals, label, step * len(features))
+                for feature in features:
+                    counts = self.features.setdefault(feature, {})
+                    adjust(counts, label, step)
+                    if not counts:
+                        del self.features[feature]
+                count += 1
+        return count
+
+    def learn_moves(self, moves: Iterable[Dict], base_path: Path) -> int:
+        """Train from applied move records ({'from': ..., 'to': ...}) and save"""
+        count = self.train(move_examples(moves, base_path))
+        if count:
+            self.save()
+            logger.info(f"Classifier learned from {count} moves")
+        return count
+
+    def forget_moves(self, moves: Iterable[Dict], base_path: Path) -> int:
+        """Untrain move records passed to learn_moves() earlier (e.g. undone ones) and save"""
+        count = self.untrain(move_examples(moves, base_path))
+        if count:
+            self.save()
+            logger.info(f"Classifier forgot {count} undone moves")
+        return count
+
+    def classify(self, name: str, category: str = None) -> Optional[Tuple[str, float]]:
+        """Most likely folder for a file name and its posterior probability"""
+        # Applying or undoing a plan may update the counts from another thread
+        with self.lock:
+            return self.score(name, category)
+
+    def score(self, name: str, category: str = None) -> Optional[Tuple[str, float]]:
+        if not self.labels:
+            return None
+        # Scanner categories are not trained on (old plans lack them); they only break ties
+        features = [f for f in file_features(name) if f in self.features]
+        if not features:
+            return None  # Nothing seen before; the prior alone is no evidence
+        vocabulary = len(self.features)
+        total_docs = sum(self.labels.values())
+        scores = {}
+        for label, docs in self.labels.items():
+            scores[label] = (math.log(docs / total_docs)
+                             - len(features) * math.log(self.totals.get(label, 0) + vocabulary))
+        for feature in features:
+            for label, count in self.features[feature].items():
+                scores[label] += math.log(count + 1)
+        best = max(scores, key=lambda label: (scores[label], bool(category) and category_matches(label, category)))
+        top = scores[best]
+        confidence = 1.0 / sum(math.exp(score - top) for score in scores.values())
+        return best, confidence
+
+    def suggest(self, records: Iterable) -> Tuple[Dict, List]:
+        """Place records the model is confident about.
+
+        Returns (suggestion, unplaced records). Folders are never placed.
+        """
+        suggestion = {}
+        unplaced = []
+        for record in records:
+            if record.is_folder:
+                continue
+            result = self.classify(os.path.basename(record.path), record.category) if self.trained else None
+            if not result or result[1] < self.min_confidence:
+                unplaced.append(record)
+                continue
+            folder = result[0]
+            suggestion.setdefault(folder.split('/')[0], []).append({
+                'original_path': record.path,
+                'new_path': f"{folder}/{os.path.basename(record.path)}"
+            })
+        return suggestion, unplaced
+
+def move_examples(moves: Iterable[Dict], base_path: Path) -> List[Tuple[str, str]]:
+    """(file name, destination folder) pairs from move records"""
+    base = str(base_path)
+    examples = []
+    for move in moves:
+        target = os.path.relpath(move['to'], base)
+        examples.append((os.path.basename(move['from']), Path(os.path.dirname(target)).as_posix()))
+    return examples
+
+def adjust(counts: Dict[str, int], key: str, step: int) -> None:
+    """Add step to a count, dropping it once it reaches zero"""
+    value = counts.get(key, 0) + step
+    if value > 0:
+        counts[key] = value
+    else:
+        counts.pop(key, None)
+
+def category_matches(label: str, category: str) -> bool:
+    return label.split('/')[0].lower().rstrip('s') == category.lower().rstrip('s')
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+def get_classifier() -> LocalClassifier:
+    """The shared classifier, loaded from disk on first use"""
+    global _classifier
+    with _classifier_lock:
+        if _classifier is None:
+            _classifier = LocalClassifier()
+        return _classifier
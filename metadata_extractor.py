@@ -0,0 +1,335 @@
+import json
+import logging
+import os
+import re
+import struct
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+HEAD_SIZE = 128 * 1024  # Enough for EXIF blocks and typical ID3v2 tags
+TAIL_SIZE = 64 * 1024   # PDF info dictionaries usually sit near the end
+
+ID3_FRAMES = {
+    'TPE1': 'artist', 'TP1': 'artist',
+    'TALB': 'album', 'TAL': 'album',
+    'TIT2': 'title', 'TT2': 'title',
+    'TDRC': 'year', 'TYER': 'year', 'TYE': 'year',
+}
+
+VORBIS_FIELDS = {'ARTIST': 'artist', 'ALBUM': 'album', 'TITLE': 'title', 'DATE': 'year'}
+
+def normalize_date(text: str) -> Optional[str]:
+    """Turn the many date spellings found in headers into YYYY-MM-DD (or YYYY)"""
+    match = re.search(r'((?:19|20)\d\d)(?:[:\-/]?(\d\d)(?:[:\-/]?(\d\d))?)?', text or '')
+    if not match:
+        return None
+    year, month, day = match.groups()
+    if month and 1 <= int(month) <= 12:
+        if day and 1 <= int(day) <= 31:
+            return f"{year}-{month}-{day}"
+        return f"{year}-{month}"
+    return year
+
+def parse_exif_date(head: bytes) -> Optional[str]:
+    """Find DateTimeOriginal (or DateTime) in a JPEG APP1 or bare TIFF header"""
+    if head.startswith(b'\xff\xd8'):
+        start = head.find(b'Exif\x00\x00')
+        if start == -1:
+            return None
+        tiff = head[start + 6:]
+    elif head[:4] in (b'II*\x00', b'MM\x00*'):
+        tiff = head
+    else:
+        return None
+    if len(tiff) < 8:
+        return None
+
+    endian = '<' if tiff[:2] == b'II' else '>'
+
+    def read_ifd(offset):
+        entries = {}
+        if offset + 2 > len(tiff):
+            return entries
+        count = struct.unpack_from(endian + 'H', tiff, offset)[0]
+        for i in range(count):
+            pos = offset + 2 + i * 12
+            if pos + 12 > len(tiff):
+                break
+            tag, kind, n, value = struct.unpack_from(endian + 'HHII', tiff, pos)
+            entries[tag] = (kind, n, value)
+        return entries
+
+    def read_ascii(entry):
+        kind, n, value = entry
+        if kind != 2 or value + n > len(tiff):
+            return None
+        return tiff[value:value + n].rstrip(b'\x00').decode('ascii', 'ignore')
+
+    ifd0 = read_ifd(struct.unpack_from(endian + 'I', tiff, 4)[0])
+    if 0x8769 in ifd0:
+        exif = read_ifd(ifd0[0x8769][2])
+        for tag in (0x9003, 0x9004):  # DateTimeOriginal, DateTimeDigitized
+            if tag in exif:
+                date = normalize_date(read_ascii(exif[tag]))
+                if date:
+                    return date
+    if 0x0132 in ifd0:
+        return normalize_date(read_ascii(ifd0[0x0132]))
+    return None
+
+def decode_id3_text(data: bytes) -> str:
+    if not data:
+        return ''
+    encoding = data[0]
+    body = data[1:]
+    try:
+        if encoding == 1:
+            text = body.decode('utf-16')
+        elif encoding == 2:
+            text = body.decode('utf-16-be')
+        elif encoding == 3:
+            text = body.decode('utf-8')
+        else:
+            text = body.decode('latin-1')
+    except UnicodeDecodeError:
+        text = body.decode('latin-1', 'ignore')
+    return text.strip('\x00').strip()
+
+def parse_id3v2(head: bytes) -> Dict:
+    if not head.startswith(b'ID3') or len(head) < 10:
+        return {}
+    version = head[3]
+    size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+    end = min(len(head), 10 + size)
+    tags = {}
+    pos = 10
+    id_len, header_len = (3, 6) if version == 2 else (4, 10)
+    while pos + header_len <= end:
+        frame_id = head[pos:pos + id_len].decode('latin-1', 'ignore')
+        if not frame_id.strip('\x00'):
+            break
+        if version == 2:
+            frame_size = int.from_bytes(head[pos + 3:pos + 6], 'big')
+        elif version == 4:
+            b = head[pos + 4:pos + 8]
+            frame_size = (b[0] << 21) | (b[1] << 14) | (b[2] << 7) | b[3]
+        else:
+            frame_size = int.from_bytes(head[pos + 4:pos + 8], 'big')
+        data = head[pos + header_len:pos + header_len + frame_size]
+        key = ID3_FRAMES.get(frame_id)
+        if key and key not in tags:
+            text = decode_id3_text(data)
+            if text:
+                tags[key] = text
+        pos += header_len + frame_size
+    return tags
+
+def parse_id3v1(tail: bytes) -> Dict:
+    if len(tail) < 128 or tail[-128:-125] != b'TAG':
+        return {}
+    block = tail[-128:]
+    fields = {'title': block[3:33], 'artist': block[33:63], 'album': block[63:93], 'year': block[93:97]}
+    tags = {}
+    for key, raw in fields.items():
+        text = raw.split(b'\x00')[0].decode('latin-1').strip()
+        if text:
+            tags[key] = text
+    return tags
+
+def parse_flac_tags(head: bytes) -> Dict:
+    if not head.startswith(b'fLaC'):
+        return {}
+    tags = {}
+    pos = 4
+    while pos + 4 <= len(head):
+        block_type = head[pos] & 0x7f
+        last = head[pos] & 0x80
+        length = int.from_bytes(head[pos + 1:pos + 4], 'big')
+        if block_type == 4:
+            block = head[pos + 4:pos + 4 + length]
+            try:
+                vendor_len = struct.unpack_from('<I', block, 0)[0]
+                offset = 4 + vendor_len
+                count = struct.unpack_from('<I', block, offset)[0]
+                offset += 4
+                for _ in range(count):
+                    item_len = struct.unpack_from('<I', block, offset)[0]
+                    item = block[offset + 4:offset + 4 + item_len].decode('utf-8', 'ignore')
+                    offset += 4 + item_len
+                    name, _, value = item.partition('=')
+                    key = VORBIS_FIELDS.get(name.upper())
+                    if key and value and key not in tags:
+                        tags[key] = value
+            except struct.error:
+                pass
+            break
+        if last:
+            break
+        pos += 4 + length
+    return tags
+
+def parse_pdf_info(data: bytes) -> Dict:
+    info = {}
+    match = re.search(rb'/CreationDate\s*\(D:(\d{4,14})', data)
+    if match:
+        info['date'] = normalize_date(match.group(1).decode('ascii'))
+    match = re.search(rb'/Author\s*\(([^)]{1,200})\)', data)
+    if match:
+        info['author'] = match.group(1).decode('latin-1', 'ignore').strip()
+    return info
+
+def parse_office_core(path: str) -> Dict:
+    """Read docProps/core.xml from an OOXML file (only the central directory and that entry)"""
+    info = {}
+    try:
+        with zipfile.ZipFile(path) as archive:
+            with archive.open('docProps/core.xml') as f:
+                core = f.read(64 * 1024).decode('utf-8', 'ignore')
+    except Exception:
+        # Missing entry, corrupt archive (zlib.error, EOFError) or unsupported compression
+        return info
+    match = re.search(r'<dcterms:created[^>]*>([^<]+)<', core)
+    if match:
+        info['date'] = normalize_date(match.group(1))
+    match = re.search(r'<dc:creator>([^<]+)<', core)
+    if match:
+        info['author'] = match.group(1).strip()
+    return info
+
+def extract_metadata(path: str) -> Dict:
+    """Extract compact metadata from a file's header (and, for a few formats, trailer).
+
+    Returns a dict with 'date' (YYYY-MM-DD, YYYY-MM or YYYY) and
+    'date_source' ('exif', 'tag', 'document' or 'mtime'), plus 'artist',
+    'album', 'title' or 'author' when present. Module-level so it can run
+    in a process pool.
+    """
+    meta = {}
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(HEAD_SIZE)
+            suffix = os.path.splitext(path)[1].lower()
+            size = os.fstat(f.fileno()).st_size
+
+            date = parse_exif_date(head)
+            if date:
+                meta['date'], meta['date_source'] = date, 'exif'
+
+            tags = parse_id3v2(head) or parse_flac_tags(head)
+            if not tags and suffix == '.mp3' and size > 128:
+                f.seek(size - 128)
+                tags = parse_id3v1(f.read(128))
+            if tags:
+                year = normalize_date(tags.pop('year', ''))
+                meta.update(tags)
+                if year and 'date' not in meta:
+                    meta['date'], meta['date_source'] = year, 'tag'
+
+            if head.startswith(b'%PDF'):
+                info = parse_pdf_info(head)
+                if 'date' not in info and size > HEAD_SIZE:
+                    f.seek(max(HEAD_SIZE, size - TAIL_SIZE))
+                    info.update(parse_pdf_info(f.read(TAIL_SIZE)))
+                if info.get('date'):
+                    meta['date'], meta['date_source'] = info.pop('date'), 'document'
+                info.pop('date', None)
+                meta.update(info)
+
+        if head.startswith(b'PK\x03\x04') and suffix in ('.docx', '.xlsx', '.pptx'):
+            info = parse_office_core(path)
+            if info.get('date'):
+                meta['date'], meta['date_source'] = info.pop('date'), 'document'
+            info.pop('date', None)
+            meta.update(info)
+
+        if 'date' not in meta:
+            mtime = os.stat(path).st_mtime
+            meta['date'] = datetime.fromtimestamp(mtime).strftime('%Y-%m-%d')
+            meta['date_source'] = 'mtime'
+    except Exception as e:
+        # Unreadable or malformed files (struct.error, IndexError, ...) must not abort a batch
+        logger.debug(f"Could not read metadata from {path}: {e}")
+    return meta
+
+class MetadataExtractor:
+    """Extract metadata for many files in a process pool, cached per file identity.
+
+    Files whose (device, inode, size, mtime) match a cached entry are not
+    read again. Small batches run in-process to avoid pool start-up cost.
+    """
+
+    def __init__(self, max_workers: int = None, cache_file: Path = None, min_pool_size: int = 64,
+                 max_cache_entries: int = 500000):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.cache_file = cache_file
+        self.min_pool_size = min_pool_size
+        self.max_cache_entries = max_cache_entries
+        self.cache: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+        if cache_file:
+            self.load_cache()
+
+    def load_cache(self):
+        try:
+            if self.cache_file.exists():
+                with open(self.cache_file, 'r') as f:
+                    self.cache = json.load(f)
+        except Exception as e:
+            logger.warning(f"Could not load metadata cache: {e}")
+            self.cache = {}
+
+    def save_cache(self):
+        if not self.cache_file:
+            return
+        try:
+            with self.lock:
+                overflow = len(self.cache) - self.max_cache_entries
+                if overflow > 0:
+                    for key in list(self.cache)[:overflow]:
+                        del self.cache[key]
+                data = json.dumps(self.cache)
+            with open(self.cache_file, 'w') as f:
+                f.write(data)
+        except Exception as e:
+            logger.warning(f"Could not save metadata cache: {e}")
+
+    def extract_many(self, paths: Iterable[str]) -> Dict[str, Dict]:
+        """Return {path: metadata} for every readable path"""
+        results = {}
+        misses = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            key = f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+            cached = self.cache.get(key)
+            if cached is not None:
+                results[path] = cached
+            else:
+                misses.append((path, key))
+
+        if misses:
+            paths_only = [path for path, _ in misses]
+            if len(misses) < self.min_pool_size or self.max_workers == 1:
+                extracted = map(extract_metadata, paths_only)
+            else:
+                pool = ProcessPoolExecutor(max_workers=self.max_workers)
+                try:
+                    chunk = max(1, len(paths_only) // (self.max_workers * 8))
+                    extracted = list(pool.map(extract_metadata, paths_only, chunksize=chunk))
+                finally:
+                    pool.shutdown()
+            with self.lock:
+                for (path, key), meta in zip(misses, extracted):
+                    if meta:
+                        self.cache[key] = meta
+                        results[path] = meta
+            self.save_cache()
+        return results
@@ -0,0 +1,367 @@
+import ctypes
+import ctypes.util
+import errno
+import json
+import logging
+import os
+import shutil
+import sys
+from collections import OrderedDict
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+# renameat2(2) flags
+RENAME_NOREPLACE = 1
+RENAME_EXCHANGE = 2
+
+def _load_renameat2():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        func = libc.renameat2
+    except (OSError, AttributeError):
+        return None
+    func.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+    func.restype = ctypes.c_int
+    return func
+
+_renameat2 = _load_renameat2()
+
+PART_SUFFIX = '.part'
+TRANSFER_CHUNK = 64 * 1024 * 1024  # Bytes per progress report
+BUFFER_SIZE = 1024 * 1024
+VERIFY_WINDOW = 1024 * 1024  # Trailing bytes compared before resuming
+
+# Kernel copy paths that turned out not to work here (e.g. across filesystems
+# on older kernels); skipped for the rest of the process
+_unsupported = set()
+
+def _copy_chunk(src_fd: int, dst_fd: int, offset: int, count: int) -> int:
+    """Copy up to count bytes at offset between two fds, in-kernel when possible"""
+    if 'copy_file_range' not in _unsupported and hasattr(os, 'copy_file_range'):
+        try:
+            return os.copy_file_range(src_fd, dst_fd, count, offset, offset)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL, errno.EPERM):
+                raise
+            _unsupported.add('copy_file_range')
+    if 'sendfile' not in _unsupported and sys.platform.startswith('linux'):
+        try:
+            os.lseek(dst_fd, offset, os.SEEK_SET)
+            return os.sendfile(dst_fd, src_fd, offset, count)
+        except OSError as e:
+            if e.errno not in (errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+            _unsupported.add('sendfile')
+
+    # Plain buffered copy
+    os.lseek(src_fd, offset, os.SEEK_SET)
+    os.lseek(dst_fd, offset, os.SEEK_SET)
+    data = os.read(src_fd, min(count, BUFFER_SIZE))
+    written = 0
+    while written < len(data):
+        written += os.write(dst_fd, data[written:])
+    return len(data)
+
+def _read_at(path: str, offset: int, size: int) -> bytes:
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read(size)
+
+def _resume_offset(src: str, part: str, marker: str, total: int, mtime_ns: int) -> int:
+    """Where to resume a partial copy: its length if the source is unchanged and the tail matches, else 0"""
+    try:
+        with open(marker, 'r') as f:
+            info = json.load(f)
+        if info.get('size') != total or info.get('mtime_ns') != mtime_ns:
+            return 0
+        done = os.path.getsize(part)
+    except (OSError, ValueError):
+        return 0
+    if done > total:
+        return 0
+    window = min(VERIFY_WINDOW, done)
+    if window and _read_at(src, done - window, window) != _read_at(part, done - window, window):
+        logger.warning(f"Partial copy of {src} does not match the source, restarting")
+        return 0
+    return done
+
+def _finalize(part: str, dst: str) -> None:
+    """Put a finished copy in place without replacing an existing dst"""
+    if sys.platform.startswith('win'):
+        os.rename(part, dst)
+        return
+    try:
+        os.link(part, dst)
+    except OSError as e:
+        if e.errno == errno.EEXIST:
+            raise
+        if os.path.lexists(dst):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dst)
+        os.rename(part, dst)
+        return
+    os.unlink(part)
+
+def transfer_file(src: str, dst: str, progress: Callable = None, chunk_size: int = TRANSFER_CHUNK) -> None:
+    """Copy src to dst across filesystems, then remove src.
+
+    Data goes to dst + '.part' using copy_file_range or sendfile where
+    available (buffered copy otherwise). A marker file records the source
+    size and mtime; if an earlier attempt was interrupted and the source
+    is unchanged, copying resumes after the existing bytes once their tail
+    has been verified. The finished copy is fsynced, given the source's
+    timestamps and permissions, moved into place without clobbering, and
+    only then is the source unlinked. progress(done, total) is called
+    after every chunk.
+    """
+    if os.path.lexists(dst):
+        raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dst)
+    part = dst + PART_SUFFIX
+    marker = part + '.json'
+    st = os.stat(src)
+    total = st.st_size
+
+    offset = _resume_offset(src, part, marker, total, st.st_mtime_ns) if os.path.exists(part) else 0
+    if offset:
+        logger.info(f"Resuming copy of {src} at {offset} of {total} bytes")
+    else:
+        with open(marker, 'w') as f:
+            json.dump({'size': total, 'mtime_ns': st.st_mtime_ns}, f)
+
+    src_fd = os.open(src, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        dst_fd = os.open(part, os.O_WRONLY | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o600)
+        try:
+            os.ftruncate(dst_fd, offset)
+            if progress:
+                progress(offset, total)
+            while offset < total:
+                end = min(total, offset + chunk_size)
+                while offset < end:
+                    copied = _copy_chunk(src_fd, dst_fd, offset, end - offset)
+                    if copied == 0:
+                        raise OSError(errno.EIO, f"Source ended early at {offset} of {total} bytes", src)
+                    offset += copied
+                if progress:
+                    progress(offset, total)
+            os.fsync(dst_fd)
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+
+    shutil.copystat(src, part)
+    _finalize(part, dst)
+    os.unlink(marker)
+    os.unlink(src)
+
+def transfer_tree(src: str, dst: str, progress: Callable = None) -> None:
+    """Move a directory across filesystems file by file (each resumable), then remove src.
+
+    A marker next to dst (dst + '.part.json') names the source while the
+    transfer runs, so an interrupted transfer into dst is resumed while any
+    other existing dst is refused.
+    """
+    marker = dst + PART_SUFFIX + '.json'
+    resuming = False
+    if os.path.lexists(dst):
+        try:
+            with open(marker, 'r') as f:
+                resuming = json.load(f).get('src') == os.path.abspath(src)
+        except (OSError, ValueError):
+            pass
+        if not resuming or not os.path.isdir(dst):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dst)
+        logger.info(f"Resuming transfer of {src} into {dst}")
+    else:
+        with open(marker, 'w') as f:
+            json.dump({'src': os.path.abspath(src)}, f)
+
+    for root, dirs, files in os.walk(src):
+        target_root = os.path.join(dst, os.path.relpath(root, src))
+        os.makedirs(target_root, exist_ok=True)
+        # os.walk does not follow directory symlinks; recreate them as links
+        for name in [d for d in dirs if os.path.islink(os.path.join(root, d))]:
+            target = os.path.join(target_root, name)
+            if not (resuming and os.path.islink(target)):
+                os.symlink(os.readlink(os.path.join(root, name)), target)
+            dirs.remove(name)
+        for name in files:
+            source = os.path.join(root, name)
+            target = os.path.join(target_root, name)
+            if resuming and _transferred(source, target):
+                os.unlink(source)  # Copied before the interruption, but not yet removed
+            elif os.path.islink(source):
+                os.symlink(os.readlink(source), target)
+                os.unlink(source)
+            else:
+                transfer_file(source, target, progress)
+    shutil.rmtree(src)
+    os.unlink(marker)
+
+def _transferred(source: str, target: str) -> bool:
+    """Whether target is a finished copy of source (same link, or same size and mtime)"""
+    try:
+        if os.path.islink(source):
+            return os.path.islink(target) and os.readlink(target) == os.readlink(source)
+        src_st, dst_st = os.stat(source), os.lstat(target)
+    except OSError:
+        return False
+    return src_st.st_size == dst_st.st_size and src_st.st_mtime_ns == dst_st.st_mtime_ns
+
+def ancestors(path: str):
+    """path and each of its parent folders"""
+    while True:
+        yield path
+        parent = os.path.dirname(path)
+        if parent == path or not parent:
+            return
+        path = parent
+
+class MoveExecutor:
+    """Perform many renames without clobbering existing files.
+
+    Where the platform supports it, source and destination directories are
+    opened once and kept as file descriptors (bounded LRU), and each move is
+    a rename relative to those descriptors. On Linux renameat2 with
+    RENAME_NOREPLACE makes each move atomic and no-clobber; elsewhere files
+    are moved with link+unlink (also atomic no-clobber) and directories
+    with an existence check followed by rename. Windows' rename already
+    refuses to replace, so it is used directly. Moves across filesystems
+    fall back to transfer_file/transfer_tree (in-kernel, resumable copies).
+
+    A move onto an existing path raises FileExistsError.
+    """
+
+    def __init__(self, max_open_dirs: int = 256, progress: Callable = None):
+        self.max_open_dirs = max_open_dirs
+        self.progress = progress  # progress(path, done, total) for cross-device copies
+        self.dir_fds = OrderedDict()
+        self.nested = {}  # folder -> cached directories at or below it
+        self.use_dir_fds = (
+            hasattr(os, 'O_DIRECTORY')
+            and os.rename in os.supports_dir_fd
+            and os.link in os.supports_dir_fd
+        )
+        self.use_renameat2 = _renameat2 is not None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        while self.dir_fds:
+            _, fd = self.dir_fds.popitem()
+            os.close(fd)
+        self.nested.clear()
+
+    def dir_fd(self, directory: str, create: bool = False) -> int:
+        fd = self.dir_fds.get(directory)
+        if fd is not None:
+            self.dir_fds.move_to_end(directory)
+            return fd
+        if create:
+            os.makedirs(directory, exist_ok=True)
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        self.dir_fds[directory] = fd
+        for folder in ancestors(directory):
+            self.nested.setdefault(folder, set()).add(directory)
+        if len(self.dir_fds) > self.max_open_dirs:
+            self.drop_dir(next(iter(self.dir_fds)))
+        return fd
+
+    def drop_dir(self, directory: str) -> None:
+        os.close(self.dir_fds.pop(directory))
+        for folder in ancestors(directory):
+            cached = self.nested.get(folder)
+            if cached is not None:
+                cached.discard(directory)
+                if not cached:
+                    del self.nested[folder]
+
+    def move(self, src: str, dst: str) -> None:
+        """Move src to dst, creating dst's parent; never overwrites dst"""
+        src_dir, src_name = os.path.split(src)
+        dst_dir, dst_name = os.path.split(dst)
+        try:
+            if self.use_dir_fds:
+                src_fd = self.dir_fd(src_dir)
+                dst_fd = self.dir_fd(dst_dir, create=True)
+                self.rename_at(src_fd, src_name, dst_fd, dst_name, RENAME_NOREPLACE)
+            else:
+                os.makedirs(dst_dir, exist_ok=True)
+                self.rename_path(src, dst)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            self.cross_device_move(src, dst)
+        # A moved directory takes its cached descriptors (and its subfolders') with it;
+        # for files (and uncached folders) these are single dict lookups
+        if src in self.nested:
+            self.forget_dirs(src)
+        if dst in self.nested:
+            self.forget_dirs(dst)
+
+    def forget_dirs(self, path: str) -> None:
+        """Close cached descriptors for path and any directory under it"""
+        for directory in list(self.nested.get(path, ())):
+            self.drop_dir(directory)
+
+    def rename_at(self, src_fd: int, src_name: str, dst_fd: int, dst_name: str, flags: int) -> None:
+        """Rename relative to directory descriptors, honouring renameat2 flags"""
+        if self.use_renameat2:
+            result = _renameat2(src_fd, os.fsencode(src_name), dst_fd, os.fsencode(dst_name), flags)
+            if result == 0:
+                return
+            err = ctypes.get_errno()
+            if err not in (errno.ENOSYS, errno.EINVAL):
+                raise OSError(err, os.strerror(err), dst_name)
+            # Kernel or filesystem without renameat2 support
+            logger.info("renameat2 unavailable, using portable no-clobber renames")
+            self.use_renameat2 = False
+
+        if flags & RENAME_EXCHANGE:
+            raise OSError(errno.ENOSYS, "Atomic exchange is not supported here", dst_name)
+
+        try:
+            # A hard link fails if the target exists, which makes this no-clobber
+            os.link(src_name, dst_name, src_dir_fd=src_fd, dst_dir_fd=dst_fd, follow_symlinks=False)
+        except OSError as e:
+            if e.errno == errno.EEXIST:
+                raise
+            # Directories and filesystems without hard links
+            try:
+                os.stat(dst_name, dir_fd=dst_fd, follow_symlinks=False)
+                raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dst_name)
+            except FileNotFoundError:
+                pass
+            os.rename(src_name, dst_name, src_dir_fd=src_fd, dst_dir_fd=dst_fd)
+            return
+        os.unlink(src_name, dir_fd=src_fd)
+
+    def rename_path(self, src: str, dst: str) -> None:
+        """Portable no-clobber rename using full paths"""
+        if sys.platform.startswith('win'):
+            os.rename(src, dst)  # Refuses to replace an existing target
+            return
+        if os.path.lexists(dst):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dst)
+        os.rename(src, dst)
+
+    def cross_device_move(self, src: str, dst: str) -> None:
+        callback = None
+        if self.progress:
+            callback = lambda done, total: self.progress(src, done, total)
+        if os.path.isdir(src) and not os.path.islink(src):
+            transfer_tree(src, dst, callback)  # Refuses an existing dst unless resuming into it
+        elif os.path.islink(src):
+            if os.path.lexists(dst):
+                raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dst)
+            os.symlink(os.readlink(src), dst)
+            os.unlink(src)
+        else:
+            transfer_file(src, dst, callback)
@@ -0,0 +1,242 @@
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Dict, List
+
+from file_organizer import AIOrganizer, FileOrganizer, FileScanner, category_key
+from move_executor import MoveExecutor
+from plan import DONE, PlanWriter, suggestion_moves
+from progress import OperationCancelled, ProgressTracker
+
+logger = logging.getLogger(__name__)
+
+_END = object()  # Marks the end of a stage's output
+
+class Pipeline:
+    """Scan, suggest and move concurrently, with bounded memory.
+
+    Four stages run at once, joined by bounded queues:
+
+    scanner -> batcher -> plan compiler -> mover
+
+    The scanner yields records one directory at a time. The batcher
+    groups them into batches of batch_size and asks the model for up to
+    suggest_workers batches at a time. The compiler turns the suggestions,
+    in batch order, into moves with consistent top-level folder names. The
+    mover applies each move as it arrives. A full queue blocks the stage
+    that feeds it, so at most a few batches are in memory at once and
+    disk I/O overlaps with API latency.
+
+    Folders the plan moves files into are never scanned, so moved files
+    are not organized twice. The moves of a run form a single undo batch
+    in the FileOrganizer's history.
+    """
+
+    def __init__(self, base_path: Path, organizer: AIOrganizer = None, file_organizer: FileOrganizer = None,
+                 recursive: bool = False, batch_size: int = 200, queue_batches: int = 2,
+                 suggest_workers: int = 2, plan_path: Path = None, progress: ProgressTracker = None):
+        self.base_path = Path(base_path)
+        self.organizer = organizer or AIOrganizer()
+        self.file_organizer = file_organizer or FileOrganizer(self.base_path)
+        self.scanner = FileScanner(self.base_path)
+        self.recursive = recursive
+        self.batch_size = batch_size
+        self.suggest_workers = suggest_workers
+        self.plan_path = plan_path  # Optional NDJSON copy of every compiled move
+        self.progress = progress
+        self.records = queue.Queue(maxsize=batch_size * queue_batches)
+        self.batches = queue.Queue(maxsize=queue_batches + suggest_workers)
+        self.moves = queue.Queue(maxsize=batch_size * queue_batches)
+        self.targets = set()  # Top-level folders that moves go into
+        self.targets_lock = threading.Lock()
+        self.stop = threading.Event()
+        self.error = None
+        self.stats = {'scanned': 0, 'batches': 0, 'planned': 0, 'moved': 0, 'skipped': 0}
+
+    def put(self, q: queue.Queue, item) -> None:
+        """Blocking put that gives up when another stage has failed"""
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        raise OperationCancelled()
+
+    def get(self, q: queue.Queue):
+        while not self.stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        raise OperationCancelled()
+
+    def fail(self, e: Exception) -> None:
+        if self.error is None:
+            self.error = e
+        self.stop.set()
+
+    def skip_path(self, rel_path: str) -> bool:
+        top = Path(rel_path).parts[0]
+        with self.targets_lock:
+            return category_key(top) in self.targets
+
+    def scan_stage(self) -> None:
+        try:
+            for record in self.scanner.iter_scan(self.recursive, skip=self.skip_path):
+                if self.progress:
+                    self.progress.check()
+                self.stats['scanned'] += 1
+                self.put(self.records, record)
+            self.put(self.records, _END)
+        except OperationCancelled as e:
+            self.fail(e)
+        except Exception as e:
+            logger.error(f"Pipeline scan error: {str(e)}")
+            self.fail(e)
+
+    def suggest(self, batch: List) -> Dict:
+        if self.scanner.sniff_content:
+            self.scanner.apply_content_sniffing(batch)
+        if self.scanner.extract_metadata:
+            self.scanner.apply_metadata(batch)
+        return self.organizer.get_suggestion(batch)
+
+    def batch_stage(self, pool: ThreadPoolExecutor) -> None:
+        """Group records into batches and start their model requests.
+
+        Futures are queued in batch order; the bounded queue limits how
+        many requests are in flight or waiting to be compiled.
+        """
+        try:
+            batch = []
+            while True:
+                record = self.get(self.records)
+                if record is _END or len(batch) >= self.batch_size:
+                    if batch:
+                        self.stats['batches'] += 1
+                        self.put(self.batches, pool.submit(self.suggest, batch))
+                        batch = []
+                    if record is _END:
+                        break
+                batch.append(record)
+            self.put(self.batches, _END)
+        except OperationCancelled as e:
+            self.fail(e)
+        except Exception as e:
+            logger.error(f"Pipeline batching error: {str(e)}")
+            self.fail(e)
+
+    def compile_stage(self) -> None:
+        """Turn suggestions into moves with one spelling per top-level folder"""
+        canonical = {}
+        try:
+            with PlanWriter(self.plan_path, self.base_path) if self.plan_path else nullcontext() as writer:
+                while True:
+                    future = self.get(self.batches)
+                    if future is _END:
+                        break
+                    for move in suggestion_moves(future.result()):
+                        # Classify by the path the move will use, but keep the model's
+                        # new_path: moving normalizes it again
+                        target = Path(self.file_organizer.normalize_path(move['new_path'])).parts
+                        if len(target) > 1:
+                            key = category_key(target[0])
+                            top = canonical.setdefault(key, target[0])
+                            with self.targets_lock:
+                                self.targets.add(key)
+                            parts = list(Path(move['new_path']).parts)
+                            if len(parts) > 1:
+                                move['new_path'] = '/'.join([top] + parts[1:])
+                        if writer:
+                            writer.write(move)
+                        self.stats['planned'] += 1
+                        self.put(self.moves, move)
+            self.put(self.moves, _END)
+        except OperationCancelled as e:
+            self.fail(e)
+        except Exception as e:
+            logger.error(f"Pipeline planning error: {str(e)}")
+            self.fail(e)
+
+    def run(self) -> Dict[str, int]:
+        """Run all stages; moves happen on the calling thread. Returns counters.
+
+        Raises OperationCancelled if cancelled through progress, or the
+        first error any stage hit. Moves made before that stay in the undo
+        history.
+        """
+        pool = ThreadPoolExecutor(max_workers=self.suggest_workers)
+        threads = [
+            threading.Thread(target=self.scan_stage, daemon=True),
+            threading.Thread(target=self.batch_stage, args=(pool,), daemon=True),
+            threading.Thread(target=self.compile_stage, daemon=True)
+        ]
+        for thread in threads:
+            thread.start()
+
+        current_batch = []
+        moved_files = set()
+        try:
+            with MoveExecutor() as executor:
+                while True:
+                    move = self.get(self.moves)
+                    if move is _END:
+                        break
+                    status, record = self.file_organizer.move_item(executor, move, moved_files)
+                    if record:
+                        current_batch.append(record)
+                        moved_files.discard(record['from'])  # Sources are unique within a run
+                    self.stats['moved' if status == DONE else 'skipped'] += 1
+                    if self.progress:
+                        self.progress.advance()
+        except Exception as e:
+            self.fail(e)
+        finally:
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+            pool.shutdown(cancel_futures=True)
+            if current_batch:
+                self.file_organizer.move_history.append(current_batch)
+            if self.progress:
+                self.progress.finish()
+
+        if self.error is not None:
+            raise self.error
+        logger.info(f"Pipeline finished: {self.stats}")
+        return self.stats
+
+def main():
+    """python pipeline.py FOLDER [--recursive] [--plan PLAN.ndjson]: organize and move in one streaming pass"""
+    import sys
+    from file_organizer import print_progress
+    args = sys.argv[1:]
+    plan_path = None
+    if '--plan' in args:
+        index = args.index('--plan')
+        if index + 1 >= len(args):
+            print(main.__doc__)
+            return
+        plan_path = Path(args[index + 1])
+        del args[index:index + 2]
+    recursive = '--recursive' in args
+    folders = [arg for arg in args if arg != '--recursive']
+    if not folders:
+        print(main.__doc__)
+        return
+    folder = folders[0]
+    pipeline = Pipeline(Path(folder), recursive=recursive, plan_path=plan_path,
+                        progress=ProgressTracker("Organizing", print_progress))
+    try:
+        stats = pipeline.run()
+        print(f"\nMoved {stats['moved']} of {stats['scanned']} files ({stats['skipped']} skipped)")
+    except (OperationCancelled, KeyboardInterrupt):
+        pipeline.stop.set()
+        print("\nCancelled")
+
+if __name__ == '__main__':
+    main()
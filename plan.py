@@ -0,0 +1,316 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+# Per-move status values
+PENDING = 'pending'
+DONE = 'done'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+PLAN_DIR = Path.home() / '.file_organizer_plans'
+PLAN_FORMAT = 'file-organizer-plan'
+
+def open_plan_file(path, mode: str = 'r', compress: bool = None):
+    """Open a plan file as text; names ending in .gz are gzip-compressed"""
+    if compress is None:
+        compress = str(path).endswith('.gz')
+    if compress:
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+def suggestion_moves(suggestion: Dict) -> Iterator[Dict]:
+    """Flatten a {category: [moves]} suggestion into move dicts with their category
+    (and their 'source', for moves not suggested by the model)"""
+    for category, items in suggestion.items():
+        for item in items:
+            if isinstance(item, dict) and 'original_path' in item and 'new_path' in item:
+                move = {'original_path': item['original_path'], 'new_path': item['new_path'], 'category': category}
+                if item.get('source'):
+                    move['source'] = item['source']
+                yield move
+
+class PlanWriter:
+    """Write a plan as NDJSON: a header line, then one move per line.
+
+    Moves can be written as they are generated, so a plan never has to
+    exist in memory as a whole. Use as a context manager; the file is
+    written to a temporary name and only replaces path when closed without
+    an error.
+    """
+
+    def __init__(self, path, base_path: Path = None, **header):
+        self.path = Path(path)
+        self.temp = self.path.with_name(self.path.name + '.tmp')
+        self.count = 0
+        self.file = None
+        self.header = {'format': PLAN_FORMAT, 'version': 1, **header}
+        if base_path is not None:
+            self.header['base_path'] = str(base_path)
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open_plan_file(self.temp, 'w', compress=self.path.name.endswith('.gz'))
+        self.file.write(json.dumps(self.header) + '\n')
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.file.close()
+        if exc_type is None:
+            os.replace(self.temp, self.path)
+        else:
+            try:
+                os.unlink(self.temp)
+            except OSError:
+                pass
+
+    def write(self, move: Dict) -> None:
+        self.file.write(json.dumps(move) + '\n')
+        self.count += 1
+
+    def write_all(self, moves: Iterable[Dict]) -> int:
+        for move in moves:
+            self.write(move)
+        return self.count
+
+def read_plan_header(path) -> Dict:
+    with open_plan_file(path) as f:
+        header = json.loads(f.readline() or '{}')
+    if header.get('format') != PLAN_FORMAT:
+        raise ValueError(f"{path} is not a plan file")
+    return header
+
+def iter_plan_file(path) -> Iterator[Dict]:
+    """Lazily yield the moves of an NDJSON plan file, one line at a time.
+
+    Lines that are not valid moves are logged and skipped.
+    """
+    with open_plan_file(path) as f:
+        header = json.loads(f.readline() or '{}')
+        if header.get('format') != PLAN_FORMAT:
+            raise ValueError(f"{path} is not a plan file")
+        for number, line in enumerate(f, 2):
+            if not line.strip():
+                continue
+            try:
+                move = json.loads(line)
+            except ValueError as e:
+                logger.warning(f"Skipping line {number} of {path}: {e}")
+                continue
+            if isinstance(move, dict) and 'original_path' in move and 'new_path' in move:
+                yield move
+            else:
+                logger.warning(f"Skipping line {number} of {path}: not a move")
+
+class PlanMove:
+    """One planned move with its application status"""
+    __slots__ = ('original_path', 'new_path', 'category', 'status', 'error', 'source')
+
+    def __init__(self, original_path: str, new_path: str, category: str = '', status: str = PENDING,
+                 error: str = None, source: str = ''):
+        self.original_path = original_path
+        self.new_path = new_path
+        self.category = category
+        self.status = status
+        self.error = error
+        self.source = source
+
+    def to_dict(self) -> Dict:
+        data = {
+            'original_path': self.original_path,
+            'new_path': self.new_path,
+            'category': self.category,
+            'status': self.status
+        }
+        if self.error:
+            data['error'] = self.error
+        if self.source:
+            data['source'] = self.source
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'PlanMove':
+        return cls(data['original_path'], data['new_path'], data.get('category', ''),
+                   data.get('status', PENDING), data.get('error'), data.get('source', ''))
+
+    def item(self) -> Dict:
+        """The suggestion entry for this move"""
+        item = {'original_path': self.original_path, 'new_path': self.new_path}
+        if self.source:
+            item['source'] = self.source
+        return item
+
+class Plan:
+    """A persisted organization plan for one folder.
+
+    Plans are saved outside the folder being organized (so they are never
+    scanned or moved themselves) and track a status per move. If applying
+    is interrupted, reconcile() compares the outstanding moves with the
+    filesystem so a rerun only performs what is left, without asking the
+    model again.
+
+    While moves are applied, record() appends each status change to a
+    journal next to the plan instead of rewriting the whole file; load()
+    replays the journal and save() folds it back into the plan.
+    """
+
+    def __init__(self, base_path: Path, moves: List[PlanMove] = None, path: Path = None,
+                 created: float = None):
+        self.base_path = Path(base_path)
+        self.moves = moves or []
+        self.path = path or self.default_path(self.base_path)
+        self.created = created or time.time()
+        self.journal = None  # Open journal file while recording
+
+    @property
+    def journal_path(self) -> Path:
+        return self.path.with_name(self.path.name + '.journal')
+
+    @staticmethod
+    def default_path(base_path: Path) -> Path:
+        digest = hashlib.sha1(str(Path(base_path).resolve()).encode('utf-8')).hexdigest()[:16]
+        return PLAN_DIR / f"{digest}.ndjson"
+
+    @classmethod
+    def from_suggestion(cls, base_path: Path, suggestion: Dict) -> 'Plan':
+        return cls.from_moves(base_path, suggestion_moves(suggestion))
+
+    @classmethod
+    def from_moves(cls, base_path: Path, moves: Iterable[Dict]) -> 'Plan':
+        """Build a plan from move dicts, e.g. those streamed by iter_plan_file()"""
+        return cls(base_path, [PlanMove.from_dict(move) for move in moves])
+
+    def to_suggestion(self) -> Dict:
+        suggestion = {}
+        for move in self.moves:
+            suggestion.setdefault(move.category, []).append(move.item())
+        return suggestion
+
+    def outstanding(self) -> Iterator[PlanMove]:
+        return (move for move in self.moves if move.status in (PENDING, FAILED))
+
+    def summary(self) -> Dict[str, int]:
+        counts = {PENDING: 0, DONE: 0, SKIPPED: 0, FAILED: 0}
+        for move in self.moves:
+            counts[move.status] = counts.get(move.status, 0) + 1
+        return counts
+
+    @property
+    def complete(self) -> bool:
+        return not any(True for _ in self.outstanding())
+
+    def reconcile(self, normalize=None) -> int:
+        """Update outstanding moves from the filesystem; returns how many are left.
+
+        A move whose source is gone and whose target exists is marked done
+        (it happened before the interruption); one whose source still
+        exists is pending again; one with neither is skipped. Failed moves
+        (permission errors and the like) are retried.
+        """
+        base = str(self.base_path)
+        left = 0
+        for move in self.outstanding():
+            new_path = normalize(move.new_path) if normalize else move.new_path
+            source = os.path.join(base, move.original_path)
+            target = os.path.join(base, new_path)
+            if os.path.lexists(source):
+                move.status, move.error = PENDING, None
+                left += 1
+            elif os.path.lexists(target):
+                move.status, move.error = DONE, None
+            else:
+                move.status, move.error = SKIPPED, 'source missing'
+        return left
+
+    def save(self) -> None:
+        """Write the plan atomically as NDJSON, one move (with its status) per line,
+        and drop the journal it supersedes"""
+        self.close_journal()
+        with PlanWriter(self.path, self.base_path, created=self.created) as writer:
+            for move in self.moves:
+                writer.write(move.to_dict())
+        self.remove_journal()
+
+    def record(self, move: PlanMove) -> None:
+        """Append a move's current status to the journal"""
+        if self.journal is None:
+            self.journal = open(self.journal_path, 'a', encoding='utf-8')
+        entry = {'original_path': move.original_path, 'status': move.status}
+        if move.error:
+            entry['error'] = move.error
+        self.journal.write(json.dumps(entry) + '\n')
+        self.journal.flush()
+
+    def close_journal(self) -> None:
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    def remove_journal(self) -> None:
+        try:
+            self.journal_path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def replay_journal(self) -> int:
+        """Apply the statuses recorded since the last save; returns how many"""
+        if not self.journal_path.exists():
+            return 0
+        moves = {move.original_path: move for move in self.moves}
+        count = 0
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    move = moves[entry['original_path']]
+                except (ValueError, KeyError, TypeError):
+                    continue  # A line cut off by a crash, or a stale entry
+                move.status, move.error = entry.get('status', move.status), entry.get('error')
+                count += 1
+        return count
+
+    def export(self, path) -> int:
+        """Write the moves to a plan file (gzip-compressed if path ends in .gz)"""
+        with PlanWriter(path, self.base_path) as writer:
+            for move in self.moves:
+                writer.write({**move.item(), 'category': move.category})
+        return writer.count
+
+    def discard(self) -> None:
+        self.close_journal()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+        self.remove_journal()
+
+    @classmethod
+    def load(cls, path: Path) -> 'Plan':
+        header = read_plan_header(path)
+        plan = cls(
+            header['base_path'],
+            [PlanMove.from_dict(m) for m in iter_plan_file(path)],
+            path=Path(path),
+            created=header.get('created')
+        )
+        plan.replay_journal()
+        return plan
+
+    @classmethod
+    def load_for(cls, base_path: Path) -> 'Plan':
+        """The saved plan for a folder, or None"""
+        path = cls.default_path(base_path)
+        if not path.exists():
+            return None
+        try:
+            return cls.load(path)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not load saved plan {path}: {e}")
+            return None
@@ -0,0 +1,136 @@
+import math
+import re
+from typing import Dict, List, Optional, Tuple
+
+# Word pieces as BPE tokenizers tend to split them: runs of letters (long
+# ones in several pieces), up to three digits, and single punctuation marks
+TOKEN_PIECE = re.compile(r"[A-Za-z]+|[0-9]{1,3}|[^\sA-Za-z0-9]")
+LETTERS_PER_TOKEN = 6
+
+# Tokens around each move in a reply: {"original_path": "", "new_path": ""},
+MOVE_OVERHEAD = 16
+
+# Used until a model has timing history: seconds per request, seconds per completion token
+DEFAULT_LATENCY = (2.0, 0.02)
+
+def count_tokens(text: str) -> int:
+    """Approximate tokenizer count of text without a model-specific vocabulary"""
+    count = 0
+    for piece in TOKEN_PIECE.findall(text):
+        count += 1 + (len(piece) - 1) // LETTERS_PER_TOKEN if piece[0].isalpha() else 1
+    return count
+
+def fit_latency(timing: Dict) -> Optional[Tuple[float, float]]:
+    """Least-squares (overhead, seconds per completion token) from running sums
+    {n, x, y, xx, xy} of (completion tokens, seconds), or None without enough spread"""
+    n = timing.get('n', 0)
+    if n < 3:
+        return None
+    x, y, xx, xy = timing['x'], timing['y'], timing['xx'], timing['xy']
+    spread = n * xx - x * x
+    if spread <= 0:
+        return None
+    per_token = (n * xy - x * y) / spread
+    overhead = (y - per_token * x) / n
+    if per_token <= 0:
+        # Latency not growing with length (noise, or dominated by queueing): use the mean rate
+        per_token = y / x if x else DEFAULT_LATENCY[1]
+        overhead = 0.0
+    return max(0.0, overhead), per_token
+
+def estimate_run(entries: List[str], instructions: str, latency: Tuple[float, float] = None,
+                 target_seconds: float = None, max_concurrency: int = 8, tokens_per_minute: float = None,
+                 requests_per_minute: float = None, max_completion_tokens: int = 16000,
+                 request_timeout: float = None) -> Dict:
+    """Predict the tokens, requests and wall time of organizing a file list.
+
+    entries are the file list lines of the prompt, instructions the text
+    repeated in every request. latency is (overhead, seconds per
+    completion token), e.g. from the model's timing history. Requests run
+    max_concurrency at a time. The batch size is the largest that keeps
+    each reply under max_completion_tokens and each request under
+    request_timeout seconds; if that misses target_seconds, batches
+    shrink until the run fits (or is as fast as it gets). The rate limits
+    put a floor under the predicted time.
+    """
+    overhead, per_token = latency or DEFAULT_LATENCY
+    instruction_tokens = count_tokens(instructions)
+    entry_tokens = [count_tokens(entry) for entry in entries]
+    files = len(entries)
+    listed = sum(entry_tokens)
+    # Each move repeats the path twice plus the new folder
+    completion = sum(2 * tokens + MOVE_OVERHEAD for tokens in entry_tokens)
+    per_file = completion / files if files else 0
+
+    def wall_time(batch: int) -> float:
+        requests = math.ceil(files / batch)
+        return math.ceil(requests / max_concurrency) * (overhead + batch * per_file * per_token)
+
+    # Largest batch the reply budget allows: fewest requests, least repeated instructions
+    batch = max(1, min(files, int(max_completion_tokens / per_file))) if per_file else max(1, files)
+    if request_timeout and per_file and per_token:
+        # A request that outlasts the timeout is retried until the scheduler gives up
+        batch = max(1, min(batch, int((request_timeout - overhead) / (per_file * per_token))))
+    if target_seconds and files and wall_time(batch) > target_seconds:
+        # More, smaller requests in w rounds of max_concurrency; take the fewest rounds that
+        # meet the target, or the fastest if none does
+        best = batch
+        rounds = 1
+        while True:
+            candidate = min(batch, math.ceil(files / (max_concurrency * rounds)))
+            if wall_time(candidate) < wall_time(best):
+                best = candidate
+            if wall_time(best) <= target_seconds or candidate == 1:
+                break
+            rounds += 1
+        batch = best
+    requests = math.ceil(files / batch) if files else 0
+    concurrency = max(1, min(max_concurrency, requests))
+    request_seconds = overhead + batch * per_file * per_token
+    seconds = wall_time(batch) if files else 0.0
+
+    prompt = listed + requests * instruction_tokens
+    # A run cannot go faster than the rate limits let its requests through;
+    # the buckets start with a minute's allowance
+    if tokens_per_minute:
+        seconds = max(seconds, 60.0 * (prompt + completion) / tokens_per_minute - 60.0)
+    if requests_per_minute:
+        seconds = max(seconds, 60.0 * requests / requests_per_minute - 60.0)
+    return {
+        'files': files,
+        'prompt_tokens': prompt,
+        'completion_tokens': int(completion),
+        'batch_size': batch,
+        'requests': requests,
+        'concurrency': concurrency,
+        'request_seconds': request_seconds,
+        'seconds': seconds,
+        'measured': latency is not None,
+        'meets_target': not target_seconds or seconds <= target_seconds
+    }
+
+def describe_estimate(estimate: Dict) -> str:
+    """One-line summary of estimate_run()"""
+    text = (f"~{estimate['prompt_tokens'] + estimate['completion_tokens']:,} tokens "
+            f"({estimate['prompt_tokens']:,} in, {estimate['completion_tokens']:,} out), "
+            f"{estimate['requests']} request{'s' if estimate['requests'] != 1 else ''}")
+    if estimate['requests'] > 1:
+        text += f" of {estimate['batch_size']} files, {estimate['concurrency']} at a time"
+    text += f", ~{format_duration(estimate['seconds'])}"
+    notes = []
+    if not estimate['meets_target']:
+        notes.append("over the target")
+    if not estimate['measured']:
+        notes.append("no timing history for this model yet")
+    if notes:
+        text += f" ({'; '.join(notes)})"
+    return text
+
+def format_duration(seconds: float) -> str:
+    if seconds < 10:
+        return f"{seconds:.1f}s"
+    if seconds < 60:
+        return f"{seconds:.0f}s"
+    if seconds < 3600:
+        return f"{seconds / 60:.1f} min"
+    return f"{seconds / 3600:.1f} h"
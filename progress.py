@@ -0,0 +1,122 @@
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+class OperationCancelled(Exception):
+    """Raised from a hot loop when its cancel token has been triggered"""
+
+class CancelToken:
+    """Thread-safe flag that long-running operations poll to stop early"""
+
+    def __init__(self):
+        self.event = threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.event.is_set()
+
+    def check(self):
+        if self.event.is_set():
+            raise OperationCancelled()
+
+def format_bytes(count: float) -> str:
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if count < 1024:
+            return f"{count:.0f} {unit}" if unit == 'B' else f"{count:.1f} {unit}"
+        count /= 1024
+    return f"{count:.1f} TB"
+
+class ProgressTracker:
+    """Files/bytes done, rate and ETA for one operation.
+
+    Workers call advance() from their hot loops; it also checks the cancel
+    token. Snapshots go to callback at most every interval seconds (and
+    always on finish()), so the CLI or the GUI message queue can consume
+    them without being flooded.
+    """
+
+    def __init__(self, operation: str, callback: Callable = None, cancel_token: CancelToken = None,
+                 files_total: int = None, bytes_total: int = None, interval: float = 0.2):
+        self.operation = operation
+        self.callback = callback
+        self.cancel_token = cancel_token or CancelToken()
+        self.files_total = files_total
+        self.bytes_total = bytes_total
+        self.files_done = 0
+        self.bytes_done = 0
+        self.interval = interval
+        self.started = time.monotonic()
+        self.last_report = 0.0
+        self.lock = threading.Lock()
+
+    def check(self):
+        self.cancel_token.check()
+
+    def set_totals(self, files: int = None, bytes: int = None):
+        with self.lock:
+            if files is not None:
+                self.files_total = files
+            if bytes is not None:
+                self.bytes_total = bytes
+        self.report(force=True)
+
+    def advance(self, files: int = 1, bytes: int = 0):
+        """Record finished work, raise OperationCancelled if cancelled, maybe report"""
+        with self.lock:
+            self.files_done += files
+            self.bytes_done += bytes
+        self.cancel_token.check()
+        self.report()
+
+    def report(self, force: bool = False):
+        if not self.callback:
+            return
+        now = time.monotonic()
+        if not force and now - self.last_report < self.interval:
+            return
+        self.last_report = now
+        self.callback(self.snapshot())
+
+    def finish(self):
+        self.report(force=True)
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            elapsed = max(time.monotonic() - self.started, 1e-6)
+            files_rate = self.files_done / elapsed
+            bytes_rate = self.bytes_done / elapsed
+            eta: Optional[float] = None
+            fraction: Optional[float] = None
+            if self.bytes_total and self.bytes_done:
+                fraction = min(1.0, self.bytes_done / self.bytes_total)
+                eta = (self.bytes_total - self.bytes_done) / bytes_rate if bytes_rate else None
+            elif self.files_total:
+                fraction = min(1.0, self.files_done / self.files_total)
+                eta = (self.files_total - self.files_done) / files_rate if files_rate else None
+            return {
+                'operation': self.operation,
+                'files_done': self.files_done,
+                'files_total': self.files_total,
+                'bytes_done': self.bytes_done,
+                'bytes_total': self.bytes_total,
+                'elapsed': elapsed,
+                'files_per_second': files_rate,
+                'bytes_per_second': bytes_rate,
+                'fraction': fraction,
+                'eta': eta
+            }
+
+def describe(snapshot: Dict) -> str:
+    """One-line human readable progress, e.g. for a status bar"""
+    text = f"{snapshot['operation']}: {snapshot['files_done']}"
+    if snapshot['files_total']:
+        text += f"/{snapshot['files_total']}"
+    text += f" files ({snapshot['files_per_second']:.0f}/s)"
+    if snapshot['bytes_done']:
+        text += f", {format_bytes(snapshot['bytes_done'])} ({format_bytes(snapshot['bytes_per_second'])}/s)"
+    if snapshot['eta'] is not None:
+        text += f", ETA {snapshot['eta']:.0f}s"
+    return text
@@ -0,0 +1,166 @@
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Lower values are dispatched first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for rate limiting (about 4 characters per token)"""
+    return len(text) // 4 + 1
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at a per-minute rate"""
+
+    def __init__(self, per_minute: float, capacity: float = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Take amount from the bucket and return how long to wait before using it"""
+        with self.lock:
+            self._refill()
+            # Never let a single oversized request wait forever
+            amount = min(amount, self.capacity)
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def refund(self, amount: float):
+        """Give back (or with a negative amount, charge) tokens after the fact"""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+class RequestScheduler:
+    """Admission control for completion requests against one endpoint.
+
+    Requests wait in a priority queue, are paced by token buckets for
+    requests and tokens per minute, and run under an adaptive concurrency
+    limit: the limit grows by one slot per window of fast successes and is
+    halved on 429s, timeouts or latency above target (AIMD). A Retry-After
+    header pauses dispatch for the whole endpoint.
+    """
+
+    def __init__(self, requests_per_minute: float = 60, tokens_per_minute: float = 90000,
+                 max_concurrency: int = 8, target_latency: float = 30.0, max_retries: int = 3):
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.max_retries = max_retries
+        self.limit = 1.0
+        self.active = 0
+        self.paused_until = 0.0
+        self.waiting = []
+        self.counter = itertools.count()
+        self.cond = threading.Condition()
+
+    def submit(self, fn: Callable, estimated_tokens: int = 0, priority: int = PRIORITY_BATCH,
+               usage: Callable = None):
+        """Run fn under the scheduler's limits and return its result.
+
+        Rate-limit errors and timeouts are retried up to max_retries times.
+        If usage is given it is called with fn's result and should return
+        the actual token count, which corrects the token bucket.
+        """
+        attempt = 0
+        while True:
+            self._acquire(priority, estimated_tokens)
+            start = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self.retry_delay(e)
+                self._release(time.monotonic() - start, congested=delay is not None)
+                if delay is None or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                logger.warning(f"Request throttled ({type(e).__name__}), retrying in {delay:.1f}s "
+                               f"(attempt {attempt}/{self.max_retries})")
+                with self.cond:
+                    self.paused_until = max(self.paused_until, time.monotonic() + delay)
+                continue
+
+            self._release(time.monotonic() - start, congested=False)
+            if usage is not None:
+                try:
+                    actual = usage(result)
+                    if actual:
+                        self.token_bucket.refund(estimated_tokens - actual)
+                except Exception as e:
+                    logger.debug(f"Could not read token usage: {e}")
+            return result
+
+    def retry_delay(self, error: Exception) -> Optional[float]:
+        """Seconds to back off for a retryable error, or None if it is not retryable"""
+        status = getattr(error, 'status_code', None)
+        if status == 429 or status == 503:
+            response = getattr(error, 'response', None)
+            headers = getattr(response, 'headers', None) or {}
+            try:
+                return max(float(headers.get('retry-after', 0)), 1.0)
+            except (TypeError, ValueError):
+                return 5.0
+        if 'Timeout' in type(error).__name__:
+            return 1.0
+        return None
+
+    def _acquire(self, priority: int, estimated_tokens: int):
+        ticket = (priority, next(self.counter))
+        with self.cond:
+            heapq.heappush(self.waiting, ticket)
+            while True:
+                now = time.monotonic()
+                if self.waiting[0] == ticket and self.active < int(self.limit) and now >= self.paused_until:
+                    break
+                timeout = self.paused_until - now if now < self.paused_until else None
+                self.cond.wait(timeout)
+            heapq.heappop(self.waiting)
+            self.active += 1
+            self.cond.notify_all()
+
+        # Pace outside the lock; the slot is already held so ordering is kept
+        wait = max(self.request_bucket.reserve(1), self.token_bucket.reserve(estimated_tokens))
+        if wait > 0:
+            time.sleep(wait)
+
+    def _release(self, latency: float, congested: bool):
+        with self.cond:
+            self.active -= 1
+            if congested or latency > self.target_latency:
+                self.limit = max(1.0, self.limit / 2)
+            else:
+                self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+            self.cond.notify_all()
+
+_schedulers: Dict[str, RequestScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+def get_scheduler(endpoint: str) -> RequestScheduler:
+    """Return the shared scheduler for an endpoint, creating it from the environment"""
+    key = (endpoint or '').rstrip('/')
+    with _schedulers_lock:
+        if key not in _schedulers:
+            _schedulers[key] = RequestScheduler(
+                requests_per_minute=float(os.getenv('RATE_LIMIT_RPM', 60)),
+                tokens_per_minute=float(os.getenv('RATE_LIMIT_TPM', 90000)),
+                max_concurrency=int(os.getenv('MAX_CONCURRENCY', 8))
+            )
+        return _schedulers[key]
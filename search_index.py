@@ -0,0 +1,130 @@
+import bisect
+import logging
+from typing import Dict, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+SEPARATOR = '\0'  # Cannot appear in a path, so no match spans two entries
+
+class SearchIndex:
+    """Case-insensitive prefix and substring lookup over a fixed list of strings.
+
+    Built once (e.g. per scan) and then queried on every keystroke:
+
+    - the lowercased entries are joined into one string, so a substring
+      search is a handful of str.find calls in C instead of a Python loop
+      over every entry; an offset table maps hits back to entry ids
+    - a sorted copy of the entries' file names answers prefix lookups by
+      bisection
+    - when a query extends the previous one, only the previous matches
+      are re-checked
+
+    Queries are whitespace-separated terms that must all match; a term
+    starting with '^' must start the file name ("^inv pdf"). Results are
+    entry ids (positions in the original list).
+    """
+
+    def __init__(self, entries: Iterable[str]):
+        self.texts = [entry.lower() for entry in entries]
+        self.offsets = []
+        position = 0
+        for text in self.texts:
+            self.offsets.append(position)
+            position += len(text) + 1
+        self.haystack = SEPARATOR.join(self.texts)
+        # Lowercased file names; '/' and '\\' both separate folders
+        self.file_names = [text.replace('\\', '/').rsplit('/', 1)[-1] for text in self.texts]
+        self.names = sorted(zip(self.file_names, range(len(self.texts))))
+        self.last_query = None
+        self.last_results: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def prefix(self, term: str) -> List[int]:
+        """Ids of entries whose file name starts with term, in name order"""
+        term = term.lower()
+        start = bisect.bisect_left(self.names, (term,))
+        results = []
+        for name, entry_id in self.names[start:]:
+            if not name.startswith(term):
+                break
+            results.append(entry_id)
+        return results
+
+    def substring(self, term: str) -> List[int]:
+        """Ids of entries containing term anywhere, in entry order"""
+        term = term.lower()
+        if self.haystack.count(term) * 8 > len(self.texts):
+            # Common terms hit most entries; checking each one is cheaper than mapping hits
+            return [i for i, text in enumerate(self.texts) if term in text]
+        results = []
+        find, offsets = self.haystack.find, self.offsets
+        position = find(term)
+        while position != -1:
+            entry_id = bisect.bisect_right(offsets, position) - 1
+            results.append(entry_id)
+            # Skip to the next entry; one hit per entry is enough
+            next_entry = entry_id + 1
+            if next_entry >= len(offsets):
+                break
+            position = find(term, offsets[next_entry])
+        return results
+
+    def search(self, query: str) -> List[int]:
+        """Ids of entries containing every term, in entry order"""
+        query = query.lower()
+        terms = query.split()
+        if not terms:
+            return list(range(len(self.texts)))
+        if self.refines(terms):
+            # Refining the previous query can only drop matches
+            results = self.narrow(self.last_results, terms)
+        else:
+            prefixes = [term for term in terms if is_prefix_term(term)]
+            if prefixes:
+                terms.remove(prefixes[0])
+                results = sorted(self.prefix(prefixes[0][1:]))
+            else:
+                terms.sort(key=len, reverse=True)
+                results = self.substring(terms.pop(0))
+            results = self.narrow(results, terms)
+        self.last_query, self.last_results = query, results
+        return results
+
+    def refines(self, terms: List[str]) -> bool:
+        """Whether every match of terms is also a match of the previous query"""
+        if not self.last_query:
+            return False
+        previous = self.last_query.split()
+        if not previous or len(terms) < len(previous):
+            return False
+        # Each previous term must be implied by the term now in its place; a lone
+        # '^' is a plain term, so '^' -> '^inv' changes how the term matches
+        for old, new in zip(previous, terms):
+            if is_prefix_term(old) != is_prefix_term(new):
+                return False
+            if is_prefix_term(old) and not new.startswith(old):
+                return False
+            if not is_prefix_term(old) and old not in new:
+                return False
+        return True
+
+    def narrow(self, ids: List[int], terms: List[str]) -> List[int]:
+        texts, names = self.texts, self.file_names
+        for term in terms:
+            if is_prefix_term(term):
+                ids = [i for i in ids if names[i].startswith(term[1:])]
+            else:
+                ids = [i for i in ids if term in texts[i]]
+        return ids
+
+def is_prefix_term(term: str) -> bool:
+    return term.startswith('^') and len(term) > 1
+
+def group_matches(ids: Iterable[int], groups: List[str]) -> Dict[str, List[int]]:
+    """Group matching ids by a per-entry key, keeping the groups' first-seen order"""
+    grouped: Dict[str, List[int]] = {}
+    for entry_id in ids:
+        grouped.setdefault(groups[entry_id], []).append(entry_id)
+    return grouped
@@ -0,0 +1,80 @@
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Tuple
+
+def request_key(*parts) -> str:
+    """Stable key for a request. Strings are used as they are: prompts carry
+    file paths, where whitespace is significant"""
+    data = json.dumps(list(parts), sort_keys=True, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+class Flight:
+    """One in-flight call: its future, what it has streamed so far, and how
+    many callers still want it"""
+
+    def __init__(self):
+        self.future = Future()
+        self.partials: List[List[str]] = []  # Streamed pieces, one list per attempt
+        self.cancelled = threading.Event()
+        self.callers = 1
+
+    def partial(self) -> str:
+        """The longest reply streamed so far"""
+        return max((''.join(p) for p in list(self.partials)), key=len, default='')
+
+class SingleFlight:
+    """Coalesce concurrent identical calls into one.
+
+    The first caller for a key runs fn; callers arriving with the same key
+    while it is in flight wait for and share its result (or exception).
+    Nothing is cached once the call finishes. A caller that stops waiting
+    early calls leave(); the call is cancelled once nobody is left.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight: Dict[str, Flight] = {}
+        self.shared = 0  # Calls answered by another caller's request
+
+    def join(self, key: str) -> Tuple[Flight, bool]:
+        """The flight for key and whether the caller leads it (and must run() it)"""
+        with self.lock:
+            flight = self.in_flight.get(key)
+            if flight is not None and not flight.cancelled.is_set():
+                flight.callers += 1
+                self.shared += 1
+                return flight, False
+            flight = Flight()
+            self.in_flight[key] = flight
+            return flight, True
+
+    def run(self, key: str, flight: Flight, fn: Callable):
+        """Run a led flight's call, publishing its result to the followers"""
+        try:
+            result = fn(flight)
+        except BaseException as e:
+            flight.future.set_exception(e)
+            raise
+        else:
+            flight.future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                if self.in_flight.get(key) is flight:
+                    del self.in_flight[key]
+
+    def leave(self, flight: Flight) -> None:
+        """Stop waiting for a flight; the last caller to leave cancels it"""
+        with self.lock:
+            flight.callers -= 1
+            if flight.callers <= 0:
+                flight.cancelled.set()
+
+    def do(self, key: str, fn: Callable):
+        """Run fn(flight), or wait for the identical call already in flight"""
+        flight, leader = self.join(key)
+        if leader:
+            return self.run(key, flight, fn)
+        return flight.future.result()
@@ -0,0 +1,190 @@
+import errno
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from move_executor import RENAME_EXCHANGE, MoveExecutor
+
+logger = logging.getLogger(__name__)
+
+class StagingError(Exception):
+    """The plan cannot be staged or the staged tree cannot be committed"""
+
+def has_unique_files(path: Path) -> bool:
+    """Whether a tree holds any file with no other hard link"""
+    for root, _, files in os.walk(path):
+        for name in files:
+            if os.lstat(os.path.join(root, name)).st_nlink < 2:
+                return True
+    return False
+
+class ShadowStage:
+    """Materialize a plan as a hard-linked shadow tree, then swap it in.
+
+    build() recreates the whole folder next to it (as .NAME.staged) with
+    every file hard-linked at its planned location and everything else
+    where it was. No data is copied, and the layout can be browsed before
+    anything changes. commit() exchanges the two directories (atomically
+    with renameat2 RENAME_EXCHANGE where available); the old layout stays
+    next to the folder as .NAME.previous, so undo() is another swap and
+    rollback() before committing is just deleting the shadow tree.
+
+    The shadow tree must be on the same filesystem as the folder.
+    """
+
+    def __init__(self, base_path: Path):
+        self.base_path = Path(base_path).resolve()
+        parent, name = self.base_path.parent, self.base_path.name
+        self.shadow_path = parent / f".{name}.staged"
+        self.previous_path = parent / f".{name}.previous"
+        self.manifest = set()  # Files (relative paths) the shadow tree was built from
+        self.moved = 0
+        self.skipped = 0
+        self.committed = False
+
+    def destination(self, rel_path: str, moves: Dict[str, str]) -> Optional[str]:
+        """Planned location of a file: its own move, or its moved ancestor's"""
+        path = rel_path
+        while path:
+            if path in moves:
+                return moves[path] + rel_path[len(path):]
+            path = os.path.dirname(path)
+        return None
+
+    def build(self, moves: Iterable[Dict], normalize=None) -> Path:
+        """Create the shadow tree for moves ({'original_path', 'new_path'} dicts).
+
+        Files whose target is already taken keep their current location,
+        as a no-clobber move would.
+        """
+        self.discard_shadow()
+        planned = {}
+        for move in moves:
+            new_path = normalize(move['new_path']) if normalize else move['new_path']
+            planned[os.path.normpath(move['original_path'])] = os.path.normpath(new_path)
+
+        entries = []  # (relative source, destination or None)
+        for root, dirs, files in os.walk(self.base_path):
+            rel_root = os.path.relpath(root, self.base_path)
+            rel_root = '' if rel_root == '.' else rel_root
+            links = [d for d in dirs if os.path.islink(os.path.join(root, d))]
+            for name in files + links:
+                rel_path = os.path.join(rel_root, name)
+                entries.append((rel_path, self.destination(rel_path, planned)))
+            for name in dirs:
+                if name not in links:
+                    rel_path = os.path.join(rel_root, name)
+                    entries.append((rel_path + os.sep, self.destination(rel_path, planned)))
+            dirs[:] = [d for d in dirs if d not in links]
+
+        # Files that stay put claim their paths before planned moves do
+        entries.sort(key=lambda entry: entry[1] is not None)
+        try:
+            os.mkdir(self.shadow_path)
+            shutil.copystat(self.base_path, self.shadow_path)
+            for rel_path, destination in entries:
+                if rel_path.endswith(os.sep):
+                    # Recreate directories (empty ones included) where they end up
+                    target = destination + os.sep if destination else rel_path
+                    os.makedirs(self.shadow_path / target, exist_ok=True)
+                    continue
+                self.manifest.add(rel_path)
+                if destination and self.link(rel_path, destination):
+                    self.moved += 1
+                    continue
+                if destination:
+                    self.skipped += 1
+                if not self.link(rel_path, rel_path):
+                    raise StagingError(f"Could not stage {rel_path}")
+        except OSError as e:
+            self.discard_shadow()
+            if e.errno == errno.EXDEV:
+                raise StagingError("Staging needs the folder's parent on the same filesystem") from e
+            raise StagingError(f"Could not build staged tree: {str(e)}") from e
+        logger.info(f"Staged {self.moved} moves ({self.skipped} skipped) in {self.shadow_path}")
+        return self.shadow_path
+
+    def link(self, rel_path: str, destination: str) -> bool:
+        """Hard-link (or re-create a symlink) into the shadow tree; False if taken"""
+        source = self.base_path / rel_path
+        target = self.shadow_path / destination
+        target.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            if os.path.islink(source):
+                os.symlink(os.readlink(source), target)
+            else:
+                os.link(source, target, follow_symlinks=False)
+        except FileExistsError:
+            logger.warning(f"Target already exists, keeping {rel_path} in place")
+            return False
+        return True
+
+    def changed_files(self) -> int:
+        """How many files were added or removed in the folder since build()"""
+        current = set()
+        for root, dirs, files in os.walk(self.base_path):
+            rel_root = os.path.relpath(root, self.base_path)
+            rel_root = '' if rel_root == '.' else rel_root
+            current.update(os.path.join(rel_root, name) for name in files)
+            current.update(os.path.join(rel_root, d) for d in dirs if os.path.islink(os.path.join(root, d)))
+        return len(current ^ self.manifest)
+
+    def exchange(self, first: Path, second: Path) -> None:
+        """Swap two sibling directories, atomically where the platform allows"""
+        with MoveExecutor() as executor:
+            if executor.use_dir_fds:
+                fd = executor.dir_fd(str(first.parent))
+                try:
+                    executor.rename_at(fd, first.name, fd, second.name, RENAME_EXCHANGE)
+                    return
+                except OSError as e:
+                    if e.errno != errno.ENOSYS:
+                        raise
+        # Three renames; the folder is briefly absent
+        temp = first.with_name(first.name + '.swap')
+        os.rename(second, temp)
+        os.rename(first, second)
+        os.rename(temp, first)
+
+    def commit(self) -> None:
+        """Swap the staged tree into place, keeping the old layout as .NAME.previous"""
+        if not self.shadow_path.is_dir():
+            raise StagingError("Nothing is staged")
+        changed = self.changed_files()
+        if changed:
+            raise StagingError(f"{changed} files were added or removed since staging; stage again")
+        if self.previous_path.exists():
+            if has_unique_files(self.previous_path):
+                raise StagingError(f"{self.previous_path} holds files that exist nowhere else; move or delete it first")
+            shutil.rmtree(self.previous_path)
+        self.exchange(self.shadow_path, self.base_path)
+        os.rename(self.shadow_path, self.previous_path)
+        self.committed = True
+        logger.info(f"Committed staged layout; previous layout kept in {self.previous_path}")
+
+    def rollback(self) -> None:
+        """Drop the staged tree without touching the folder"""
+        self.discard_shadow()
+
+    def undo(self) -> bool:
+        """Swap the previous layout back in after a commit"""
+        if not self.committed or not self.previous_path.is_dir():
+            logger.error("No previous layout to restore")
+            return False
+        self.exchange(self.previous_path, self.base_path)
+        self.committed = False
+        # Files created after the commit exist only in the swapped-out tree; keep it then
+        if has_unique_files(self.previous_path):
+            logger.warning(f"New files found in the replaced layout, keeping it in {self.previous_path}")
+            return True
+        shutil.rmtree(self.previous_path)
+        logger.info("Restored previous layout")
+        return True
+
+    def discard_shadow(self) -> None:
+        if self.shadow_path.exists():
+            shutil.rmtree(self.shadow_path)
+        self.manifest = set()
+        self.moved = self.skipped = 0
@@ -0,0 +1,183 @@
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from preflight import fit_latency
+
+logger = logging.getLogger(__name__)
+
+STATS_FILE = Path.home() / '.file_organizer_stats.json'
+
+# Ways of asking for JSON, best first; 'none' relies on the prompt alone
+JSON_SCHEMA = 'json_schema'
+JSON_OBJECT = 'json_object'
+PLAIN = 'none'
+MODES = (JSON_SCHEMA, JSON_OBJECT, PLAIN)
+
+# How a reply was parsed
+DIRECT = 'direct'    # json.loads on the reply as is
+CLEANED = 'cleaned'  # Only after stripping markdown and trailing text
+FAILED = 'failed'    # Not a JSON object at all
+OUTCOMES = (DIRECT, CLEANED, FAILED)
+
+# Same shape as the prompt's example: {category: [{original_path, new_path}]}
+SUGGESTION_SCHEMA = {
+    'type': 'object',
+    'additionalProperties': {
+        'type': 'array',
+        'items': {
+            'type': 'object',
+            'properties': {
+                'original_path': {'type': 'string'},
+                'new_path': {'type': 'string'}
+            },
+            'required': ['original_path', 'new_path'],
+            'additionalProperties': False
+        }
+    }
+}
+
+def response_format(mode: str) -> Optional[Dict]:
+    """The response_format argument for a mode (None for PLAIN)"""
+    if mode == JSON_SCHEMA:
+        # Not strict: strict schemas cannot have free-form category keys
+        return {'type': 'json_schema',
+                'json_schema': {'name': 'file_organization', 'schema': SUGGESTION_SCHEMA, 'strict': False}}
+    if mode == JSON_OBJECT:
+        return {'type': 'json_object'}
+    return None
+
+def endpoint_key(base_url: str, model: str) -> str:
+    return f"{(base_url or '').rstrip('/')} [{model}]"
+
+class ReplyStats:
+    """Structured-output support per endpoint and reply quality per model, kept across runs.
+
+    modes remembers which of MODES each endpoint/model accepted, so the
+    detection requests happen once. models counts, per model, requests,
+    how their replies parsed (OUTCOMES), scheduler retries and follow-up
+    requests for files a reply left out, and keeps running sums of reply
+    length against latency for preflight estimates. Stored as JSON in
+    STATS_FILE.
+    """
+
+    def __init__(self, path: Path = STATS_FILE):
+        self.path = path
+        self.modes: Dict[str, str] = {}
+        self.models: Dict[str, Dict[str, int]] = {}
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        if path:
+            self.load()
+
+    def load(self):
+        try:
+            if self.path.exists():
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.modes = data.get('modes', {})
+                self.models = data.get('models', {})
+        except Exception as e:
+            logger.warning(f"Could not load reply stats: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            with self.lock:
+                data = json.dumps({'version': 1, 'modes': self.modes, 'models': self.models}, indent=2)
+            with self.save_lock:  # Concurrent requests share the temp file
+                temp = self.path.with_suffix('.tmp')
+                with open(temp, 'w', encoding='utf-8') as f:
+                    f.write(data)
+                os.replace(temp, self.path)
+        except Exception as e:
+            logger.warning(f"Could not save reply stats: {e}")
+
+    def mode(self, base_url: str, model: str) -> Optional[str]:
+        return self.modes.get(endpoint_key(base_url, model))
+
+    def set_mode(self, base_url: str, model: str, mode: str):
+        with self.lock:
+            self.modes[endpoint_key(base_url, model)] = mode
+        logger.info(f"Using {mode} output for {endpoint_key(base_url, model)}")
+        self.save()
+
+    def counters(self, model: str) -> Dict[str, int]:
+        return self.models.setdefault(model or 'unknown', {})
+
+    def record(self, model: str, outcome: str, retries: int = 0, completion_tokens: int = None,
+               seconds: float = None):
+        """Count one completed request, how its reply parsed and how long it took"""
+        with self.lock:
+            counts = self.counters(model)
+            counts['requests'] = counts.get('requests', 0) + 1
+            counts[outcome] = counts.get(outcome, 0) + 1
+            if retries:
+                counts['retries'] = counts.get('retries', 0) + retries
+            if completion_tokens and seconds:
+                # Sums for a least-squares fit of seconds against completion tokens
+                timing = counts.setdefault('timing', {'n': 0, 'x': 0, 'y': 0.0, 'xx': 0, 'xy': 0.0})
+                timing['n'] += 1
+                timing['x'] += completion_tokens
+                timing['y'] += seconds
+                timing['xx'] += completion_tokens * completion_tokens
+                timing['xy'] += completion_tokens * seconds
+        self.save()
+
+    def latency(self, model: str) -> Optional[Tuple[float, float]]:
+        """(seconds per request, seconds per completion token) observed for a model"""
+        with self.lock:
+            timing = dict(self.models.get(model or 'unknown', {}).get('timing', {}))
+        return fit_latency(timing)
+
+    def record_followup(self, model: str):
+        with self.lock:
+            counts = self.counters(model)
+            counts['followups'] = counts.get('followups', 0) + 1
+        self.save()
+
+    def summary(self) -> Dict[str, Dict]:
+        """Rates per model: failed and cleaned replies, retries and follow-ups per request"""
+        with self.lock:
+            items = [(model, dict(counts)) for model, counts in self.models.items()]
+        result = {}
+        for model, counts in items:
+            requests = counts.get('requests', 0)
+            def rate(name):
+                return counts.get(name, 0) / requests if requests else 0.0
+            result[model] = {
+                'requests': requests,
+                'failure_rate': rate(FAILED),
+                'cleanup_rate': rate(CLEANED),
+                'retry_rate': rate('retries'),
+                'followup_rate': rate('followups')
+            }
+        return result
+
+    def report(self) -> List[str]:
+        """One line per model, most reliable first"""
+        summary = self.summary()
+        lines = []
+        for model, s in sorted(summary.items(), key=lambda item: (item[1]['failure_rate'] + item[1]['retry_rate'],
+                                                                   -item[1]['requests'])):
+            modes = sorted({mode for key, mode in self.modes.items() if key.endswith(f" [{model}]")})
+            lines.append(f"{model}: {s['requests']} requests, {s['failure_rate']:.0%} unparseable, "
+                         f"{s['cleanup_rate']:.0%} needed cleanup, {s['retry_rate']:.2f} retries and "
+                         f"{s['followup_rate']:.2f} follow-ups per request"
+                         + (f" (output: {', '.join(modes)})" if modes else ""))
+        return lines
+
+_reply_stats = None
+_reply_stats_lock = threading.Lock()
+
+def get_reply_stats() -> ReplyStats:
+    """The shared stats, loaded from disk on first use"""
+    global _reply_stats
+    with _reply_stats_lock:
+        if _reply_stats is None:
+            _reply_stats = ReplyStats()
+        return _reply_stats
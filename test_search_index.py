@@ -0,0 +1,21 @@
+import unittest
+
+from search_index import SearchIndex
+
+class SearchIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.entries = ['invoice 2023.pdf', 'photo.jpg', 'docs/inv_2023.txt']
+
+    def test_lone_caret_does_not_narrow_prefix_queries(self):
+        index = SearchIndex(self.entries)
+        self.assertEqual(index.search('^'), [])
+        self.assertEqual(index.search('^inv'), SearchIndex(self.entries).search('^inv'))
+        self.assertEqual(index.search('^inv'), [0, 2])
+
+    def test_typing_narrows_like_a_fresh_search(self):
+        index = SearchIndex(self.entries)
+        for query in ['^', '^i', '^inv', '^invoice 2023', 'inv', 'inv 20', 'inv 2']:
+            self.assertEqual(index.search(query), SearchIndex(self.entries).search(query), query)
+
+if __name__ == '__main__':
+    unittest.main()
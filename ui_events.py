@@ -0,0 +1,144 @@
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+WAKE_EVENT = '<<WorkerMessages>>'
+
+# Only the newest of these matters; older ones are dropped when a burst is drained
+COALESCED = ('progress', 'refined')
+
+def coalesce(messages: List[Tuple]) -> List[Tuple]:
+    """Drop superseded messages from a drained burst, keeping order.
+
+    Only the last message of each COALESCED kind is kept, and a progress
+    snapshot is dropped entirely if anything else came after it (it
+    belongs to an operation that has since finished).
+    """
+    kept = []
+    seen = set()
+    final = False  # A non-coalesced message follows
+    for message in reversed(messages):
+        kind = message[0]
+        if kind in COALESCED:
+            if kind in seen or (kind == 'progress' and final):
+                continue
+            seen.add(kind)
+        else:
+            final = True
+        kept.append(message)
+    kept.reverse()
+    return kept
+
+class MessagePump(queue.Queue):
+    """Worker-to-UI message queue that wakes the Tk event loop instead of being polled.
+
+    put() works from any thread. The first message after a drain posts a
+    virtual event (WAKE_EVENT) to the root window; messages queued before
+    the handler runs ride along, so a burst costs one wake-up. The handler
+    gets the coalesced burst at most once per frame (frame_ms), and
+    nothing runs while no worker is reporting.
+
+    Tcl builds without thread support cannot take events from other
+    threads; there the queue is polled every poll_ms instead.
+    """
+
+    def __init__(self, root, handler: Callable[[List[Tuple]], None], frame_ms: int = 16, poll_ms: int = 100):
+        super().__init__()
+        self.root = root
+        self.handler = handler
+        self.frame_ms = frame_ms
+        self.poll_ms = poll_ms
+        self.wake_lock = threading.Lock()
+        self.wake_pending = False
+        self.flush_job = None
+        self.last_flush = 0.0
+        self.threaded = root.tk.eval('info exists tcl_platform(threaded)') == '1'
+        root.bind(WAKE_EVENT, self.on_wake)
+        if not self.threaded:
+            logger.info("Tcl is not thread-enabled; polling for worker messages")
+            self.root.after(self.poll_ms, self.poll)
+
+    def put(self, item, block=True, timeout=None):
+        super().put(item, block, timeout)
+        with self.wake_lock:
+            if self.wake_pending:
+                return
+            self.wake_pending = True
+        if not self.threaded:
+            return
+        try:
+            if threading.current_thread() is threading.main_thread():
+                self.root.after_idle(self.on_wake)
+            else:
+                self.root.event_generate(WAKE_EVENT, when='tail')
+        except Exception as e:
+            # The window is gone (or going); nobody is left to notify. Let the
+            # next message try again rather than waiting on a wake-up that never comes
+            with self.wake_lock:
+                self.wake_pending = False
+            logger.debug(f"Could not wake UI: {str(e)}")
+
+    def poll(self):
+        if self.wake_pending:
+            self.on_wake()
+        self.root.after(self.poll_ms, self.poll)
+
+    def on_wake(self, event=None):
+        with self.wake_lock:
+            self.wake_pending = False  # Messages from now on need a new wake-up
+        if self.flush_job:
+            return  # Already scheduled for the next frame
+        wait = self.frame_ms - int((time.monotonic() - self.last_flush) * 1000)
+        if wait > 0:
+            self.flush_job = self.root.after(wait, self.flush)
+        else:
+            self.flush()
+
+    def flush(self):
+        self.flush_job = None
+        self.last_flush = time.monotonic()
+        messages = []
+        try:
+            while True:
+                messages.append(self.get_nowait())
+        except queue.Empty:
+            pass
+        if messages:
+            self.handler(coalesce(messages))
+
+def sync_tree(tree, groups: Dict[str, List[Tuple]], nodes: Dict, group_tag: str, item_tag: str) -> None:
+    """Make a two-level Treeview show groups by changing only what differs.
+
+    groups maps each group's text to its rows as (key, text, values),
+    in display order. nodes records what the tree shows, as
+    {group: (node id, {key: (node id, text, values)})}, and is updated
+    in place; pass the same dict on every call for a given tree.
+    """
+    removed = [nodes.pop(group)[0] for group in list(nodes) if group not in groups]
+    for group, rows in groups.items():
+        if group in nodes:
+            children = nodes[group][1]
+            keys = {row[0] for row in rows}
+            for key in [key for key in children if key not in keys]:
+                removed.append(children.pop(key)[0])
+    if removed:
+        tree.delete(*removed)
+
+    for index, (group, rows) in enumerate(groups.items()):
+        if group in nodes:
+            node, children = nodes[group]
+        else:
+            node = tree.insert('', index, text=group, values=('',), tags=(group_tag,), open=True)
+            children = {}
+            nodes[group] = (node, children)
+        for position, (key, text, values) in enumerate(rows):
+            shown = children.get(key)
+            if shown is None:
+                children[key] = (tree.insert(node, position, text=text, values=values, tags=(item_tag,)), text, values)
+            elif shown[1:] != (text, values):
+                tree.item(shown[0], text=text, values=values)
+                children[key] = (shown[0], text, values)